@@ -1,7 +1,157 @@
+import asyncio
 import os
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DB_PATH = 'data/femboybot.db'
+
+# Group commit: commit() calls on the main connection are collected into one transaction, which is
+# committed GROUP_COMMIT_INTERVAL seconds after the first write or after GROUP_COMMIT_MAX_WRITES commits.
+GROUP_COMMIT_INTERVAL = 0.25
+GROUP_COMMIT_MAX_WRITES = 200
+
+
+class GroupCommitConnection(sqlite3.Connection):
+    """SQLite connection where commit() is deferred and grouped with other commits.
+
+    Use commit_now() for writes that must be durable immediately (warnings, moderation records).
+    Outside a running event loop (startup, scripts), commit() commits immediately.
+
+    Trade-off: a deferred commit keeps the write transaction, and with it SQLite's write lock, open for up to
+    GROUP_COMMIT_INTERVAL seconds. Other connections (the database thread, the log archive writer) can't write in
+    that time (they wait for the lock off the event loop), and their reads don't see the uncommitted rows yet. Writes
+    that work on another connection has to see should go through that connection, for example with db_run, or be
+    followed by commit_if_pending(). The commit itself, including its fsync, still runs on the event loop, grouping only
+    makes it happen less often.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_commits = 0
+        self.flush_handle: asyncio.TimerHandle | None = None
+
+    def commit(self):
+        self.pending_commits += 1
+        if self.pending_commits >= GROUP_COMMIT_MAX_WRITES:
+            self.commit_now()
+            return
+
+        if self.flush_handle is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.commit_now()
+            return
+
+        self.flush_handle = loop.call_later(GROUP_COMMIT_INTERVAL, self.commit_now)
+
+    def commit_if_pending(self):
+        """Commit right away if a write transaction is open, so other connections can write and see its rows"""
+        if self.in_transaction:
+            self.commit_now()
+
+    def commit_now(self):
+        """Commit all pending writes right away"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.pending_commits = 0
+        super().commit()
+
 
 if not os.path.exists('data'):
     os.mkdir('data')
 
-conn = sqlite3.connect('data/femboybot.db')
+conn: GroupCommitConnection = sqlite3.connect(DB_PATH, timeout=30, factory=GroupCommitConnection)
+# WAL lets the database thread write while the main thread reads
+conn.execute('PRAGMA journal_mode=WAL')
+
+_db_thread_local = threading.local()
+
+
+def _db_thread_init():
+    # The database thread commits right away, it is off the event loop so waiting for the disk is fine
+    _db_thread_local.conn = sqlite3.connect(DB_PATH, timeout=30)
+
+
+# A single worker, so statements run in submission order and its connection never leaves that thread
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database', initializer=_db_thread_init)
+
+
+def _db_thread_run(func, args):
+    return func(_db_thread_local.conn, *args)
+
+
+async def db_run(func, *args):
+    """Run func(conn, *args) on the database thread without blocking the event loop.
+
+    func gets the database thread's own connection and must not touch database.conn. It doesn't see writes of
+    database.conn that are waiting for their grouped commit.
+
+    Returns:
+        Whatever func returns
+    """
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, _db_thread_run, func, args)
+
+
+def _fetchone(db: sqlite3.Connection, sql: str, params: tuple):
+    return db.execute(sql, params).fetchone()
+
+
+def _fetchall(db: sqlite3.Connection, sql: str, params: tuple):
+    return db.execute(sql, params).fetchall()
+
+
+def _execute(db: sqlite3.Connection, sql: str, params: tuple):
+    cur = db.execute(sql, params)
+    db.commit()
+    return cur.lastrowid
+
+
+def _executemany(db: sqlite3.Connection, sql: str, params: list[tuple]):
+    db.executemany(sql, params)
+    db.commit()
+
+
+async def db_fetchone(sql: str, params: tuple = ()):
+    return await db_run(_fetchone, sql, params)
+
+
+async def db_fetchall(sql: str, params: tuple = ()):
+    return await db_run(_fetchall, sql, params)
+
+
+async def db_execute(sql: str, params: tuple = ()) -> int:
+    """Execute and commit a statement on the database thread
+
+    Returns:
+        int: Last row ID
+    """
+    return await db_run(_execute, sql, params)
+
+
+async def db_executemany(sql: str, params: list[tuple]):
+    await db_run(_executemany, sql, params)
+
+
+_shutdown_hooks = []
+
+
+def on_db_shutdown(func):
+    """Register func() to run on shutdown, before pending writes are committed.
+
+    Use it to write out data that is only buffered in memory. func runs on the main thread and should use conn.
+    """
+    _shutdown_hooks.append(func)
+    return func
+
+
+def db_shutdown():
+    """Run shutdown hooks, commit pending writes, wait for queued database work to finish and close the database thread"""
+    for hook in _shutdown_hooks:
+        hook()
+    conn.commit_now()
+    _db_executor.shutdown(wait=True)
@@ -1,83 +1,171 @@
+import logging
 import time
 
 import discord
+import sentry_sdk
 from discord.ext import commands as commands_ext
+from discord.ext import tasks
 
 from utils.analytics import analytics
 from utils.languages import get_translation_for_key_localized as trl
 from utils.logging_util import log_into_logs
+from utils.message_pipeline import MessageContext, register_message_stage
+from utils.raid_lockdown import RAID_LOCKDOWN_SUMMARY_INTERVAL, RaidLockdown, end_raid_lockdown, \
+    get_raid_lockdown, get_raid_lockdowns, start_raid_lockdown
 from utils.settings import get_setting, set_setting
+from utils.sliding_window import SlidingWindowCounter
 
 
 class ViolationCounters:
-    past_actions = []
+    """Recent actions of members, counted per guild, member and action"""
+
+    def __init__(self) -> None:
+        self.counter = SlidingWindowCounter()
 
     def add_action(self, action: str, user: discord.Member, expires: int):
         if expires < 0:
             raise ValueError('expires must be greater than 0')
 
-        # print("Appending action to past actions")
-        self.past_actions.append({'action': action, 'user': user.id, 'expires': expires + time.time()})
-
-    def filter_expired_actions(self):
-        actions_before = len(self.past_actions)
-        self.past_actions = [action for action in self.past_actions if action['expires'] > time.time()]
-        # print(f"Filtered {actions_before - len(self.past_actions)} expired actions")
+        self.counter.add((user.guild.id, user.id, action), expires)
 
     def count_actions(self, action: str, user: discord.Member):
-        self.filter_expired_actions()
-        actions = len([a for a in self.past_actions if a['action'] == action and a['user'] == user.id])
-        # print(f"Counted {actions} actions")
-        return actions
+        return self.counter.count((user.guild.id, user.id, action))
+
+
+# Kicks per guild per second during a raid lockdown, so the kick route stays under Discord's rate limit
+RAID_KICKS_PER_SECOND = 5
 
 
 class AntiRaid(discord.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         super().__init__()
         self.bot = bot
-        self.join_violation_counters = ViolationCounters()
+        self.join_counter = SlidingWindowCounter()  # Joins per guild, to detect raids
         self.message_violation_counters = ViolationCounters()
         self.message_send_violation_counters = ViolationCounters()  # This one will be to avoid spamming messages
 
+        # guild_id -> when admins were last told a lockdown couldn't start because of the kick permission
+        self.missing_kick_warnings: dict[int, float] = {}
+
+        # Spam is deleted and the pipeline stopped before other features see the message
+        register_message_stage("antiraid", self.on_pipeline_message, priority=0)
+
+        self.raid_lockdown_worker.start()
+
     @discord.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        self.join_violation_counters.filter_expired_actions()
+        lockdown = get_raid_lockdown(member.guild.id)
+        if lockdown is not None and lockdown.is_active():
+            lockdown.add_join(member)
+            return
 
         antiraid_join_threshold = get_setting(member.guild.id, "antiraid_join_threshold", "5")
         antiraid_join_threshold_per = get_setting(member.guild.id, "antiraid_join_threshold_per", "60")
 
-        if self.join_violation_counters.count_actions('join', member) > int(antiraid_join_threshold):
-            if not member.guild.me.guild_permissions.kick_members:
-                return  # TODO: Send a warning if possible
+        self.join_counter.add(member.guild.id, int(antiraid_join_threshold_per))
+        if self.join_counter.count(member.guild.id) <= int(antiraid_join_threshold):
+            return
 
-            if member.can_send():
-                await member.send(
-                    content=trl(member.id, member.guild.id, "antiraid_kicked_message"))
-            await member.kick(reason=trl(0, member.guild.id, "antiraid_kicked_audit"))
+        if not member.guild.me.guild_permissions.kick_members:
+            await self.warn_missing_kick_permission(member.guild)
             return
 
-        self.join_violation_counters.add_action('join', member, int(antiraid_join_threshold_per))
+        # Join rate is above the threshold, joiners are kicked by raid_lockdown_worker until the raid is over
+        lockdown = start_raid_lockdown(member.guild.id)
+        lockdown.add_join(member)
 
-    antiraid_subcommand = discord.SlashCommandGroup(name='antiraid', description='Manage the antiraid settings')
+        embed = discord.Embed(title=trl(0, member.guild.id, "antiraid_lockdown_started_title"),
+                              description=trl(0, member.guild.id, "antiraid_lockdown_started_description"),
+                              color=discord.Color.red())
+        await log_into_logs(member.guild, embed)
 
-    @discord.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
+    async def warn_missing_kick_permission(self, guild: discord.Guild):
+        """Tell the admins a raid lockdown can't start, at most once per summary interval"""
+        last_warning = self.missing_kick_warnings.get(guild.id)
+        if last_warning is not None and time.monotonic() - last_warning < RAID_LOCKDOWN_SUMMARY_INTERVAL:
             return
 
-        if message.author.guild_permissions.manage_messages:
+        self.missing_kick_warnings[guild.id] = time.monotonic()
+        embed = discord.Embed(title=trl(0, guild.id, "antiraid_lockdown_no_permission_title"),
+                              description=trl(0, guild.id, "antiraid_lockdown_no_permission_description"),
+                              color=discord.Color.orange())
+        await log_into_logs(guild, embed)
+
+    async def kick_raid_joiners(self, guild: discord.Guild, lockdown: RaidLockdown):
+        if not guild.me.guild_permissions.kick_members:
+            lockdown.kick_queue.clear()
             return
 
-        self.message_violation_counters.filter_expired_actions()
+        reason = trl(0, guild.id, "antiraid_kicked_audit")
+        for _ in range(min(RAID_KICKS_PER_SECOND, len(lockdown.kick_queue))):
+            member = lockdown.kick_queue.popleft()
+            try:
+                if member.can_send():
+                    try:
+                        await member.send(content=trl(member.id, guild.id, "antiraid_kicked_message"))
+                    except discord.HTTPException:
+                        pass  # DMs closed, kick anyway
+
+                await member.kick(reason=reason)
+                lockdown.add_kick()
+            except discord.NotFound:
+                pass  # Already left
+            except discord.HTTPException as e:
+                logging.warning("Couldn't kick raid joiner %s from %s: %s", member.id, guild.id, e)
+
+    async def send_raid_lockdown_summary(self, guild: discord.Guild, lockdown: RaidLockdown, ended: bool):
+        joins, kicks = lockdown.take_summary()
+        if ended:
+            embed = discord.Embed(title=trl(0, guild.id, "antiraid_lockdown_ended_title"),
+                                  description=trl(0, guild.id, "antiraid_lockdown_summary_description").format(
+                                      joins=lockdown.total_joins, kicks=lockdown.total_kicks),
+                                  color=discord.Color.green())
+        else:
+            embed = discord.Embed(title=trl(0, guild.id, "antiraid_lockdown_summary_title"),
+                                  description=trl(0, guild.id, "antiraid_lockdown_summary_description").format(
+                                      joins=joins, kicks=kicks),
+                                  color=discord.Color.red())
+        await log_into_logs(guild, embed)
+
+    @tasks.loop(seconds=1)
+    async def raid_lockdown_worker(self):
+        for guild_id, lockdown in get_raid_lockdowns():
+            try:
+                guild = self.bot.get_guild(guild_id)
+                if guild is None:
+                    end_raid_lockdown(guild_id)
+                    continue
+
+                if lockdown.kick_queue:
+                    await self.kick_raid_joiners(guild, lockdown)
+
+                if not lockdown.is_active() and not lockdown.kick_queue:
+                    end_raid_lockdown(guild_id)
+                    await self.send_raid_lockdown_summary(guild, lockdown, ended=True)
+                elif time.monotonic() - lockdown.last_summary >= RAID_LOCKDOWN_SUMMARY_INTERVAL:
+                    await self.send_raid_lockdown_summary(guild, lockdown, ended=False)
+            except Exception as e:
+                logging.exception("Raid lockdown worker failed for guild %s", guild_id)
+                sentry_sdk.capture_exception(e)
 
-        antiraid_message_threshold = get_setting(message.guild.id, "antiraid_message_threshold", "5")
-        antiraid_message_threshold_per = get_setting(message.guild.id, "antiraid_message_threshold_per", "5")
+    antiraid_subcommand = discord.SlashCommandGroup(name='antiraid', description='Manage the antiraid settings')
+
+    async def on_pipeline_message(self, ctx: MessageContext):
+        message = ctx.message
+
+        if ctx.author_is_moderator:
+            return
+
+        antiraid_message_threshold = ctx.get_setting("antiraid_message_threshold", "5")
+        antiraid_message_threshold_per = ctx.get_setting("antiraid_message_threshold_per", "5")
 
         if self.message_violation_counters.count_actions('message', message.author) > int(antiraid_message_threshold):
             if not message.guild.me.guild_permissions.manage_messages:
                 return
 
             await message.delete()
+            ctx.stopped = True  # The other features shouldn't handle a deleted message
+
             if self.message_send_violation_counters.count_actions('message_send', message.author) == 0:
                 await message.channel.send(trl(message.author.id, message.guild.id, "antiraid_dontspam_message").format(
                     user_id=message.author.id), delete_after=5)
@@ -112,7 +200,7 @@ class AntiRaid(discord.Cog):
                                 value=f"{ctx.user.mention}", inline=False)
 
         # Send log into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response to user
         await ctx.respond(
@@ -145,7 +233,7 @@ class AntiRaid(discord.Cog):
                                 value=f"{ctx.user.mention}", inline=False)
 
         # Send log into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response to user
         await ctx.respond(
@@ -168,3 +256,19 @@ class AntiRaid(discord.Cog):
                             joins=join_threshold, seconds=join_threshold_per), inline=True)
 
         await ctx.respond(embed=embed, ephemeral=True)
+
+    @antiraid_subcommand.command(name="end_lockdown", description="End the raid lockdown of the server")
+    @discord.default_permissions(manage_guild=True)
+    @commands_ext.has_permissions(manage_guild=True)
+    @commands_ext.guild_only()
+    @analytics("antiraid end lockdown")
+    async def end_lockdown(self, ctx: discord.ApplicationContext):
+        lockdown = get_raid_lockdown(ctx.guild.id)
+        if lockdown is None or not lockdown.is_active():
+            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "antiraid_lockdown_not_active"), ephemeral=True)
+            return
+
+        # The worker sends the end summary to the logs
+        lockdown.stop()
+
+        await ctx.respond(trl(ctx.user.id, ctx.guild.id, "antiraid_lockdown_ended"), ephemeral=True)
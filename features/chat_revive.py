@@ -4,10 +4,12 @@ import discord
 from discord.ext import commands as commands_ext
 from discord.ext import tasks
 
-from database import conn as db
+from database import conn as db, db_execute
 from utils.analytics import analytics
+from utils.channel_features import add_channel_feature, remove_channel_feature, set_feature_channels
 from utils.languages import get_translation_for_key_localized as trl
 from utils.logging_util import log_into_logs
+from utils.message_pipeline import MessageContext, register_message_stage
 
 
 class ChatRevive(discord.Cog):
@@ -17,23 +19,24 @@ class ChatRevive(discord.Cog):
         cur = db.cursor()
         cur.execute(
             "CREATE TABLE IF NOT EXISTS chat_revive (guild_id INTEGER, channel_id INTEGER, role_id INTEGER, revival_time INTEGER, last_message DATETIME, revived BOOLEAN)")
+        cur.execute("SELECT channel_id FROM chat_revive")
+        set_feature_channels("chat_revive", [i[0] for i in cur.fetchall()])
         cur.close()
         db.commit()
 
+        register_message_stage("chat_revive", self.on_pipeline_message)
+
     @discord.Cog.listener()
     async def on_ready(self):
         self.revive_channels.start()
 
-    @discord.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
+    async def on_pipeline_message(self, ctx: MessageContext):
+        if "chat_revive" not in ctx.channel_features:
             return
 
-        cur = db.cursor()
-        cur.execute('UPDATE chat_revive SET last_message = ?, revived = ? WHERE guild_id = ? AND channel_id = ?',
-                    (time.time(), False, message.guild.id, message.channel.id))
-        cur.close()
-        db.commit()
+        message = ctx.message
+        await db_execute('UPDATE chat_revive SET last_message = ?, revived = ? WHERE guild_id = ? AND channel_id = ?',
+                         (time.time(), False, message.guild.id, message.channel.id))
 
     @tasks.loop(minutes=1)
     async def revive_channels(self):
@@ -97,6 +100,8 @@ class ChatRevive(discord.Cog):
         cur.close()
         db.commit()
 
+        add_channel_feature(channel.id, "chat_revive")
+
         # Embed for logs
         logging_embed = discord.Embed(title=trl(ctx.user.id, ctx.guild.id, "chat_revive_log_set_title"))
         logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "logging_channel"),
@@ -110,7 +115,7 @@ class ChatRevive(discord.Cog):
                                     time=str(revival_minutes)), inline=True)
 
         # Send to logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send back response
         await ctx.respond(
@@ -133,6 +138,8 @@ class ChatRevive(discord.Cog):
         cur.close()
         db.commit()
 
+        remove_channel_feature(channel.id, "chat_revive")
+
         # Create embed
         logging_embed = discord.Embed(title=trl(ctx.user.id, ctx.guild.id, "chat_revive_remove_log_title"))
         logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "logging_channel"),
@@ -141,7 +148,7 @@ class ChatRevive(discord.Cog):
                                 value=f"{ctx.user.mention}", inline=True)
 
         # Send to logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_revive_remove_success").format(channel=channel.mention),
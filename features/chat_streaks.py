@@ -1,16 +1,30 @@
+import bisect
 import datetime
+from collections import OrderedDict
 
 import discord
 from discord.ext import commands as commands_ext
 
-from database import conn as db
+from database import conn as db, db_run, db_fetchall
 from utils.analytics import analytics
 from utils.languages import get_translation_for_key_localized as trl, get_language
 from utils.logging_util import log_into_logs
+from utils.message_pipeline import MessageContext, register_message_stage
 from utils.per_user_settings import get_per_user_setting
 from utils.tips import append_tip_to_message
 from utils.tzutil import get_server_midnight_time
 
+# Members whose last streak day is kept in memory, the least recently active are forgotten first
+STREAK_CACHE_MAX_MEMBERS = 100000
+
+STREAK_LEADERBOARD_PAGE_SIZE = 10
+
+# Leaderboard pages kept in memory per guild, later pages are read from the database on every request
+STREAK_LEADERBOARD_CACHED_PAGES = 5
+
+# Guilds whose leaderboard is kept in memory
+STREAK_LEADERBOARD_CACHE_MAX_GUILDS = 1000
+
 
 class ChatStreakStorage:
     """Chat Streaks Storage.
@@ -30,12 +44,37 @@ class ChatStreakStorage:
         for row in invalid_rows:
             cur.execute("DELETE FROM chat_streaks WHERE guild_id = ? AND member_id = ?", (row[0], row[1]))
 
+        # Streak length in days, kept next to the times so the leaderboard can be read from an index
+        cur.execute("PRAGMA table_info(chat_streaks)")
+        if 'streak_days' not in [column[1] for column in cur.fetchall()]:
+            cur.execute('ALTER TABLE chat_streaks ADD COLUMN streak_days INTEGER')
+            cur.execute('UPDATE chat_streaks SET streak_days = MAX(CAST(julianday(last_message) - julianday(start_time) AS INTEGER), 0)')
+        cur.execute(
+            'CREATE INDEX IF NOT EXISTS chat_streaks_leaderboard ON chat_streaks (guild_id, streak_days DESC, member_id)')
+
         cur.close()
         db.commit()
 
-    def set_streak(self, guild_id: int, member_id: int) -> tuple[str, int, int]:
+        # (guild_id, member_id) -> (last_message, start_time) as stored in the database
+        self._recorded_days: OrderedDict[tuple[int, int], tuple[datetime.datetime, datetime.datetime]] = OrderedDict()
+
+        # guild_id -> (members with a streak, first STREAK_LEADERBOARD_CACHED_PAGES pages of (member_id, streak_days))
+        self._leaderboards: OrderedDict[int, tuple[int, list[tuple[int, int]]]] = OrderedDict()
+
+    def _remember_day(self, guild_id: int, member_id: int, last_message: datetime.datetime,
+                      start_time: datetime.datetime):
+        key = (guild_id, member_id)
+        self._recorded_days[key] = (last_message, start_time)
+        self._recorded_days.move_to_end(key)
+        if len(self._recorded_days) > STREAK_CACHE_MAX_MEMBERS:
+            self._recorded_days.popitem(last=False)
+
+    async def set_streak(self, guild_id: int, member_id: int) -> tuple[str, int, int]:
         """Set streak
 
+        The streak only changes once per server day, so the database is only used for the first message of a member
+        on each day.
+
         Args:
             guild_id (int): Guild ID
             member_id (int): Member ID
@@ -44,49 +83,107 @@ class ChatStreakStorage:
             str: The state of the streak
         """
 
-        cur = db.cursor()
+        midnight = get_server_midnight_time(guild_id)
 
-        # Check and start if not existant
-        cur.execute(
-            'SELECT * FROM chat_streaks WHERE guild_id = ? AND member_id = ?', (guild_id, member_id))
-        if cur.fetchone() is None:
-            start_time = get_server_midnight_time(guild_id)
-            cur.execute('INSERT INTO chat_streaks (guild_id, member_id, last_message, start_time) VALUES (?, ?, ?, ?)',
-                        (guild_id, member_id, start_time, start_time))
-            cur.close()
-            db.commit()
-            return "started", 0, 0
+        recorded = self._recorded_days.get((guild_id, member_id))
+        if recorded is not None and recorded[0] == midnight:
+            self._recorded_days.move_to_end((guild_id, member_id))
+            return "stayed", (midnight - recorded[1]).days, 0
+
+        state, start_time, old_streak, new_streak = await db_run(self.db_set_streak, guild_id, member_id, midnight)
+        self._remember_day(guild_id, member_id, midnight, start_time)
+        if state != "stayed":
+            self._move_on_leaderboard(guild_id, member_id, max(new_streak, 0), state == "started")
+        return state, old_streak, new_streak
+
+    def _move_on_leaderboard(self, guild_id: int, member_id: int, streak_days: int, added: bool):
+        """Update the cached leaderboard of a guild after a streak changed
+
+        The cache is only dropped when the member leaves the cached pages, because the member after them isn't known.
+
+        Args:
+            guild_id (int): Guild ID
+            member_id (int): Member ID
+            streak_days (int): New streak days of the member
+            added (bool): Whether the member didn't have a streak before
+        """
+        cached = self._leaderboards.get(guild_id)
+        if cached is None:
+            return
+
+        count, old_rows = cached
+        complete = len(old_rows) == count  # Every member fits in the cached pages
+        rows = [row for row in old_rows if row[0] != member_id]
+        was_listed = len(rows) != len(old_rows)
+
+        position = bisect.bisect_left([(-row[1], row[0]) for row in rows], (-streak_days, member_id))
+        if position == len(rows) and not complete:
+            if was_listed:
+                self._leaderboards.pop(guild_id)
+                return
+            rows = old_rows  # Still ranked after the cached pages
+        else:
+            rows.insert(position, (member_id, streak_days))
+            del rows[STREAK_LEADERBOARD_CACHED_PAGES * STREAK_LEADERBOARD_PAGE_SIZE:]
+
+        self._leaderboards[guild_id] = (count + 1 if added else count, rows)
+
+    @staticmethod
+    def db_set_streak(conn, guild_id: int, member_id: int,
+                      midnight: datetime.datetime) -> tuple[str, datetime.datetime, int, int]:
+        """Database part of set_streak, runs on the database thread
+
+        Args:
+            conn: Database thread connection
+            guild_id (int): Guild ID
+            member_id (int): Member ID
+            midnight (datetime): Server midnight time
 
+        Returns:
+            tuple: The state of the streak, the start time of the current streak and the old and new streak days
+        """
+
+        cur = conn.cursor()
+
+        # Check and start if not existant
         cur.execute('SELECT last_message, start_time FROM chat_streaks WHERE guild_id = ? AND member_id = ?',
                     (guild_id, member_id))
         result = cur.fetchone()
+        if result is None:
+            cur.execute('INSERT INTO chat_streaks (guild_id, member_id, last_message, start_time, streak_days) '
+                        'VALUES (?, ?, ?, ?, 0)', (guild_id, member_id, midnight, midnight))
+            cur.close()
+            conn.commit()
+            return "started", midnight, 0, 0
+
         last_message = datetime.datetime.fromisoformat(result[0])
         start_time = datetime.datetime.fromisoformat(result[1])
 
         # Check for streak expiry
-        if get_server_midnight_time(guild_id) - last_message > datetime.timedelta(days=1, hours=1):
+        if midnight - last_message > datetime.timedelta(days=1, hours=1):
             streak = max((last_message - start_time).days, 0)
             cur.execute(
-                'UPDATE chat_streaks SET last_message = ?, start_time = ? WHERE guild_id = ? AND member_id = ?',
-                (get_server_midnight_time(guild_id), get_server_midnight_time(guild_id), guild_id, member_id))
+                'UPDATE chat_streaks SET last_message = ?, start_time = ?, streak_days = 0 WHERE guild_id = ? AND member_id = ?',
+                (midnight, midnight, guild_id, member_id))
             cur.close()
-            db.commit()
-            return "expired", streak, 0
+            conn.commit()
+            return "expired", midnight, streak, 0
 
         before_update = (last_message - start_time).days
-        cur.execute('UPDATE chat_streaks SET last_message = ? WHERE guild_id = ? AND member_id = ?',
-                    (get_server_midnight_time(guild_id), guild_id, member_id))
-        after_update = (get_server_midnight_time(guild_id) - start_time).days
+        after_update = (midnight - start_time).days
+        if last_message != midnight:
+            cur.execute('UPDATE chat_streaks SET last_message = ?, streak_days = ? WHERE guild_id = ? AND member_id = ?',
+                        (midnight, max(after_update, 0), guild_id, member_id))
+            conn.commit()
 
         cur.close()
-        db.commit()
 
         if before_update != after_update:
-            return "updated", before_update, after_update
+            return "updated", start_time, before_update, after_update
 
-        return "stayed", after_update, 0
+        return "stayed", start_time, after_update, 0
 
-    def reset_streak(self, guild_id: int, member_id: int) -> None:
+    async def reset_streak(self, guild_id: int, member_id: int) -> None:
         """Reset streak
 
         Args:
@@ -94,21 +191,76 @@ class ChatStreakStorage:
             member_id (int): Member ID
         """
 
-        cur = db.cursor()
+        start_time = get_server_midnight_time(guild_id)
+
+        # On the database thread like set_streak, so the leaderboard read after it sees the reset
+        await db_run(self.db_reset_streak, guild_id, member_id, start_time)
+        self._remember_day(guild_id, member_id, start_time, start_time)
+        self._leaderboards.pop(guild_id, None)
+
+    @staticmethod
+    def db_reset_streak(conn, guild_id: int, member_id: int, start_time: datetime.datetime) -> None:
+        """Database part of reset_streak, runs on the database thread"""
+        cur = conn.cursor()
         cur.execute(
             'SELECT * FROM chat_streaks WHERE guild_id = ? AND member_id = ?', (guild_id, member_id))
         if not cur.fetchone():
-            start_time = get_server_midnight_time(guild_id)
-            cur.execute('INSERT INTO chat_streaks (guild_id, member_id, last_message, start_time) VALUES (?, ?, ?, ?)',
-                        (guild_id, member_id, start_time, start_time))
+            cur.execute('INSERT INTO chat_streaks (guild_id, member_id, last_message, start_time, streak_days) '
+                        'VALUES (?, ?, ?, ?, 0)', (guild_id, member_id, start_time, start_time))
             cur.close()
-            db.commit()
+            conn.commit()
             return
 
-        cur.execute('UPDATE chat_streaks SET last_message = ?, start_time = ? WHERE guild_id = ? AND member_id = ?',
-                    (get_server_midnight_time(guild_id), get_server_midnight_time(guild_id), guild_id, member_id))
+        cur.execute('UPDATE chat_streaks SET last_message = ?, start_time = ?, streak_days = 0 WHERE guild_id = ? AND member_id = ?',
+                    (start_time, start_time, guild_id, member_id))
         cur.close()
-        db.commit()
+        conn.commit()
+
+    async def get_leaderboard(self, guild_id: int, page: int) -> tuple[int, list[tuple[int, int]]]:
+        """Get a page of the streak leaderboard, the first pages are cached and updated when streaks change
+
+        Args:
+            guild_id (int): Guild ID
+            page (int): Page number, starting at 0
+
+        Returns:
+            tuple: The number of members with a streak and the (member_id, streak_days) rows of the page
+        """
+        start = page * STREAK_LEADERBOARD_PAGE_SIZE
+        cached_rows = STREAK_LEADERBOARD_CACHED_PAGES * STREAK_LEADERBOARD_PAGE_SIZE
+
+        cached = self._leaderboards.get(guild_id)
+        if cached is None:
+            count, rows = await db_run(self.db_get_leaderboard, guild_id, 0, cached_rows)
+            cached = self._leaderboards[guild_id] = (count, rows)
+            if len(self._leaderboards) > STREAK_LEADERBOARD_CACHE_MAX_GUILDS:
+                self._leaderboards.popitem(last=False)
+        self._leaderboards.move_to_end(guild_id)
+
+        count, rows = cached
+        if start < cached_rows:
+            return count, rows[start:start + STREAK_LEADERBOARD_PAGE_SIZE]
+
+        rows = await db_fetchall('SELECT member_id, streak_days FROM chat_streaks WHERE guild_id = ? '
+                                 'ORDER BY streak_days DESC, member_id LIMIT ? OFFSET ?',
+                                 (guild_id, STREAK_LEADERBOARD_PAGE_SIZE, start))
+        return count, rows
+
+    @staticmethod
+    def db_get_leaderboard(conn, guild_id: int, start: int, limit: int) -> tuple[int, list[tuple[int, int]]]:
+        """Database part of get_leaderboard, runs on the database thread
+
+        Returns:
+            tuple: The number of members with a streak and up to limit (member_id, streak_days) rows
+        """
+        cur = conn.cursor()
+        cur.execute('SELECT COUNT(*) FROM chat_streaks WHERE guild_id = ?', (guild_id,))
+        count = cur.fetchone()[0]
+        cur.execute('SELECT member_id, streak_days FROM chat_streaks WHERE guild_id = ? '
+                    'ORDER BY streak_days DESC, member_id LIMIT ? OFFSET ?', (guild_id, limit, start))
+        rows = cur.fetchall()
+        cur.close()
+        return count, rows
 
 
 class ChatStreaks(discord.Cog):
@@ -117,12 +269,12 @@ class ChatStreaks(discord.Cog):
         self.bot = bot
         self.streak_storage = ChatStreakStorage()
 
-    @discord.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
+        register_message_stage("chat_streaks", self.on_pipeline_message)
+
+    async def on_pipeline_message(self, ctx: MessageContext):
+        message = ctx.message
 
-        (state, old_streak, new_streak) = self.streak_storage.set_streak(
+        (state, old_streak, new_streak) = await self.streak_storage.set_streak(
             message.guild.id, message.author.id)
 
         if state == "expired":
@@ -152,7 +304,7 @@ class ChatStreaks(discord.Cog):
     @analytics("streaks reset")
     async def reset_streak_command(self, ctx: discord.ApplicationContext, user: discord.Member):
         # Reset streak
-        self.streak_storage.reset_streak(ctx.guild.id, user.id)
+        await self.streak_storage.reset_streak(ctx.guild.id, user.id)
 
         # Create a embed for logs
         logging_embed = discord.Embed(title=trl(ctx.user.id, ctx.guild.id, "chat_streaks_reset_log_title"))
@@ -162,7 +314,7 @@ class ChatStreaks(discord.Cog):
                                 value=f'{user.mention}')
 
         # Send to log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user, user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_streaks_reset_success", append_tip=True).format(user=user.mention),
@@ -175,7 +327,7 @@ class ChatStreaks(discord.Cog):
     @discord.option(name='user', description='The user to get the streak for', type=discord.Member)
     @analytics("streaks streak")
     async def get_user_streak(self, ctx: discord.ApplicationContext, user: discord.Member):
-        (_, streak, _) = self.streak_storage.set_streak(ctx.guild.id, user.id)
+        (_, streak, _) = await self.streak_storage.set_streak(ctx.guild.id, user.id)
         await ctx.respond(
             trl(ctx.user.id, ctx.guild.id, "chat_streaks_streak_admin", append_tip=True).format(user=user.mention, streak=str(streak)),
             ephemeral=True)
@@ -183,25 +335,24 @@ class ChatStreaks(discord.Cog):
     @discord.slash_command(name='streak', description='Get your current streak')
     @analytics("streak")
     async def get_streak_command(self, ctx: discord.ApplicationContext):
-        (_, streak, _) = self.streak_storage.set_streak(ctx.guild.id, ctx.user.id)
+        (_, streak, _) = await self.streak_storage.set_streak(ctx.guild.id, ctx.user.id)
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_streaks_streak", append_tip=True).format(streak=streak), ephemeral=True)
 
     # Leaderboard
 
     @streaks_subcommand.command(name="leaderboard", description="Get the chat streak leaderboard")
     @commands_ext.guild_only()
+    @discord.option(name="page", description="The page of the leaderboard", type=int, min_value=1, default=1)
     @analytics("streaks leaderboard")
-    async def streaks_lb(self, ctx: discord.ApplicationContext):
-        cur = db.cursor()
-        cur.execute(
-            'SELECT member_id, MAX(julianday(last_message) - julianday(start_time)) '
-            'FROM chat_streaks '
-            'WHERE guild_id = ? '
-            'GROUP BY member_id '
-            'ORDER BY MAX(julianday(last_message) - julianday(start_time)) DESC LIMIT 10',
-            (ctx.guild.id,))
-        rows = cur.fetchall()
-        cur.close()
+    async def streaks_lb(self, ctx: discord.ApplicationContext, page: int = 1):
+        count, _ = await self.streak_storage.get_leaderboard(ctx.guild.id, 0)
+        if count == 0:
+            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_streak_leaderboard_empty"), ephemeral=True)
+            return
+
+        pages = (count + STREAK_LEADERBOARD_PAGE_SIZE - 1) // STREAK_LEADERBOARD_PAGE_SIZE
+        page = min(page, pages)
+        _, rows = await self.streak_storage.get_leaderboard(ctx.guild.id, page - 1)
 
         message = trl(ctx.user.id, ctx.guild.id, "chat_streak_leaderboard_title")
 
@@ -210,11 +361,10 @@ class ChatStreaks(discord.Cog):
             if member is None:
                 continue
 
-            days = int(row[1])
+            message += trl(ctx.user.id, ctx.guild.id, "chat_streak_leaderboard_line").format(
+                position=(page - 1) * STREAK_LEADERBOARD_PAGE_SIZE + i + 1, user=member.mention, days=str(row[1]))
 
-            message += trl(ctx.user.id, ctx.guild.id, "chat_streak_leaderboard_line").format(position=i + 1,
-                                                                                             user=member.mention,
-                                                                                             days=str(days))
+        message += trl(ctx.user.id, ctx.guild.id, "chat_streak_leaderboard_page").format(page=page, pages=pages)
 
         if get_per_user_setting(ctx.user.id, 'tips_enabled', 'true') == 'true':
             language = get_language(ctx.guild.id, ctx.user.id)
@@ -1,81 +1,106 @@
 import datetime
+from array import array
 
 import discord
 import sentry_sdk
 from discord.ext import commands as commands_ext
 from discord.ext import tasks
 
-from database import conn as db
+from database import conn as db, db_run, on_db_shutdown
 from utils.analytics import analytics
+from utils.channel_features import add_channel_feature, has_channel_feature, remove_channel_feature, \
+    set_feature_channels
 from utils.languages import get_translation_for_key_localized as trl
 from utils.logging_util import log_into_logs
-from utils.settings import get_setting, set_setting
-from utils.tzutil import get_now_for_server
+from utils.message_pipeline import MessageContext, register_message_stage
+from utils.midnight_scheduler import MidnightScheduler, server_time
+from utils.settings import db_get_key_for_all_guilds, get_setting, set_setting, watch_setting
+from utils.summary_counters import SummaryCounters, db_create_tables, db_get_report, db_load_counter, \
+    db_load_enabled_counters, db_rollup_counts, db_write_counts
+
+
+# Seconds between writes of the message counters to the database
+SUMMARY_FLUSH_INTERVAL = 30
+
+REPORT_PERIODS = {"week": 7, "month": 30}
+
+HEATMAP_BLOCKS = " ▁▂▃▄▅▆▇█"
+
+
+# Enabled channels grouped by the timezone of their guild, summaries are sent at midnight there
+_scheduler = MidnightScheduler()
+
+_counts = SummaryCounters()
+
+
+def reschedule_guild(guild_id: int, offset: str):
+    """Move the chat summary channels of a guild to its new timezone"""
+    for channel_id, counter in _counts.counters.items():
+        if counter.guild_id == guild_id:
+            _scheduler.add(channel_id, float(offset))
+
+
+def count_message(channel_id: int, member_id: int):
+    """Count a message in the hour of the channel's timezone, on the clock its summaries are scheduled with"""
+    now = _scheduler.now_for(channel_id)
+    if now is not None:
+        _counts.count_message(channel_id, member_id, now.hour)
+
+
+def db_write_pending_counts():
+    """Write the counts that weren't flushed yet, called when the database shuts down"""
+    _, channel_rows, member_rows = _counts.take_pending_counts()
+    db_write_counts(db, channel_rows, member_rows)
+
+
+def format_heatmap(hours: array) -> str:
+    """Draw an hour histogram as one block character per hour"""
+    peak = max(hours)
+    if peak == 0:
+        return HEATMAP_BLOCKS[0] * len(hours)
+    return ''.join(HEATMAP_BLOCKS[-(-count * (len(HEATMAP_BLOCKS) - 1) // peak)] for count in hours)
 
 
 class ChatSummary(discord.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         super().__init__()
 
-        cur = db.cursor()
-        cur.execute("PRAGMA table_info(chat_summary)")
-        # Check if the format is correct, there should be 4 columns of info, if not, delete and recreate table.
-
-        # Set up new tables
-        cur.execute(
-            'CREATE TABLE IF NOT EXISTS chat_summary(guild_id INTEGER, channel_id INTEGER, enabled INTEGER, messages INTEGER)')
-        cur.execute(
-            'CREATE INDEX IF NOT EXISTS chat_summary_i ON chat_summary(guild_id, channel_id)')
-
-        # Create the rest of tables
-        cur.execute(
-            'CREATE TABLE IF NOT EXISTS chat_summary_members(guild_id INTEGER, channel_id INTEGER, member_id INTEGER, messages INTEGER)')
-        cur.execute(
-            'CREATE INDEX IF NOT EXISTS chat_summary_members_i ON chat_summary_members(guild_id, channel_id, member_id)')
-        cur.close()
+        db_create_tables(db)
 
-        # Save
-        db.commit()
+        # Load the counts since the last summary of every enabled channel
+        _counts.counters = db_load_enabled_counters(db)
+
+        set_feature_channels("chat_summary", _counts.counters.keys())
         self.bot = bot
 
-    @discord.Cog.listener()
-    async def on_ready(self):
-        self.summarize.start()
+        offsets = db_get_key_for_all_guilds('timezone_offset')
+        for channel_id, counter in _counts.counters.items():
+            _scheduler.add(channel_id, float(offsets.get(counter.guild_id) or 0))
+        watch_setting('timezone_offset', reschedule_guild)
 
-    @discord.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.guild is None:
-            return
+        on_db_shutdown(db_write_pending_counts)
+        register_message_stage("chat_summary", self.on_pipeline_message)
+        self.flush_counts.start()
 
-        if message.author.bot:
+    @discord.Cog.listener()
+    async def on_ready(self):
+        if not self.summarize.is_running():
+            self.summarize.start()
+
+    @tasks.loop(seconds=SUMMARY_FLUSH_INTERVAL)
+    async def flush_counts(self):
+        taken_from, channel_rows, member_rows = _counts.take_pending_counts()
+        try:
+            await db_run(db_write_counts, channel_rows, member_rows)
+        except Exception as e:
+            _counts.restore_pending_counts(taken_from, channel_rows, member_rows)
+            sentry_sdk.capture_exception(e)
+
+    async def on_pipeline_message(self, ctx: MessageContext):
+        if "chat_summary" not in ctx.channel_features:
             return
 
-        cur = db.cursor()
-        cur.execute('SELECT * FROM chat_summary WHERE guild_id = ? AND channel_id = ?',
-                    (message.guild.id, message.channel.id))
-        if not cur.fetchone():
-            cur.execute(
-                'INSERT INTO chat_summary(guild_id, channel_id, enabled, messages) VALUES (?, ?, ?, ?)',
-                (message.guild.id, message.channel.id, 0, 0))
-
-        # Increment total message count
-        cur.execute('UPDATE chat_summary SET messages = messages + 1 WHERE guild_id = ? AND channel_id = ?',
-                    (message.guild.id, message.channel.id))
-
-        # Increment message count for specific member
-        cur.execute('SELECT * FROM chat_summary_members WHERE guild_id = ? AND channel_id = ? AND member_id = ?',
-                    (message.guild.id, message.channel.id, message.author.id))
-        if not cur.fetchone():
-            cur.execute(
-                'INSERT INTO chat_summary_members(guild_id, channel_id, member_id, messages) VALUES (?, ?, ?, ?)',
-                (message.guild.id, message.channel.id, message.author.id, 0))
-
-        cur.execute(
-            'UPDATE chat_summary_members SET messages = messages + 1 WHERE guild_id = ? AND channel_id = ? AND member_id = ?',
-            (message.guild.id, message.channel.id, message.author.id))
-
-        cur.close()
-        db.commit()
+        count_message(ctx.message.channel.id, ctx.message.author.id)
 
     @discord.Cog.listener()
     async def on_message_edit(self, old_message: discord.Message, new_message: discord.Message):
@@ -85,119 +110,101 @@ class ChatSummary(discord.Cog):
         if new_message.author.bot:
             return
 
+        if not has_channel_feature(new_message.channel.id, "chat_summary"):
+            return
+
         countedits = get_setting(new_message.guild.id, "chatsummary_countedits", "False")
         if countedits == "False":
             return
 
-        cur = db.cursor()
-        cur.execute('SELECT * FROM chat_summary WHERE guild_id = ? AND channel_id = ?',
-                    (old_message.guild.id, old_message.channel.id))
-        if not cur.fetchone():
-            cur.execute(
-                'INSERT INTO chat_summary(guild_id, channel_id, enabled, messages) VALUES (?, ?, ?, ?)',
-                (old_message.guild.id, old_message.channel.id, 0, 0))
-
-        # Increment total old_message count
-        cur.execute('UPDATE chat_summary SET messages = messages + 1 WHERE guild_id = ? AND channel_id = ?',
-                    (old_message.guild.id, old_message.channel.id))
+        count_message(old_message.channel.id, old_message.author.id)
 
-        # Increment old_message count for specific member
-        cur.execute('SELECT * FROM chat_summary_members WHERE guild_id = ? AND channel_id = ? AND member_id = ?',
-                    (old_message.guild.id, old_message.channel.id, old_message.author.id))
-        if not cur.fetchone():
-            cur.execute(
-                'INSERT INTO chat_summary_members(guild_id, channel_id, member_id, messages) VALUES (?, ?, ?, ?)',
-                (old_message.guild.id, old_message.channel.id, old_message.author.id, 0))
+    @tasks.loop()
+    async def summarize(self):
+        # Sleeps until midnight in one of the timezones, only the channels of guilds in that timezone are summarized
+        for offset, midnight, channel_ids in await _scheduler.wait():
+            yesterday = server_time(midnight, offset) - datetime.timedelta(days=1)
+
+            for channel_id in channel_ids:
+                try:
+                    await self.summarize_channel(channel_id, yesterday)
+                except Exception as e:
+                    sentry_sdk.capture_exception(e)
+
+    async def summarize_channel(self, channel_id: int, yesterday: datetime.datetime):
+        """Send the summary of a channel for the day that just ended and start counting the next one
+
+        Args:
+            channel_id (int): Channel ID
+            yesterday (datetime): Start of the day that ended, in the guild's timezone
+        """
+        counter = _counts.counters.get(channel_id)
+        if counter is None:
+            return  # Removed while an earlier summary was being sent
+
+        guild = self.bot.get_guild(counter.guild_id)
+        if guild is None:
+            return
 
-        cur.execute(
-            'UPDATE chat_summary_members SET messages = messages + 1 WHERE guild_id = ? AND channel_id = ? AND member_id = ?',
-            (old_message.guild.id, old_message.channel.id, old_message.author.id))
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            return
 
-        cur.close()
-        db.commit()
+        if not channel.can_send():
+            return
 
-    @tasks.loop(minutes=1)
-    async def summarize(self):
-        cur = db.cursor()
-        cur.execute('SELECT guild_id, channel_id, messages FROM chat_summary WHERE enabled = 1')
-        for i in cur.fetchall():
-            yesterday = get_now_for_server(i[0])
-
-            if yesterday.hour != 0 or yesterday.minute != 0:
-                continue
-
-            guild = self.bot.get_guild(i[0])
-            if guild is None:
-                continue
-
-            channel = guild.get_channel(i[1])
-            if channel is None:
-                continue
-
-            if not channel.can_send():
-                continue
-
-            yesterday = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1) # Get yesterday
-
-            # Get date format
-            date_format = get_setting(guild.id, "chatsummary_dateformat", "YYYY/MM/DD")
-
-            # Better formatting for day
-            day = str(yesterday.day)
-            if len(day) == 1:
-                day = "0" + day
-
-            # Better formatting for the month
-            month = str(yesterday.month)
-            if len(month) == 1:
-                month = "0" + month
-
-            # Select appropriate date format
-            if date_format == "DD/MM/YYYY":
-                date = f"{day}/{month}/{yesterday.year}"
-            elif date_format == "DD. MM. YYYY":
-                date = f"{day}. {month}. {yesterday.year}"
-            elif date_format == "YYYY/DD/MM":
-                date = f"{yesterday.year}/{day}/{month}"
-            elif date_format == "MM/DD/YYYY":
-                date = f"{month}/{day}/{yesterday.year}"
-            elif date_format == "YYYY年MM月DD日":
-                date = f"{yesterday.year}年{month}月{day}日"
+        # Get date format
+        date_format = get_setting(guild.id, "chatsummary_dateformat", "YYYY/MM/DD")
+
+        # Better formatting for day
+        day = str(yesterday.day)
+        if len(day) == 1:
+            day = "0" + day
+
+        # Better formatting for the month
+        month = str(yesterday.month)
+        if len(month) == 1:
+            month = "0" + month
+
+        # Select appropriate date format
+        if date_format == "DD/MM/YYYY":
+            date = f"{day}/{month}/{yesterday.year}"
+        elif date_format == "DD. MM. YYYY":
+            date = f"{day}. {month}. {yesterday.year}"
+        elif date_format == "YYYY/DD/MM":
+            date = f"{yesterday.year}/{day}/{month}"
+        elif date_format == "MM/DD/YYYY":
+            date = f"{month}/{day}/{yesterday.year}"
+        elif date_format == "YYYY年MM月DD日":
+            date = f"{yesterday.year}年{month}月{day}日"
+        else:
+            date = f"{yesterday.year}/{month}/{day}"
+
+        chat_summary_message = trl(0, guild.id, "chat_summary_title").format(date=date)
+        chat_summary_message += '\n'
+        chat_summary_message += trl(0, guild.id, "chat_summary_messages").format(messages=counter.messages)
+
+        jndex = 0  # idk
+        for j in counter.top_members():
+            jndex += 1
+            member = guild.get_member(j[0])
+            if member is not None:
+                chat_summary_message += trl(0, guild.id, "chat_summary_line").format(position=jndex,
+                                                                                     name=member.display_name,
+                                                                                     messages=j[1])
             else:
-                date = f"{yesterday.year}/{month}/{day}"
+                chat_summary_message += trl(0, guild.id, "chat_summary_line_unknown_user").format(position=jndex,
+                                                                                                  id=j[0],
+                                                                                                  messages=j[1])
 
-            chat_summary_message = trl(0, guild.id, "chat_summary_title").format(date=date)
-            chat_summary_message += '\n'
-            chat_summary_message += trl(0, guild.id, "chat_summary_messages").format(messages=i[2])
+        # Counts are reset before sending, so messages sent while waiting for Discord go to the next summary
+        _counts.start_day(channel_id)
+        await db_run(db_rollup_counts, counter.guild_id, channel_id, yesterday.date().isoformat(), counter)
 
-            cur.execute(
-                'SELECT member_id, messages FROM chat_summary_members WHERE guild_id = ? AND channel_id = ? ORDER BY '
-                'messages DESC LIMIT 5', (i[0], i[1]))
-
-            jndex = 0  # idk
-            for j in cur.fetchall():
-                jndex += 1
-                member = guild.get_member(j[0])
-                if member is not None:
-                    chat_summary_message += trl(0, guild.id, "chat_summary_line").format(position=jndex,
-                                                                                         name=member.display_name,
-                                                                                         messages=j[1])
-                else:
-                    chat_summary_message += trl(0, guild.id, "chat_summary_line_unknown_user").format(position=jndex,
-                                                                                                      id=j[0],
-                                                                                                      messages=j[1])
-
-            try:
-                await channel.send(chat_summary_message)
-            except Exception as e:
-                sentry_sdk.capture_exception(e)
-
-            cur.execute('UPDATE chat_summary SET messages = 0 WHERE guild_id = ? AND channel_id = ?', (i[0], i[1]))
-            cur.execute(
-                'DELETE FROM chat_summary_members WHERE guild_id = ? AND channel_id = ?', (i[0], i[1]))
-
-        cur.close()
-        db.commit()
+        try:
+            await channel.send(chat_summary_message)
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
 
     chat_summary_subcommand = discord.SlashCommandGroup(
         name='chatsummary', description='Chat summary')
@@ -233,13 +240,17 @@ class ChatSummary(discord.Cog):
         cur.close()
         db.commit()
 
+        _counts.counters[channel.id] = await db_run(db_load_counter, ctx.guild.id, channel.id)
+        _scheduler.add(channel.id, float(get_setting(ctx.guild.id, 'timezone_offset', '0')))
+        add_channel_feature(channel.id, "chat_summary")
+
         # Logging embed
         logging_embed = discord.Embed(title=trl(0, ctx.guild.id, "chat_summary_add_log_title"))
         logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_channel"), value=f"{channel.mention}")
         logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_user"), value=f"{ctx.user.mention}")
 
         # Log into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_summary_add_added", append_tip=True), ephemeral=True)
@@ -275,6 +286,10 @@ class ChatSummary(discord.Cog):
         cur.close()
         db.commit()
 
+        remove_channel_feature(channel.id, "chat_summary")
+        _scheduler.remove(channel.id)
+        await db_run(db_write_counts, *_counts.remove_channel(channel.id))
+
         # Logging embed
         logging_embed = discord.Embed(title=trl(ctx.user.id, ctx.guild.id, "chat_summary_remove_log_title"))
         logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "logging_channel"),
@@ -283,11 +298,44 @@ class ChatSummary(discord.Cog):
                                 value=f"{ctx.user.mention}")
 
         # Send
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_summary_remove_removed", append_tip=True), ephemeral=True)
 
+    @chat_summary_subcommand.command(name="report", description="Show the activity of a chat summary channel over a week or month")
+    @commands_ext.guild_only()
+    @discord.option(name="period", description="The days to include", choices=list(REPORT_PERIODS))
+    @analytics("chatsummary report")
+    async def summary_report(self, ctx: discord.ApplicationContext, channel: discord.TextChannel, period: str):
+        days = REPORT_PERIODS[period]
+        now = server_time(_scheduler.clock(), float(get_setting(ctx.guild.id, 'timezone_offset', '0')))
+        since = (now - datetime.timedelta(days=days)).date().isoformat()
+        rollup_days, messages, busiest_day, top_members, hours = await db_run(db_get_report, ctx.guild.id,
+                                                                              channel.id, since)
+        if rollup_days == 0:
+            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_summary_report_empty"), ephemeral=True)
+            return
+
+        message = trl(ctx.user.id, ctx.guild.id, "chat_summary_report_title").format(channel=channel.mention, days=days)
+        message += trl(ctx.user.id, ctx.guild.id, "chat_summary_report_messages").format(
+            messages=messages, average=round(messages / rollup_days, 1))
+        message += trl(ctx.user.id, ctx.guild.id, "chat_summary_report_busiest_day").format(day=busiest_day[0],
+                                                                                            messages=busiest_day[1])
+        message += trl(ctx.user.id, ctx.guild.id, "chat_summary_report_heatmap").format(heatmap=format_heatmap(hours))
+
+        for position, (member_id, member_messages) in enumerate(top_members, start=1):
+            member = ctx.guild.get_member(member_id)
+            if member is not None:
+                message += trl(ctx.user.id, ctx.guild.id, "chat_summary_line").format(position=position,
+                                                                                      name=member.display_name,
+                                                                                      messages=member_messages)
+            else:
+                message += trl(ctx.user.id, ctx.guild.id, "chat_summary_line_unknown_user").format(
+                    position=position, id=member_id, messages=member_messages)
+
+        await ctx.respond(message, ephemeral=True)
+
     @chat_summary_subcommand.command(name="dateformat", description="Set the date format of Chat Streak messages.")
     @commands_ext.guild_only()
     @discord.default_permissions(manage_guild=True)
@@ -310,7 +358,7 @@ class ChatSummary(discord.Cog):
                                 value=f"{ctx.user.mention}")
 
         # Send
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "chat_summary_dateformat_set", append_tip=True).format(format=date_format),
@@ -338,7 +386,7 @@ class ChatSummary(discord.Cog):
                                 value=f"{ctx.user.mention}")
 
         # Send
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(
@@ -14,6 +14,8 @@ class DbCleanupTask(discord.Cog):
         now = datetime.datetime.now(datetime.UTC)
 
         if now.weekday() == 6 and now.hour == 0 and now.minute == 0:
+            # vacuum can't run inside the group commit transaction
+            conn.commit_now()
             cur = conn.cursor()
             cur.execute("vacuum")
             cur.close()
@@ -1,5 +1,8 @@
 import discord
 
+from utils.audit_log_cache import get_audit_log_cache_stats
+from utils.message_pipeline import get_message_stage_stats
+from utils.settings import get_settings_cache_stats
 from utils.tzutil import get_now_for_server
 
 
@@ -16,3 +19,18 @@ class DebugCommands(discord.Cog):
     @dev_commands_group.command(name="now", description="Get now for server")
     async def now(self, ctx: discord.ApplicationContext):
         await ctx.respond(f"Current time: {get_now_for_server(ctx.guild.id).isoformat()}", ephemeral=True)
+
+    @dev_commands_group.command(name="cache_stats", description="Get cache statistics")
+    async def cache_stats(self, ctx: discord.ApplicationContext):
+        settings_stats = get_settings_cache_stats()
+        audit_log_stats = get_audit_log_cache_stats()
+        await ctx.respond(f"Settings cache: {settings_stats['size']} guilds, {settings_stats['hits']} hits, "
+                          f"{settings_stats['misses']} misses, {settings_stats['evictions']} evictions\n"
+                          f"Audit log cache: {audit_log_stats['guilds']} guilds, {audit_log_stats['hits']} hits, "
+                          f"{audit_log_stats['waited']} hits after waiting, {audit_log_stats['misses']} REST fetches, "
+                          f"{audit_log_stats['hit_rate']:.1%} hit rate", ephemeral=True)
+
+    @dev_commands_group.command(name="message_stages", description="Get message pipeline stage timings")
+    async def message_stages(self, ctx: discord.ApplicationContext):
+        lines = [f"{name}: {calls} calls, {avg:.2f}ms avg, {slowest:.2f}ms max" for name, calls, avg, slowest in get_message_stage_stats()]
+        await ctx.respond("\n".join(lines) or "No message stages registered", ephemeral=True)
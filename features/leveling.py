@@ -5,13 +5,17 @@ import discord
 import emoji
 import sentry_sdk
 from discord.ext import commands as commands_ext
+from discord.ext import tasks
 
-from database import conn as db
+from database import conn as db, db_run, on_db_shutdown
 from utils.analytics import analytics
 from utils.languages import get_translation_for_key_localized as trl, get_language
+from utils.leveling_curves import LEVELING_CURVES, get_level_for_xp_on_curve, get_xp_for_level_on_curve
+from utils.leveling_ranking import LevelingRanking
 from utils.logging_util import log_into_logs
+from utils.message_pipeline import MessageContext, register_message_stage
 from utils.per_user_settings import get_per_user_setting, set_per_user_setting
-from utils.settings import get_setting, set_setting
+from utils.settings import get_setting, set_setting, invalidate_settings_cache
 from utils.tips import append_tip_to_message
 from utils.tzutil import get_now_for_server
 
@@ -20,32 +24,127 @@ def db_init():
     cur = db.cursor()
     cur.execute("create table if not exists leveling (guild_id int, user_id int, xp int)")
     cur.execute("create table if not exists leveling_multiplier (guild_id int, name text, multiplier int, start_date text, end_date text)")
+    cur.execute("create table if not exists leveling_rewards (guild_id int, level int, role_id int, primary key (guild_id, level))")
     cur.close()
     db.commit()
 
 
+# guild_id -> [(level, role_id), ...] sorted by level
+_reward_cache: dict[int, list[tuple[int, int]]] = {}
+
+
+def db_migrate_rewards():
+    """Move level rewards stored as leveling_reward_N settings into the leveling_rewards table"""
+    cur = db.cursor()
+    cur.execute("SELECT guild_id, key, value FROM settings WHERE key LIKE 'leveling\\_reward\\_%' ESCAPE '\\'")
+    rows = cur.fetchall()
+    for guild_id, key, value in rows:
+        if value != '0':
+            cur.execute("INSERT OR IGNORE INTO leveling_rewards (guild_id, level, role_id) VALUES (?, ?, ?)", (guild_id, int(key[len('leveling_reward_'):]), int(value)))
+    cur.execute("DELETE FROM settings WHERE key LIKE 'leveling\\_reward\\_%' ESCAPE '\\'")
+    cur.close()
+    db.commit()
+
+    if rows:
+        invalidate_settings_cache()
+
+
+def db_get_rewards(guild_id: int) -> list[tuple[int, int]]:
+    """Get the level rewards of a guild
+
+    Returns:
+        list: (level, role_id) pairs sorted by level
+    """
+    rewards = _reward_cache.get(guild_id)
+    if rewards is None:
+        cur = db.cursor()
+        cur.execute("SELECT level, role_id FROM leveling_rewards WHERE guild_id = ? ORDER BY level", (guild_id,))
+        rewards = cur.fetchall()
+        cur.close()
+        _reward_cache[guild_id] = rewards
+    return rewards
+
+
+def db_get_reward(guild_id: int, level: int) -> int | None:
+    for reward_level, role_id in db_get_rewards(guild_id):
+        if reward_level == level:
+            return role_id
+    return None
+
+
+def db_set_reward(guild_id: int, level: int, role_id: int):
+    cur = db.cursor()
+    cur.execute("INSERT INTO leveling_rewards (guild_id, level, role_id) VALUES (?, ?, ?) ON CONFLICT (guild_id, level) DO UPDATE SET role_id = excluded.role_id", (guild_id, level, role_id))
+    cur.close()
+    db.commit()
+    _reward_cache.pop(guild_id, None)
+
+
+def db_remove_reward(guild_id: int, level: int):
+    cur = db.cursor()
+    cur.execute("DELETE FROM leveling_rewards WHERE guild_id = ? AND level = ?", (guild_id, level))
+    cur.close()
+    db.commit()
+    _reward_cache.pop(guild_id, None)
+
+
+# guild_id -> product of the guild's named multipliers for every day of the year, see get_multiplier_day_index
+_multiplier_calendars: dict[int, list[int]] = {}
+
+
+def get_multiplier_day_index(month: int, day: int) -> int:
+    """Get the index of a date in a multiplier calendar. February 29 has its own index, so every year fits."""
+    return datetime.date(2000, month, day).timetuple().tm_yday - 1
+
+
+def get_multiplier_days(start_date: str, end_date: str) -> list[int]:
+    """Get the calendar indexes a multiplier is active on, ranges like 12-20 to 01-05 wrap around the new year"""
+    # Stored as MM-DD, older rows can have a full date from change_multiplier_start_date/change_multiplier_end_date
+    start = get_multiplier_day_index(*map(int, start_date.split(' ')[0].split('-')[-2:]))
+    end = get_multiplier_day_index(*map(int, end_date.split(' ')[0].split('-')[-2:]))
+
+    if start <= end:
+        return list(range(start, end + 1))
+    return list(range(start, 366)) + list(range(0, end + 1))
+
+
+def get_multiplier_calendar(guild_id: int) -> list[int]:
+    calendar = _multiplier_calendars.get(guild_id)
+    if calendar is None:
+        calendar = [1] * 366
+        for m in db_multiplier_getall(guild_id):
+            for day in get_multiplier_days(m[3], m[4]):
+                calendar[day] *= m[2]
+        _multiplier_calendars[guild_id] = calendar
+    return calendar
+
+
 def db_calculate_multiplier(guild_id: int):
     multiplier = int(get_setting(guild_id, 'leveling_xp_multiplier', '1'))
+    now = get_now_for_server(guild_id)
+    return multiplier * get_multiplier_calendar(guild_id)[get_multiplier_day_index(now.month, now.day)]
 
-    multipliers = db_multiplier_getall(guild_id)
-    for m in multipliers:
-        start_month, start_day = map(int, m[3].split('-'))
-        end_month, end_day = map(int, m[4].split('-'))
 
-        now = get_now_for_server(guild_id)
-        start_date = datetime.datetime(now.year, start_month, start_day)
-        end_date = datetime.datetime(now.year, end_month, end_day, hour=23, minute=59, second=59)
+# Seconds between writes of accumulated XP to the leveling table
+XP_FLUSH_INTERVAL = 30
 
-        if end_date < start_date:
-            end_date = end_date.replace(year=end_date.year + 1)
+# (guild_id, user_id) -> total XP including XP not written yet, kept for members active since the last flush
+_xp_totals: dict[tuple[int, int], int] = {}
 
-        if start_date <= now <= end_date:
-            multiplier *= m[2]
+# (guild_id, user_id) -> XP not written to the leveling table yet
+_xp_pending: dict[tuple[int, int], int] = {}
 
-    return multiplier
+# guild_id -> XP ranking, for guilds whose leaderboard or ranks have been requested
+_rankings: dict[int, LevelingRanking] = {}
+
+LEADERBOARD_PAGE_SIZE = 10
 
 
 def db_get_user_xp(guild_id: int, user_id: int):
+    total = _xp_totals.get((guild_id, user_id))
+    if total is not None:
+        return total
+
     db_init()
     cur = db.cursor()
     cur.execute('SELECT xp FROM leveling WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
@@ -54,40 +153,101 @@ def db_get_user_xp(guild_id: int, user_id: int):
     return data[0] if data else 1
 
 
-def db_add_user_xp(guild_id: int, user_id: int, xp: int):
-    db_init()
+def add_user_xp(guild_id: int, user_id: int, xp: int) -> tuple[int, int]:
+    """Add XP to a member in memory, with the multiplier applied. It is written to the database by flush_user_xp.
+
+    Args:
+        guild_id (int): Guild ID
+        user_id (int): User ID
+        xp (int): XP before the multiplier
+
+    Returns:
+        tuple: Total XP before and after adding
+    """
+    key = (guild_id, user_id)
+    before = _xp_totals.get(key)
+    if before is None:
+        cur = db.cursor()
+        cur.execute('SELECT xp FROM leveling WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        data = cur.fetchone()
+        cur.close()
+        before = data[0] if data else 0
+
+    added = xp * int(db_calculate_multiplier(guild_id))
+    _xp_totals[key] = before + added
+    _xp_pending[key] = _xp_pending.get(key, 0) + added
+
+    ranking = _rankings.get(guild_id)
+    if ranking is not None:
+        ranking.update(user_id, before + added)
+
+    return before, before + added
+
+
+def get_ranking(guild_id: int) -> LevelingRanking:
+    """Get the XP ranking of a guild, loading it on first use and keeping it up to date from add_user_xp"""
+    ranking = _rankings.get(guild_id)
+    if ranking is None:
+        db_init()
+        cur = db.cursor()
+        cur.execute('SELECT user_id, xp FROM leveling WHERE guild_id = ?', (guild_id,))
+        ranking = LevelingRanking(cur.fetchall())
+        cur.close()
+
+        # XP that is not written to the database yet
+        for (total_guild_id, user_id), xp in _xp_totals.items():
+            if total_guild_id == guild_id:
+                ranking.update(user_id, xp)
+
+        _rankings[guild_id] = ranking
+    return ranking
+
+
+def take_pending_user_xp() -> dict[tuple[int, int], int]:
+    """Take the XP accumulated since the last call, to be written with db_write_user_xp"""
+    global _xp_pending
+    pending, _xp_pending = _xp_pending, {}
+
+    # Members without new XP had their last XP written by an earlier flush, the database is up to date for them
+    for key in [key for key in _xp_totals if key not in pending]:
+        del _xp_totals[key]
+
+    return pending
+
+
+def db_write_user_xp(conn, pending: dict[tuple[int, int], int]):
+    """Add accumulated XP to the leveling table in one batch"""
+    if not pending:
+        return
+
+    conn.executemany("INSERT INTO leveling (guild_id, user_id, xp) VALUES (?, ?, ?) ON CONFLICT (guild_id, user_id) DO UPDATE SET xp = xp + excluded.xp",
+                     [(guild_id, user_id, xp) for (guild_id, user_id), xp in pending.items()])
+    conn.commit()
+
+
+def db_migrate_unique_users():
+    """Merge duplicate (guild_id, user_id) rows, keeping the highest XP, and make the pair unique"""
     cur = db.cursor()
-    cur.execute("SELECT xp FROM leveling WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-    data = cur.fetchone()
-    if data:
-        current_xp = data[0]
-        multiplier = db_calculate_multiplier(guild_id)
-        cur.execute("UPDATE leveling SET xp = ? WHERE guild_id = ? AND user_id = ?", (current_xp + (xp * int(multiplier)), guild_id, user_id))
-    else:
-        cur.execute("INSERT INTO leveling (guild_id, user_id, xp) VALUES (?, ?, ?)", (guild_id, user_id, xp))
+    cur.execute("DELETE FROM leveling WHERE rowid NOT IN (SELECT rowid FROM (SELECT rowid, MAX(xp) FROM leveling GROUP BY guild_id, user_id))")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS leveling_guild_user ON leveling (guild_id, user_id)")
     cur.close()
     db.commit()
 
 
-def get_level_for_xp(guild_id: int, xp: int):
-    level = 0
-    xp_needed = db_calculate_multiplier(guild_id) * int(get_setting(guild_id, 'leveling_xp_per_level', '500'))
-    while xp >= xp_needed:
-        level += 1
-        xp -= xp_needed
-        xp_needed = db_calculate_multiplier(guild_id) * int(get_setting(guild_id, 'leveling_xp_per_level', '500'))
+def get_leveling_curve_params(guild_id: int) -> tuple[int, str]:
+    """Get the XP needed for the first level (multiplier applied) and the leveling curve of a guild"""
+    xp_per_level = db_calculate_multiplier(guild_id) * int(get_setting(guild_id, 'leveling_xp_per_level', '500'))
+    return xp_per_level, get_setting(guild_id, 'leveling_curve', 'linear')
 
-    return level
 
+def get_level_for_xp(guild_id: int, xp: int):
+    xp_per_level, curve = get_leveling_curve_params(guild_id)
+    return get_level_for_xp_on_curve(xp, xp_per_level, curve)
 
-def get_xp_for_level(guild_id: int, level: int):
-    xp = 0
-    xp_needed = db_calculate_multiplier(guild_id) * int(get_setting(guild_id, 'leveling_xp_per_level', '500'))
-    for _ in range(level):
-        xp += xp_needed
-        xp_needed = db_calculate_multiplier(guild_id) * int(get_setting(guild_id, 'leveling_xp_per_level', '500'))
 
-    return xp
+def get_xp_for_level(guild_id: int, level: int):
+    xp_per_level, curve = get_leveling_curve_params(guild_id)
+    return get_xp_for_level_on_curve(level, xp_per_level, curve)
 
 
 def db_multiplier_add(guild_id: int, name: str, multiplier: int, start_date_month: int, start_date_day: int, end_date_month: int, end_date_day: int):
@@ -97,6 +257,7 @@ def db_multiplier_add(guild_id: int, name: str, multiplier: int, start_date_mont
         (guild_id, name, multiplier, '{:02d}-{:02d}'.format(start_date_month, start_date_day), '{:02d}-{:02d}'.format(end_date_month, end_date_day)))
     cur.close()
     db.commit()
+    _multiplier_calendars.pop(guild_id, None)
 
 
 def db_multiplier_exists(guild_id: int, name: str):
@@ -122,6 +283,7 @@ def db_multiplier_change_multiplier(guild_id: int, name: str, multiplier: int):
     cur.execute("UPDATE leveling_multiplier SET multiplier = ? WHERE guild_id = ? AND name = ?", (multiplier, guild_id, name))
     cur.close()
     db.commit()
+    _multiplier_calendars.pop(guild_id, None)
 
 
 def db_multiplier_change_start_date(guild_id: int, name: str, start_date: datetime.datetime):
@@ -130,6 +292,7 @@ def db_multiplier_change_start_date(guild_id: int, name: str, start_date: dateti
     cur.execute("UPDATE leveling_multiplier SET start_date = ? WHERE guild_id = ? AND name = ?", (start_date, guild_id, name))
     cur.close()
     db.commit()
+    _multiplier_calendars.pop(guild_id, None)
 
 
 def db_multiplier_change_end_date(guild_id: int, name: str, end_date: datetime.datetime):
@@ -138,6 +301,7 @@ def db_multiplier_change_end_date(guild_id: int, name: str, end_date: datetime.d
     cur.execute("UPDATE leveling_multiplier SET end_date = ? WHERE guild_id = ? AND name = ?", (end_date, guild_id, name))
     cur.close()
     db.commit()
+    _multiplier_calendars.pop(guild_id, None)
 
 
 def db_multiplier_remove(guild_id: int, name: str):
@@ -146,6 +310,7 @@ def db_multiplier_remove(guild_id: int, name: str):
     cur.execute("DELETE FROM leveling_multiplier WHERE guild_id = ? AND name = ?", (guild_id, name))
     cur.close()
     db.commit()
+    _multiplier_calendars.pop(guild_id, None)
 
 
 def db_multiplier_getall(guild_id: int):
@@ -206,29 +371,35 @@ def validate_day(month: int, day: int, year: int) -> bool:
     return True
 
 
-async def update_roles_for_member(guild: discord.Guild, member: discord.Member):
-    xp = db_get_user_xp(guild.id, member.id)
-    level = get_level_for_xp(guild.id, xp)
+async def update_roles_for_member(guild: discord.Guild, member: discord.Member, level: int | None = None):
+    rewards = db_get_rewards(guild.id)
+    if not rewards:
+        return
+
+    if level is None:
+        level = get_level_for_xp(guild.id, db_get_user_xp(guild.id, member.id))
 
-    for i in range(1, level + 1):  # Add missing roles
-        role_id = get_setting(guild.id, f'leveling_reward_{i}', '0')
-        if role_id != '0':
-            role = guild.get_role(int(role_id))
-            if role.position > guild.me.top_role.position:
-                return
+    earned = {role_id for reward_level, role_id in rewards if reward_level <= level}
+    member_role_ids = {role.id for role in member.roles}
+    roles = [role for role in member.roles if not role.is_default()]
+    changed = False
 
-            if role is not None and role not in member.roles:
-                await member.add_roles(role)
+    for _, role_id in rewards:
+        role = guild.get_role(role_id)
+        if role is None or role >= guild.me.top_role:
+            continue
 
-    for i in range(level + 1, 100):  # Remove excess roles
-        role_id = get_setting(guild.id, f'leveling_reward_{i}', '0')
-        if role_id != '0':
-            role = guild.get_role(int(role_id))
-            if role.position > guild.me.top_role.position:
-                return
+        if role_id in earned and role_id not in member_role_ids:  # Add missing roles
+            roles.append(role)
+            member_role_ids.add(role_id)
+            changed = True
+        elif role_id not in earned and role_id in member_role_ids:  # Remove excess roles
+            roles.remove(role)
+            member_role_ids.discard(role_id)
+            changed = True
 
-            if role is not None and role in member.roles:
-                await member.remove_roles(role)
+    if changed:
+        await member.edit(roles=roles)
 
 
 class Leveling(discord.Cog):
@@ -236,20 +407,38 @@ class Leveling(discord.Cog):
         self.bot = bot
         super().__init__()
 
-    @discord.Cog.listener()
-    async def on_message(self, msg: discord.Message):
-        if msg.author.bot:
-            return
-
-        before_level = get_level_for_xp(msg.guild.id, db_get_user_xp(msg.guild.id, msg.author.id))
-        db_add_user_xp(msg.guild.id, msg.author.id, 3)
-        after_level = get_level_for_xp(msg.guild.id, db_get_user_xp(msg.guild.id, msg.author.id))
-
-        if not msg.channel.permissions_for(msg.guild.me).send_messages:
+        db_init()
+        db_migrate_rewards()
+        db_migrate_unique_users()
+
+        on_db_shutdown(lambda: db_write_user_xp(db, take_pending_user_xp()))
+        register_message_stage("leveling", self.on_pipeline_message)
+        self.flush_user_xp.start()
+
+    @tasks.loop(seconds=XP_FLUSH_INTERVAL)
+    async def flush_user_xp(self):
+        pending = take_pending_user_xp()
+        try:
+            await db_run(db_write_user_xp, pending)
+        except Exception as e:
+            # Keep the XP for the next flush
+            for key, xp in pending.items():
+                _xp_pending[key] = _xp_pending.get(key, 0) + xp
+            sentry_sdk.capture_exception(e)
+
+    async def on_pipeline_message(self, ctx: MessageContext):
+        msg = ctx.message
+
+        before_xp, after_xp = add_user_xp(msg.guild.id, msg.author.id, 3)
+        xp_per_level, curve = get_leveling_curve_params(msg.guild.id)
+        before_level = get_level_for_xp_on_curve(before_xp, xp_per_level, curve)
+        after_level = get_level_for_xp_on_curve(after_xp, xp_per_level, curve)
+
+        if not ctx.bot_can_send:
             return
 
-        if msg.guild.me.guild_permissions.manage_roles:
-            await update_roles_for_member(msg.guild, msg.author)
+        if before_level != after_level and msg.guild.me.guild_permissions.manage_roles:
+            await update_roles_for_member(msg.guild, msg.author, after_level)
 
         if before_level != after_level and msg.channel.can_send():
             try:
@@ -270,27 +459,25 @@ class Leveling(discord.Cog):
         next_level_xp = get_xp_for_level(ctx.guild.id, level + 1)
         multiplier_list = db_multiplier_getall(ctx.guild.id)
 
+        now = get_now_for_server(ctx.guild.id)
+        today = get_multiplier_day_index(now.month, now.day)
+
         msg = ""
         for i in multiplier_list:
-            start_month, start_day = map(int, i[3].split('-'))
-            end_month, end_day = map(int, i[4].split('-'))
-
-            now = get_now_for_server(ctx.guild.id)
-            start_date = datetime.datetime(now.year, start_month, start_day)
-            end_date = datetime.datetime(now.year, end_month, end_day, hour=23, minute=59, second=59)
-
-            if end_date < start_date:
-                end_date = end_date.replace(year=end_date.year + 1)
-
             # continue if the multiplier is not active
-            if start_date > now or end_date < now:
+            if today not in get_multiplier_days(i[3], i[4]):
                 continue
 
             msg += trl(ctx.user.id, ctx.guild.id, "leveling_level_multiplier_row").format(name=i[1], multiplier=i[2], start=i[3], end=i[4])
 
+        ranking = get_ranking(ctx.guild.id)
+        rank = ranking.get_rank(user.id)
+        rank_msg = trl(ctx.user.id, ctx.guild.id, "leveling_level_rank").format(rank=rank, total=len(ranking)) if rank is not None else ""
+
         if user == ctx.user:
             icon = get_per_user_setting(ctx.user.id, 'leveling_icon', '')
             response = trl(ctx.user.id, ctx.guild.id, "leveling_level_info_self").format(icon=icon, level=level, level_xp=level_xp, next_level_xp=next_level_xp, next_level=level + 1, multiplier=multiplier)
+            response += rank_msg
 
             if len(msg) > 0:
                 response += trl(ctx.user.id, ctx.guild.id, "leveling_level_multiplier_title")
@@ -301,6 +488,7 @@ class Leveling(discord.Cog):
             icon = get_per_user_setting(user.id, 'leveling_icon', '')
             response = trl(ctx.user.id, ctx.guild.id, "leveling_level_info_another").format(icon=icon, user=user.mention, level=level, level_xp=level_xp, next_level_xp=next_level_xp, next_level=level + 1,
                                                                                             multiplier=multiplier)
+            response += rank_msg
 
             if len(msg) > 0:
                 response += trl(ctx.user.id, ctx.guild.id, "leveling_level_multiplier_title")
@@ -313,6 +501,31 @@ class Leveling(discord.Cog):
 
     leveling_subcommand = discord.SlashCommandGroup(name='leveling', description='Leveling settings')
 
+    @leveling_subcommand.command(name="leaderboard", description="Get the leveling leaderboard")
+    @commands_ext.guild_only()
+    @discord.option(name="page", description="The page of the leaderboard", type=int, min_value=1, default=1)
+    @analytics("leveling leaderboard")
+    async def leaderboard(self, ctx: discord.ApplicationContext, page: int = 1):
+        ranking = get_ranking(ctx.guild.id)
+        if len(ranking) == 0:
+            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_leaderboard_empty"), ephemeral=True)
+            return
+
+        pages = (len(ranking) + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+        page = min(page, pages)
+        xp_per_level, curve = get_leveling_curve_params(ctx.guild.id)
+
+        message = trl(ctx.user.id, ctx.guild.id, "leveling_leaderboard_title")
+        for position, user_id, xp in ranking.get_page(page - 1, LEADERBOARD_PAGE_SIZE):
+            message += trl(ctx.user.id, ctx.guild.id, "leveling_leaderboard_line").format(position=position, user=f"<@{user_id}>",
+                                                                                           level=get_level_for_xp_on_curve(xp, xp_per_level, curve), xp=xp)
+        message += trl(ctx.user.id, ctx.guild.id, "leveling_leaderboard_page").format(page=page, pages=pages)
+
+        if get_per_user_setting(ctx.user.id, 'tips_enabled', 'true') == 'true':
+            language = get_language(ctx.guild.id, ctx.user.id)
+            message = append_tip_to_message(ctx.guild.id, ctx.user.id, message, language)
+        await ctx.respond(message, ephemeral=True)
+
     @leveling_subcommand.command(name="list", description="List the leveling settings")
     @discord.default_permissions(manage_guild=True)
     @commands_ext.has_permissions(manage_guild=True)
@@ -320,6 +533,7 @@ class Leveling(discord.Cog):
     @analytics("leveling list")
     async def list_settings(self, ctx: discord.ApplicationContext):
         leveling_xp_multiplier = get_setting(ctx.guild.id, 'leveling_xp_multiplier', '1')
+        leveling_curve = get_setting(ctx.guild.id, 'leveling_curve', 'linear')
 
         multiplier_list = db_multiplier_getall(ctx.guild.id)
         multiplier_list_msg = ""
@@ -334,6 +548,7 @@ class Leveling(discord.Cog):
 
         embed = discord.Embed(title=trl(ctx.user.id, ctx.guild.id, "leveling_settings_title"), color=discord.Color.blurple(), description=multiplier_list_msg)
         embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "leveling_settings_multiplier"), value=f'`{leveling_xp_multiplier}x`')
+        embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "leveling_settings_curve"), value=f'`{leveling_curve}`')
 
         await ctx.respond(embed=embed, ephemeral=True)
 
@@ -356,7 +571,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "leveling_log_multiplier"), value=f"{old_multiplier} -> {str(multiplier)}")
 
         # Send to logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_set_multiplier_success", append_tip=True).format(multiplier=multiplier), ephemeral=True)
@@ -407,7 +622,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_log_end_date"), value=f"{end_date}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_add_multiplier_success", append_tip=True).format(name=name, multiplier=multiplier), ephemeral=True)
@@ -438,7 +653,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_rename_multiplier_log_new_name"), value=f"{new_name}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_rename_multiplier_success", append_tip=True).format(old_name=old_name, new_name=new_name), ephemeral=True)
@@ -469,7 +684,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_multiplier_logs_new_multiplier"), value=f"{multiplier}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_multiplier_success", append_tip=True).format(name=name, multiplier=multiplier), ephemeral=True)
@@ -512,7 +727,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_start_date_new_start_date"), value=f"{start_date}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_start_date_success", append_tip=True).format(name=name, start_date=start_date), ephemeral=True)
@@ -555,7 +770,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_error_invalid_end_date"), value=f"{end_date}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_end_date_success", append_tip=True).format(name=name, end_date=end_date), ephemeral=True)
@@ -584,7 +799,7 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "leveling_log_multiplier"), value=f"{old_multiplier}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_remove_multiplier_success", append_tip=True).format(name=name), ephemeral=True)
@@ -616,7 +831,26 @@ class Leveling(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_set_xp_per_level_log_new_xp"), value=f"{xp}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
+
+    @leveling_subcommand.command(name='set_curve', description='Set how the XP needed grows with each level')
+    @discord.default_permissions(manage_guild=True)
+    @commands_ext.has_permissions(manage_guild=True)
+    @commands_ext.guild_only()
+    @discord.option(name="curve", description="The leveling curve", choices=LEVELING_CURVES)
+    @analytics("leveling set curve")
+    async def set_curve(self, ctx: discord.ApplicationContext, curve: str):
+        old_curve = get_setting(ctx.guild.id, 'leveling_curve', 'linear')
+        set_setting(ctx.guild.id, 'leveling_curve', curve)
+        await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_set_curve_success", append_tip=True).format(curve=curve), ephemeral=True)
+
+        # Logging embed
+        logging_embed = discord.Embed(title=trl(0, ctx.guild.id, "leveling_set_curve_log_title"))
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_user"), value=f"{ctx.user.mention}")
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "leveling_settings_curve"), value=f"{old_curve} -> {curve}")
+
+        # Send into logs
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
     @leveling_subcommand.command(name='set_reward', description='Set a role for a level')
     @discord.default_permissions(manage_guild=True)
@@ -627,11 +861,11 @@ class Leveling(discord.Cog):
     @analytics("leveling set reward")
     async def set_reward(self, ctx: discord.ApplicationContext, level: int, role: discord.Role):
         # Get old setting
-        old_role_id = get_setting(ctx.guild.id, f"leveling_reward_{level}", '0')
+        old_role_id = str(db_get_reward(ctx.guild.id, level) or 0)
         old_role = ctx.guild.get_role(int(old_role_id))
 
         # Set new setting
-        set_setting(ctx.guild.id, f'leveling_reward_{level}', str(role.id))
+        db_set_reward(ctx.guild.id, level, role.id)
 
         # Logging embed
         logging_embed = discord.Embed(title=trl(0, ctx.guild.id, "leveling_set_reward_log_title"))
@@ -644,7 +878,7 @@ class Leveling(discord.Cog):
                                         new_reward=role.mention))
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_set_reward_success", append_tip=True).format(level=level, reward=role.mention), ephemeral=True)
@@ -657,8 +891,8 @@ class Leveling(discord.Cog):
     @analytics("leveling remove reward")
     async def remove_reward(self, ctx: discord.ApplicationContext, level: int):
         # Get old settingF
-        old_role_id = get_setting(ctx.guild.id, f"leveling_reward_{level}", '0')
-        old_role = ctx.guild.get_role(int(old_role_id))
+        old_role_id = db_get_reward(ctx.guild.id, level) or 0
+        old_role = ctx.guild.get_role(old_role_id)
 
         # Logging embed
         logging_embed = discord.Embed(title=trl(ctx.user.id, ctx.guild.id, "leveling_remove_reward_log_title"))
@@ -669,10 +903,10 @@ class Leveling(discord.Cog):
             logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "logging_role"), value=trl(ctx.user.id, ctx.guild.id, "leveling_remove_reward_log_role_unknown"))
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Set new setting
-        set_setting(ctx.guild.id, f'leveling_reward_{level}', '0')
+        db_remove_reward(ctx.guild.id, level)
 
         # Send response
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "leveling_remove_reward_success", append_tip=True).format(level=level), ephemeral=True)
@@ -1,10 +1,35 @@
+import asyncio
+import datetime
+import time
+
 import discord
 from discord.ext import commands as commands_ext
 
+from database import db_fetchall, db_fetchone
+from utils.audit_log_cache import add_audit_log_entry, find_audit_log_entry
+from utils.debouncer import KeyedDebouncer
 from utils.languages import get_translation_for_key_localized as trl
+from utils.log_archive import ANY_USER, read_archived_entries
 from utils.logging_util import log_into_logs
+from utils.raid_lockdown import is_raid_lockdown
 from utils.settings import get_setting, set_setting
 
+# Seconds member, role and voice state updates are merged for, so mass edits are logged once per member or role
+LOGGING_DEBOUNCE_WINDOW = 3
+
+# Archived logs shown per /logging search page, a message fits at most 10 embeds and 6000 characters
+LOG_SEARCH_PAGE_SIZE = 5
+EMBED_CHARACTERS_PER_MESSAGE = 6000
+
+# Event types that can be searched for, see the event argument of log_into_logs
+LOG_EVENTS = ['auto_moderation_rule_create', 'auto_moderation_rule_delete', 'auto_moderation_rule_update',
+              'guild_channel_create', 'guild_channel_delete', 'guild_channel_update', 'guild_emojis_update',
+              'guild_role_create', 'guild_role_delete', 'guild_role_update', 'guild_stickers_update', 'guild_update',
+              'invite_create', 'invite_delete', 'member_ban', 'member_join', 'member_remove', 'member_unban',
+              'member_update', 'reaction_add', 'reaction_clear', 'reaction_clear_emoji', 'reaction_remove',
+              'scheduled_event_create', 'scheduled_event_delete', 'scheduled_event_update', 'thread_create',
+              'thread_delete', 'thread_update', 'voice_state_update', 'other']
+
 
 def str_channel_type(channel_type: discord.ChannelType) -> str:
     text = channel_type.name.replace('_', ' ').capitalize()
@@ -28,13 +53,22 @@ class Logging(discord.Cog):
         self.bot = bot
         super().__init__()
 
+        self.member_updates = KeyedDebouncer(LOGGING_DEBOUNCE_WINDOW, self.log_member_update)
+        self.role_updates = KeyedDebouncer(LOGGING_DEBOUNCE_WINDOW, self.log_role_update)
+        self.voice_updates = KeyedDebouncer(LOGGING_DEBOUNCE_WINDOW, self.log_voice_state_update)
+
+    @discord.Cog.listener()
+    async def on_audit_log_entry(self, entry: discord.AuditLogEntry):
+        # Listeners below look up who made a change in these instead of fetching the audit log
+        add_audit_log_entry(entry)
+
     @discord.Cog.listener()
     async def on_guild_emojis_update(self, guild: discord.Guild, before: discord.Emoji | None, after: discord.Emoji | None):
         if before is None and after is not None:
             triggering_user = None
-            if guild.me.guild_permissions.view_audit_log:
-                async for action in guild.audit_logs(action=discord.AuditLogAction.emoji_create, limit=1):
-                    triggering_user = action.user
+            entry = await find_audit_log_entry(guild, discord.AuditLogAction.emoji_create, after.id)
+            if entry is not None:
+                triggering_user = entry.user
 
             embed = discord.Embed(title=trl(0, guild.id, "logging_emoji_added_title"), color=discord.Color.green())
 
@@ -44,13 +78,13 @@ class Logging(discord.Cog):
                 embed.description = trl(0, guild.id, "logging_emoji_added").format(name=after.name)
 
             embed.add_field(name=trl(0, guild.id, 'logging_moderator'), value=triggering_user.mention if triggering_user else trl(0, guild.id, 'logging_unknown_member'), inline=False)
-            await log_into_logs(guild, embed)
+            await log_into_logs(guild, embed, event="guild_emojis_update", users=[triggering_user])
 
         if before is not None and after is None:
             triggering_user = None
-            if guild.me.guild_permissions.view_audit_log:
-                async for action in guild.audit_logs(action=discord.AuditLogAction.emoji_delete, limit=1):
-                    triggering_user = action.user
+            entry = await find_audit_log_entry(guild, discord.AuditLogAction.emoji_delete, before.id)
+            if entry is not None:
+                triggering_user = entry.user
 
             embed = discord.Embed(title=trl(0, guild.id, "logging_emoji_removed"), color=discord.Color.red())
             if before.animated:
@@ -59,13 +93,13 @@ class Logging(discord.Cog):
                 embed.description = trl(0, guild.id, "logging_emoji_removed").format(name=before.name)
 
             embed.add_field(name=trl(0, guild.id, 'logging_moderator'), value=triggering_user.mention if triggering_user else trl(0, guild.id, 'logging_unknown_member'), inline=False)
-            await log_into_logs(guild, embed)
+            await log_into_logs(guild, embed, event="guild_emojis_update", users=[triggering_user])
 
         if before is not None and after is not None:
             triggering_user = None
-            if guild.me.guild_permissions.view_audit_log:
-                async for action in guild.audit_logs(action=discord.AuditLogAction.emoji_update, limit=1):
-                    triggering_user = action.user
+            entry = await find_audit_log_entry(guild, discord.AuditLogAction.emoji_update, after.id)
+            if entry is not None:
+                triggering_user = entry.user
 
             embed = discord.Embed(title=trl(0, guild.id, "logging_emoji_renamed_title"), color=discord.Color.blue())
             if before.name != after.name:
@@ -73,38 +107,39 @@ class Logging(discord.Cog):
 
             if len(embed.fields) > 0:
                 embed.add_field(name=trl(0, guild.id, 'logging_moderator'), value=triggering_user.mention if triggering_user else trl(0, guild.id, 'logging_unknown_member'), inline=False)
-            await log_into_logs(guild, embed)
+            await log_into_logs(guild, embed, event="guild_emojis_update", users=[triggering_user])
 
     @discord.Cog.listener()
     async def on_guild_stickers_update(self, guild: discord.Guild, before: discord.Sticker | None, after: discord.Sticker | None):
         if before is None and after is not None:
             triggering_user = None
-            if guild.me.guild_permissions.view_audit_log:
-                async for action in guild.audit_logs(action=discord.AuditLogAction.sticker_create, limit=1):
-                    triggering_user = action.user
+            entry = await find_audit_log_entry(guild, discord.AuditLogAction.sticker_create, after.id)
+            if entry is not None:
+                triggering_user = entry.user
 
             embed = discord.Embed(title=trl(0, guild.id, "logging_sticker_added_title"), color=discord.Color.green())
             embed.description = trl(0, guild.id, "logging_sticker_added").format(name=after.name)
 
             embed.add_field(name=trl(0, guild.id, 'logging_moderator'), value=triggering_user.mention if triggering_user else trl(0, guild.id, 'logging_unknown_member'), inline=False)
-            await log_into_logs(guild, embed)
+            await log_into_logs(guild, embed, event="guild_stickers_update", users=[triggering_user])
 
         if before is not None and after is None:
-            if guild.me.guild_permissions.view_audit_log:
-                async for action in guild.audit_logs(action=discord.AuditLogAction.sticker_delete, limit=1):
-                    triggering_user = action.user
+            triggering_user = None
+            entry = await find_audit_log_entry(guild, discord.AuditLogAction.sticker_delete, before.id)
+            if entry is not None:
+                triggering_user = entry.user
 
             embed = discord.Embed(title=trl(0, guild.id, "logging_sticker_removed_title"), color=discord.Color.red())
             embed.description = trl(0, guild.id, "logging_sticker_removed").format(name=before.name)
 
             embed.add_field(name=trl(0, guild.id, 'logging_moderator'), value=triggering_user.mention if triggering_user else trl(0, guild.id, 'logging_unknown_member'), inline=False)
-            await log_into_logs(guild, embed)
+            await log_into_logs(guild, embed, event="guild_stickers_update", users=[triggering_user])
 
         if before is not None and after is not None:
             triggering_user = None
-            if guild.me.guild_permissions.view_audit_log:
-                async for action in guild.audit_logs(action=discord.AuditLogAction.sticker_update, limit=1):
-                    triggering_user = action.user
+            entry = await find_audit_log_entry(guild, discord.AuditLogAction.sticker_update, after.id)
+            if entry is not None:
+                triggering_user = entry.user
 
             embed = discord.Embed(title=trl(0, guild.id, "logging_sticker_edited"), color=discord.Color.blue())
             if before.name != after.name:
@@ -115,53 +150,51 @@ class Logging(discord.Cog):
 
             if len(embed.fields) > 0:
                 embed.add_field(name=trl(0, guild.id, 'logging_moderator'), value=triggering_user.mention if triggering_user else trl(0, guild.id, 'logging_unknown_member'), inline=False)
-            await log_into_logs(guild, embed)
+            await log_into_logs(guild, embed, event="guild_stickers_update", users=[triggering_user])
 
     @discord.Cog.listener()
     async def on_auto_moderation_rule_create(self, rule: discord.AutoModRule):
         moderator = None
-        if rule.guild.me.guild_permissions.view_audit_log:
-            async for entry in rule.guild.audit_logs(limit=1, action=discord.AuditLogAction.auto_moderation_rule_create):
-                moderator = entry.user
+        entry = await find_audit_log_entry(rule.guild, discord.AuditLogAction.auto_moderation_rule_create, rule.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, rule.guild.id, "logging_automod_rule_created"), color=discord.Color.green())
         embed.add_field(name=trl(0, rule.guild.id, "logging_rule_name"), value=rule.name)
         embed.add_field(name=trl(0, rule.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, rule.guild.id, "logging_unknown_member"))
-        await log_into_logs(rule.guild, embed)
+        await log_into_logs(rule.guild, embed, event="auto_moderation_rule_create", users=[moderator])
 
     @discord.Cog.listener()
     async def on_auto_moderation_rule_delete(self, rule: discord.AutoModRule):
         moderator = None
-        if rule.guild.me.guild_permissions.view_audit_log:
-            async for entry in rule.guild.audit_logs(limit=1, action=discord.AuditLogAction.auto_moderation_rule_delete):
-                moderator = entry.user
+        entry = await find_audit_log_entry(rule.guild, discord.AuditLogAction.auto_moderation_rule_delete, rule.id)
+        if entry is not None:
+            moderator = entry.user
         embed = discord.Embed(title=trl(0, rule.guild.id, "logging_automod_rule_delete"), color=discord.Color.red())
         embed.add_field(name=trl(0, rule.guild.id, "logging_rule_name"), value=rule.name)
         embed.add_field(name=trl(0, rule.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, rule.guild.id, "logging_unknown_member"))
-        await log_into_logs(rule.guild, embed)
+        await log_into_logs(rule.guild, embed, event="auto_moderation_rule_delete", users=[moderator])
 
     @discord.Cog.listener()
     async def on_auto_moderation_rule_update(self, rule: discord.AutoModRule):
         moderator = None
-        if rule.guild.me.guild_permissions.view_audit_log:
-            async for entry in rule.guild.audit_logs(limit=1, action=discord.AuditLogAction.auto_moderation_rule_update):
-                moderator = entry.user
+        entry = await find_audit_log_entry(rule.guild, discord.AuditLogAction.auto_moderation_rule_update, rule.id)
+        if entry is not None:
+            moderator = entry.user
         embed = discord.Embed(title=trl(0, rule.guild.id, "logging_automod_rule_update"), color=discord.Color.blue())
         embed.add_field(name=trl(0, rule.guild.id, "logging_rule_name"), value=rule.name)
         embed.add_field(name=trl(0, rule.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, rule.guild.id, "logging_unknown_member"))
-        await log_into_logs(rule.guild, embed)
+        await log_into_logs(rule.guild, embed, event="auto_moderation_rule_update", users=[moderator])
 
     @discord.Cog.listener()
     async def on_member_ban(self, guild: discord.Guild, user: discord.User):
         reason = None
         moderator = None
 
-        if guild.me.guild_permissions.view_audit_log:
-            async for entry in guild.audit_logs(limit=1, action=discord.AuditLogAction.ban):
-                if entry.target.id == user.id:
-                    moderator = entry.user
-                    reason = entry.reason
-                    break
+        entry = await find_audit_log_entry(guild, discord.AuditLogAction.ban, user.id)
+        if entry is not None:
+            moderator = entry.user
+            reason = entry.reason
 
         embed = discord.Embed(title=trl(0, guild.id, "logging_ban_add_title"), color=discord.Color.red())
         embed.add_field(name=trl(0, guild.id, "logging_victim"), value=user.display_name)
@@ -169,19 +202,17 @@ class Logging(discord.Cog):
 
         embed.add_field(name=trl(0, guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, guild.id, "logging_unknown_member"))
         embed.add_field(name=trl(0, guild.id, "logging_reason"), value=reason if reason else trl(0, guild.id, "logging_no_reason"))
-        await log_into_logs(guild, embed)
+        await log_into_logs(guild, embed, event="member_ban", users=[user, moderator])
 
     @discord.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: discord.User):
         reason = None
         moderator = None
 
-        if guild.me.guild_permissions.view_audit_log:
-            async for entry in guild.audit_logs(limit=1, action=discord.AuditLogAction.unban):
-                if entry.target.id == user.id:
-                    moderator = entry.user
-                    reason = entry.reason
-                    break
+        entry = await find_audit_log_entry(guild, discord.AuditLogAction.unban, user.id)
+        if entry is not None:
+            moderator = entry.user
+            reason = entry.reason
 
         embed = discord.Embed(title=trl(0, guild.id, "logging_ban_remove_title"), color=discord.Color.green())
         embed.add_field(name=trl(0, guild.id, "logging_victim"), value=user.display_name)
@@ -189,15 +220,14 @@ class Logging(discord.Cog):
 
         embed.add_field(name=trl(0, guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, guild.id, "logging_unknown_member"))
         embed.add_field(name=trl(0, guild.id, "logging_reason"), value=reason if reason else trl(0, guild.id, "logging_no_reason"))
-        await log_into_logs(guild, embed)
+        await log_into_logs(guild, embed, event="member_unban", users=[user, moderator])
 
     @discord.Cog.listener()
     async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
         moderator = None
-        if before.guild.me.guild_permissions.view_audit_log:
-            async for entry in before.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_update):
-                if entry.target.id == after.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(before.guild, discord.AuditLogAction.channel_update, after.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, after.guild.id, "logging_channel_update_title"), color=discord.Color.blue())
         embed.add_field(name=trl(0, after.guild.id, "logging_channel"), value=after.mention)
@@ -271,48 +301,46 @@ class Logging(discord.Cog):
 
                 overwrite_embed.add_field(name=trl(0, after.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.guild.id, "logging_unknown_member"))
 
-                await log_into_logs(after.guild, overwrite_embed)
+                await log_into_logs(after.guild, overwrite_embed, event="guild_channel_update", users=[moderator])
 
         if len(embed.fields) > 1:
             embed.add_field(name=trl(0, after.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.guild.id, "logging_unknown_member"))
-            await log_into_logs(after.guild, embed)
+            await log_into_logs(after.guild, embed, event="guild_channel_update", users=[moderator])
 
     @discord.Cog.listener()
     async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
         moderator = None
-        if channel.guild.me.guild_permissions.view_audit_log:
-            async for entry in channel.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_create):
-                if entry.target.id == channel.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(channel.guild, discord.AuditLogAction.channel_create, channel.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, channel.guild.id, "logging_channel_create_title"),
                               description=trl(0, channel.guild.id, "logging_channel_create_description").format(type=str_channel_type(channel.type), name=channel.name), color=discord.Color.green())
 
         embed.add_field(name=trl(0, channel.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, channel.guild.id, "logging_unknown_member"))
 
-        await log_into_logs(channel.guild, embed)
+        await log_into_logs(channel.guild, embed, event="guild_channel_create", users=[moderator])
 
     @discord.Cog.listener()
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
         moderator = None
-        if channel.guild.me.guild_permissions.view_audit_log:
-            async for entry in channel.guild.audit_logs(limit=1, action=discord.AuditLogAction.channel_delete):
-                if entry.target.id == channel.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(channel.guild, discord.AuditLogAction.channel_delete, channel.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, channel.guild.id, "logging_channel_delete_title"),
                               description=trl(0, channel.guild.id, "logging_channel_delete_description").format(type=str_channel_type(channel.type), name=channel.name), color=discord.Color.red())
 
         embed.add_field(name=trl(0, channel.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, channel.guild.id, "logging_unknown_member"))
 
-        await log_into_logs(channel.guild, embed)
+        await log_into_logs(channel.guild, embed, event="guild_channel_delete", users=[moderator])
 
     @discord.Cog.listener()
     async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
         moderator = None
-        if after.me.guild_permissions.view_audit_log:
-            async for entry in after.audit_logs(limit=1, action=discord.AuditLogAction.guild_update):
-                moderator = entry.user
+        entry = await find_audit_log_entry(after, discord.AuditLogAction.guild_update, after.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=f"{after.name} Server Updated", color=discord.Color.blue())
 
@@ -352,45 +380,45 @@ class Logging(discord.Cog):
         if len(embed.fields) > 0:
             embed.add_field(name=trl(0, after.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.id, "logging_unknown_member"))
 
-            await log_into_logs(after, embed)
+            await log_into_logs(after, embed, event="guild_update", users=[moderator])
 
     @discord.Cog.listener()
     async def on_guild_role_create(self, role: discord.Role):
         moderator = None
-        if role.guild.me.guild_permissions.view_audit_log:
-            async for entry in role.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_create):
-                if entry.target.id == role.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(role.guild, discord.AuditLogAction.role_create, role.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, role.guild.id, "logging_role_created_title"), description=trl(0, role.guild.id, "logging_role_created_description").format(name=role.name),
                               color=discord.Color.green())
 
         embed.add_field(name=trl(0, role.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, role.guild.id, "logging_unknown_member"))
 
-        await log_into_logs(role.guild, embed)
+        await log_into_logs(role.guild, embed, event="guild_role_create", users=[moderator])
 
     @discord.Cog.listener()
     async def on_guild_role_delete(self, role: discord.Role):
         moderator = None
-        if role.guild.me.guild_permissions.view_audit_log:
-            async for entry in role.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_delete):
-                if entry.target.id == role.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(role.guild, discord.AuditLogAction.role_delete, role.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, role.guild.id, "logging_role_deleted_title"), description=trl(0, role.guild.id, "logging_role_deleted_description").format(name=role.name),
                               color=discord.Color.red())
 
         embed.add_field(name=trl(0, role.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, role.guild.id, "logging_unknown_member"))
 
-        await log_into_logs(role.guild, embed)
+        await log_into_logs(role.guild, embed, event="guild_role_delete", users=[moderator])
 
     @discord.Cog.listener()
     async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.role_updates.push((after.guild.id, after.id), before, after)
+
+    async def log_role_update(self, before: discord.Role, after: discord.Role):
         moderator = None
-        if after.guild.me.guild_permissions.view_audit_log:
-            async for entry in after.guild.audit_logs(limit=1, action=discord.AuditLogAction.role_update):
-                if entry.target.id == after.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(after.guild, discord.AuditLogAction.role_update, after.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, after.guild.id, "logging_role_updated_title"), color=discord.Color.blue())
         if before.name != after.name:
@@ -424,15 +452,14 @@ class Logging(discord.Cog):
         if len(embed.fields) > 0:
             embed.add_field(name=trl(0, after.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.guild.id, "logging_unknown_member"))
 
-            await log_into_logs(after.guild, embed)
+            await log_into_logs(after.guild, embed, event="guild_role_update", users=[moderator])
 
     @discord.Cog.listener()
     async def on_invite_create(self, invite: discord.Invite):
         moderator = None
-        if invite.guild.me.guild_permissions.view_audit_log:
-            async for entry in invite.guild.audit_logs(limit=1, action=discord.AuditLogAction.invite_create):
-                if entry.target.id == invite.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(invite.guild, discord.AuditLogAction.invite_create, invite.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, invite.guild.id, "logging_invite_created"), color=discord.Color.green())
         embed.add_field(name=trl(0, invite.guild.id, "logging_code"), value=invite.code)
@@ -441,44 +468,51 @@ class Logging(discord.Cog):
         embed.add_field(name=trl(0, invite.guild.id, "logging_max_age"), value=str(invite.max_age))
         embed.add_field(name=trl(0, invite.guild.id, "logging_temporary"), value=str(invite.temporary))
         embed.add_field(name=trl(0, invite.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, invite.guild.id, "logging_unknown_member"))
-        await log_into_logs(invite.guild, embed)
+        await log_into_logs(invite.guild, embed, event="invite_create", users=[moderator])
 
     @discord.Cog.listener()
     async def on_invite_delete(self, invite: discord.Invite):
         moderator = None
-        if invite.guild.me.guild_permissions.view_audit_log:
-            async for entry in invite.guild.audit_logs(limit=1, action=discord.AuditLogAction.invite_delete):
-                if entry.target.id == invite.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(invite.guild, discord.AuditLogAction.invite_delete, invite.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, invite.guild.id, "logging_invite_deleted"), color=discord.Color.red())
 
         embed.add_field(name=trl(0, invite.guild.id, "logging_code"), value=invite.code)
         embed.add_field(name=trl(0, invite.guild.id, "logging_channel"), value=invite.channel.mention)
         embed.add_field(name=trl(0, invite.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, invite.guild.id, "logging_unknown_member"))
-        await log_into_logs(invite.guild, embed)
+        await log_into_logs(invite.guild, embed, event="invite_delete", users=[moderator])
 
     @discord.Cog.listener()
     async def on_member_join(self, member: discord.Member):
+        if is_raid_lockdown(member.guild.id):
+            return  # AntiRaid logs lockdown summaries instead
+
         embed = discord.Embed(title=trl(0, member.guild.id, "logging_member_join_title"), description=trl(0, member.guild.id, "logging_member_join_description").format(mention=member.mention),
                               color=discord.Color.green())
         embed.add_field(name=trl(0, member.guild.id, "logging_user"), value=member.mention)
-        await log_into_logs(member.guild, embed)
+        await log_into_logs(member.guild, embed, event="member_join", users=[member])
 
     @discord.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
+        if is_raid_lockdown(member.guild.id):
+            return
+
         embed = discord.Embed(title=trl(0, member.guild.id, "logging_member_leave_title"), description=trl(0, member.guild.id, "logging_member_leave_description").format(mention=member.mention),
                               color=discord.Color.red())
         embed.add_field(name=trl(0, member.guild.id, "logging_user"), value=member.mention)
-        await log_into_logs(member.guild, embed)
+        await log_into_logs(member.guild, embed, event="member_remove", users=[member])
 
     @discord.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.member_updates.push((after.guild.id, after.id), before, after)
+
+    async def log_member_update(self, before: discord.Member, after: discord.Member):
         moderator = None
-        if after.guild.me.guild_permissions.view_audit_log:
-            async for entry in after.guild.audit_logs(limit=1, action=discord.AuditLogAction.member_update):
-                if entry.target.id == after.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(after.guild, discord.AuditLogAction.member_update, after.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, after.guild.id, "logging_member_update_title"), color=discord.Color.blue())
         embed.add_field(name=trl(0, after.guild.id, "logging_user"), value=after.mention)
@@ -495,21 +529,25 @@ class Logging(discord.Cog):
 
         if len(embed.fields) > 1:
             embed.add_field(name=trl(0, after.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.guild.id, "logging_unknown_member"))
-            await log_into_logs(after.guild, embed)
+            await log_into_logs(after.guild, embed, event="member_update", users=[after, moderator])
 
     @discord.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        self.voice_updates.push((member.guild.id, member.id), before, member, after)
+
+    async def log_voice_state_update(self, before: discord.VoiceState, member: discord.Member,
+                                     after: discord.VoiceState):
         if before.channel is None and after.channel is not None:
             # joined a channel
             embed = discord.Embed(title=trl(0, member.guild.id, "logging_vc_join"),
                                   description=trl(0, member.guild.id, "logging_vc_join_description").format(mention=member.mention, channel_mention=after.channel.mention), color=discord.Color.green())
-            await log_into_logs(member.guild, embed)
+            await log_into_logs(member.guild, embed, event="voice_state_update", users=[member])
 
         if before.channel is not None and after.channel is None:
             # left a channel
             embed = discord.Embed(title=trl(0, member.guild.id, "logging_vc_leave"),
                                   description=trl(0, member.guild.id, "logging_vc_leave_description").format(mention=member.mention, channel_mention=before.channel.mention), color=discord.Color.red())
-            await log_into_logs(member.guild, embed)
+            await log_into_logs(member.guild, embed, event="voice_state_update", users=[member])
 
         if before.channel is not None and after.channel is not None:
             # moved to a different channel or was muted/deafened by admin
@@ -517,16 +555,14 @@ class Logging(discord.Cog):
                 embed = discord.Embed(title=trl(0, member.guild.id, "logging_vc_move"),
                                       description=trl(0, member.guild.id, "logging_vc_move_description").format(mention=member.mention, previous=before.channel.mention, current=after.channel.mention),
                                       color=discord.Color.blue())
-                await log_into_logs(member.guild, embed)
+                await log_into_logs(member.guild, embed, event="voice_state_update", users=[member])
                 return
 
             if before.mute != after.mute:
                 mod = None
-                if member.guild.me.guild_permissions.view_audit_log:
-                    async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.member_update):
-                        if entry.target.id == member.id:
-                            mod = entry.user
-                            break
+                entry = await find_audit_log_entry(member.guild, discord.AuditLogAction.member_update, member.id)
+                if entry is not None:
+                    mod = entry.user
 
                 embed = discord.Embed(title=trl(0, member.guild.id, "logging_vc_server_mute"), color=discord.Color.blue())
 
@@ -537,15 +573,13 @@ class Logging(discord.Cog):
 
                 if mod:
                     embed.add_field(name=trl(0, member.guild.id, "logging_moderator"), value=mod.mention)
-                await log_into_logs(member.guild, embed)
+                await log_into_logs(member.guild, embed, event="voice_state_update", users=[member, mod])
 
             if before.deaf != after.deaf:
                 mod = None
-                if member.guild.me.guild_permissions.view_audit_log:
-                    async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.member_update):
-                        if entry.target.id == member.id:
-                            mod = entry.user
-                            break
+                entry = await find_audit_log_entry(member.guild, discord.AuditLogAction.member_update, member.id)
+                if entry is not None:
+                    mod = entry.user
 
                 embed = discord.Embed(title=trl(0, member.guild.id, "logging_vc_server_deafen"), color=discord.Color.blue())
 
@@ -556,7 +590,7 @@ class Logging(discord.Cog):
 
                 if mod:
                     embed.add_field(name=trl(0, member.guild.id, "logging_moderator"), value=mod.mention)
-                await log_into_logs(member.guild, embed)
+                await log_into_logs(member.guild, embed, event="voice_state_update", users=[member, mod])
 
     @discord.Cog.listener()
     async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
@@ -564,7 +598,7 @@ class Logging(discord.Cog):
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_message"), value=f"[jump](<{reaction.message.jump_url}>)")
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_emoji"), value=str(reaction.emoji))
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_user"), value=user.mention)
-        await log_into_logs(reaction.message.guild, embed)
+        await log_into_logs(reaction.message.guild, embed, event="reaction_add", users=[user])
 
     @discord.Cog.listener()
     async def on_reaction_remove(self, reaction: discord.Reaction, user: discord.User):
@@ -572,7 +606,7 @@ class Logging(discord.Cog):
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_message"), value=f"[jump](<{reaction.message.jump_url}>)")
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_emoji"), value=str(reaction.emoji))
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_user"), value=user.mention)
-        await log_into_logs(reaction.message.guild, embed)
+        await log_into_logs(reaction.message.guild, embed, event="reaction_remove", users=[user])
 
     @discord.Cog.listener()
     async def on_reaction_clear(self, message: discord.Message, reactions: list[discord.Reaction]):
@@ -580,21 +614,21 @@ class Logging(discord.Cog):
             return
         embed = discord.Embed(title=trl(0, message.guild.id, "logging_reactions_clear_all"), color=discord.Color.red())
         embed.add_field(name=trl(0, message.guild.id, "logging_message"), value=reactions[0].message.jump_url)
-        await log_into_logs(message.guild, embed)
+        await log_into_logs(message.guild, embed, event="reaction_clear", users=[message.author])
 
     @discord.Cog.listener()
     async def on_reaction_clear_emoji(self, reaction: discord.Reaction):
         embed = discord.Embed(title=trl(0, reaction.message.guild.id, "logging_reactions_clear"), color=discord.Color.red())
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_message"), value=reaction.message.jump_url)
         embed.add_field(name=trl(0, reaction.message.guild.id, "logging_emoji"), value=str(reaction.emoji))
-        await log_into_logs(reaction.message.guild, embed)
+        await log_into_logs(reaction.message.guild, embed, event="reaction_clear_emoji", users=[reaction.message.author])
 
     @discord.Cog.listener()
     async def on_scheduled_event_create(self, event: discord.ScheduledEvent):
         moderator = None
-        if event.guild.me.guild_permissions.view_audit_log:
-            async for entry in event.guild.audit_logs(limit=1, action=discord.AuditLogAction.scheduled_event_create):
-                moderator = entry.user
+        entry = await find_audit_log_entry(event.guild, discord.AuditLogAction.scheduled_event_create, event.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, event.guild.id, "logging_scheduled_event_create"), color=discord.Color.green())
         embed.add_field(name=trl(0, event.guild.id, "logging_name"), value=event.name)
@@ -603,14 +637,14 @@ class Logging(discord.Cog):
         embed.add_field(name=trl(0, event.guild.id, "logging_start"), value=event.start_time.strftime("%Y/%m/%d %H:%M:%S"))
         embed.add_field(name=trl(0, event.guild.id, "logging_end"), value=event.end_time.strftime("%Y/%m/%d %H:%M:%S"))
         embed.add_field(name=trl(0, event.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, event.guild.id, "logging_unknown_member"))
-        await log_into_logs(event.guild, embed)
+        await log_into_logs(event.guild, embed, event="scheduled_event_create", users=[moderator])
 
     @discord.Cog.listener()
     async def on_scheduled_event_update(self, before: discord.ScheduledEvent, after: discord.ScheduledEvent):
         moderator = None
-        if after.guild.me.guild_permissions.view_audit_log:
-            async for entry in after.guild.audit_logs(limit=1, action=discord.AuditLogAction.scheduled_event_update):
-                moderator = entry.user
+        entry = await find_audit_log_entry(after.guild, discord.AuditLogAction.scheduled_event_update, after.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, after.guild.id, "logging_scheduled_event_update"), color=discord.Color.blue())
         if before.name != after.name:
@@ -625,14 +659,14 @@ class Logging(discord.Cog):
             embed.add_field(name=trl(0, after.guild.id, "logging_end"), value=f'{before.end_time.strftime("%Y/%m/%d %H:%M:%S")} -> {after.end_time.strftime("%Y/%m/%d %H:%M:%S")}')
         if len(embed.fields) > 0:
             embed.add_field(name=trl(0, after.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.guild.id, "logging_unknown_member"))
-            await log_into_logs(after.guild, embed)
+            await log_into_logs(after.guild, embed, event="scheduled_event_update", users=[moderator])
 
     @discord.Cog.listener()
     async def on_scheduled_event_delete(self, event: discord.ScheduledEvent):
         moderator = None
-        if event.guild.me.guild_permissions.view_audit_log:
-            async for entry in event.guild.audit_logs(limit=1, action=discord.AuditLogAction.scheduled_event_delete):
-                moderator = entry.user
+        entry = await find_audit_log_entry(event.guild, discord.AuditLogAction.scheduled_event_delete, event.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, event.guild.id, "logging_scheduled_event_delete"), color=discord.Color.red())
         embed.add_field(name=trl(0, event.guild.id, "logging_name"), value=event.name)
@@ -641,43 +675,41 @@ class Logging(discord.Cog):
         embed.add_field(name=trl(0, event.guild.id, "logging_start"), value=event.start_time.strftime("%Y/%m/%d %H:%M:%S"))
         embed.add_field(name=trl(0, event.guild.id, "logging_end"), value=event.end_time.strftime("%Y/%m/%d %H:%M:%S"))
         embed.add_field(name=trl(0, event.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, event.guild.id, "logging_unknown_member"))
-        await log_into_logs(event.guild, embed)
+        await log_into_logs(event.guild, embed, event="scheduled_event_delete", users=[moderator])
 
     @discord.Cog.listener()
     async def on_thread_create(self, thread: discord.Thread):
         moderator = None
-        if thread.guild.me.guild_permissions.view_audit_log:
-            async for entry in thread.guild.audit_logs(limit=1, action=discord.AuditLogAction.thread_create):
-                if entry.target.id == thread.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(thread.guild, discord.AuditLogAction.thread_create, thread.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, thread.guild.id, "logging_thread_create"), description=trl(0, thread.guild.id, "logging_thread_create_description").format(name=thread.name),
                               color=discord.Color.green())
         embed.add_field(name=trl(0, thread.guild.id, "logging_jump_to_thread"), value=f"[jump](<{thread.jump_url}>)")
         embed.add_field(name=trl(0, thread.guild.id, "logging_name"), value=thread.name)
         embed.add_field(name=trl(0, thread.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, thread.guild.id, "logging_unknown_member"))
-        await log_into_logs(thread.guild, embed)
+        await log_into_logs(thread.guild, embed, event="thread_create", users=[moderator])
 
     @discord.Cog.listener()
     async def on_thread_delete(self, thread: discord.Thread):
         moderator = None
-        if thread.guild.me.guild_permissions.view_audit_log:
-            async for entry in thread.guild.audit_logs(limit=1, action=discord.AuditLogAction.thread_delete):
-                if entry.target.id == thread.id:
-                    moderator = entry.user
+        entry = await find_audit_log_entry(thread.guild, discord.AuditLogAction.thread_delete, thread.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, thread.guild.id, "logging_thread_delete"), description=trl(0, thread.guild.id, "logging_thread_delete_description").format(name=thread.name),
                               color=discord.Color.red())
         embed.add_field(name=trl(0, thread.guild.id, "logging_name"), value=thread.name)
         embed.add_field(name=trl(0, thread.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, thread.guild.id, "logging_unknown_member"))
-        await log_into_logs(thread.guild, embed)
+        await log_into_logs(thread.guild, embed, event="thread_delete", users=[moderator])
 
     @discord.Cog.listener()
     async def on_thread_update(self, before: discord.Thread, after: discord.Thread):
-        if before.guild.me.guild_permissions.view_audit_log:
-            async for entry in before.guild.audit_logs(limit=1, action=discord.AuditLogAction.thread_update):
-                if entry.target.id == after.id:
-                    moderator = entry.user
+        moderator = None
+        entry = await find_audit_log_entry(before.guild, discord.AuditLogAction.thread_update, after.id)
+        if entry is not None:
+            moderator = entry.user
 
         embed = discord.Embed(title=trl(0, after.guild.id, "logging_thread_update"), color=discord.Color.blue())
 
@@ -690,7 +722,7 @@ class Logging(discord.Cog):
         if len(embed.fields) > 0:
             embed.add_field(name=trl(0, after.guild.id, "logging_jump_to_thread"), value=f"[jump](<{after.jump_url}>)")
             embed.add_field(name=trl(0, after.guild.id, "logging_moderator"), value=moderator.mention if moderator else trl(0, after.guild.id, "logging_unknown_member"))
-            await log_into_logs(after.guild, embed)
+            await log_into_logs(after.guild, embed, event="thread_update", users=[moderator])
 
     logging_subcommand = discord.SlashCommandGroup(name='logging', description='Logging settings')
 
@@ -729,7 +761,48 @@ class Logging(discord.Cog):
             logging_embed.add_field(name=trl(ctx.user.id, ctx.guild.id, "logging_set_channel_previous"), value=f"{old_channel.mention}")
 
         # Send into logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "logging_set_channel_success").format(channel=channel.mention), ephemeral=True)
+
+    @logging_subcommand.command(name="search", description="Search the logs of this server")
+    @discord.default_permissions(manage_guild=True)
+    @commands_ext.has_permissions(manage_guild=True)
+    @commands_ext.guild_only()
+    @discord.option(name="user", description="Only logs involving this user", required=False)
+    @discord.option(name="event", description="Only logs of this event", required=False,
+                    autocomplete=discord.utils.basic_autocomplete(LOG_EVENTS))
+    @discord.option(name="days", description="How many days back to search", min_value=1, max_value=365,
+                    required=False)
+    @discord.option(name="page", description="Page of the results", min_value=1, required=False)
+    async def search_logs(self, ctx: discord.ApplicationContext, user: discord.User = None, event: str = None,
+                          days: int = 7, page: int = 1):
+        where = 'WHERE guild_id = ? AND user_id = ? AND time >= ?'
+        params = [ctx.guild.id, user.id if user is not None else ANY_USER, int(time.time()) - days * 86400]
+        if event:
+            where += ' AND event = ?'
+            params.append(event)
+
+        total = (await db_fetchone(f'SELECT COUNT(*) FROM log_archive {where}', tuple(params)))[0]
+        locations = await db_fetchall(f'SELECT segment, offset FROM log_archive {where} '
+                                      f'ORDER BY time DESC, segment DESC, offset DESC LIMIT ? OFFSET ?',
+                                      tuple(params + [LOG_SEARCH_PAGE_SIZE, (page - 1) * LOG_SEARCH_PAGE_SIZE]))
+        if not locations:
+            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "logging_search_empty"), ephemeral=True)
+            return
+
+        embeds = []
+        size = 0
+        for entry in await asyncio.to_thread(read_archived_entries, locations):
+            embed = discord.Embed.from_dict(entry['embed'])
+            embed.timestamp = datetime.datetime.fromtimestamp(entry['time'], datetime.timezone.utc)
+
+            size += len(embed)
+            if size > EMBED_CHARACTERS_PER_MESSAGE:
+                break
+            embeds.append(embed)
+
+        start = (page - 1) * LOG_SEARCH_PAGE_SIZE + 1
+        await ctx.respond(trl(ctx.user.id, ctx.guild.id, "logging_search_results").format(
+            start=start, end=start + len(embeds) - 1, total=total), embeds=embeds, ephemeral=True)
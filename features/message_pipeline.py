@@ -0,0 +1,15 @@
+import discord
+
+from utils.message_pipeline import run_message_pipeline
+
+
+class MessagePipeline(discord.Cog):
+    """The only on_message listener of the message features, they register stages with register_message_stage"""
+
+    def __init__(self, bot: discord.Bot) -> None:
+        super().__init__()
+        self.bot = bot
+
+    @discord.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        await run_message_pipeline(message)
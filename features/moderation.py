@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 
 import discord
@@ -17,6 +18,13 @@ from utils.warning import add_warning, db_get_warning_actions, db_add_warning_ac
     db_remove_warning_action, db_remove_warning
 
 
+# Messages per bulk delete request, the most Discord allows
+PURGE_CHUNK_SIZE = 100
+
+# Purges of at least this many messages report their progress
+PURGE_PROGRESS_MIN_AMOUNT = 500
+
+
 def db_init():
     cur = conn.cursor()
     cur.execute(
@@ -32,14 +40,29 @@ def db_init():
     conn.commit()
 
 
+# guild_id -> moderator role IDs
+_moderator_roles: dict[int, frozenset[int]] = {}
+
+
+def get_moderator_roles(guild_id: int) -> frozenset[int]:
+    roles = _moderator_roles.get(guild_id)
+    if roles is None:
+        cur = conn.cursor()
+        cur.execute('SELECT role_id FROM moderator_roles WHERE guild_id = ?', (guild_id,))
+        roles = _moderator_roles[guild_id] = frozenset(row[0] for row in cur.fetchall())
+        cur.close()
+    return roles
+
+
+def invalidate_moderator_roles(guild_id: int):
+    _moderator_roles.pop(guild_id, None)
+
+
 def is_a_moderator(ctx: discord.ApplicationContext):
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM moderator_roles WHERE guild_id = ?', (ctx.guild.id,))
-    roles = cur.fetchall()
-    for role in roles:
-        if role[2] in [role.id for role in ctx.user.roles]:
-            return True
-    return False
+    moderator_roles = get_moderator_roles(ctx.guild.id)
+    if not moderator_roles:
+        return False
+    return not moderator_roles.isdisjoint(role.id for role in ctx.user.roles)
 
 
 class Moderation(discord.Cog):
@@ -48,6 +71,18 @@ class Moderation(discord.Cog):
 
         db_init()
 
+    @discord.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if role.id not in get_moderator_roles(role.guild.id):
+            return
+
+        cur = conn.cursor()
+        cur.execute('DELETE FROM moderator_roles WHERE guild_id = ? AND role_id = ?', (role.guild.id, role.id))
+        conn.commit()
+        cur.close()
+
+        invalidate_moderator_roles(role.guild.id)
+
     moderation_subcommand = discord.SlashCommandGroup(name='moderation', description='Moderation commands')
 
     @discord.slash_command(name='kick', description='Kick a user from the server')
@@ -268,29 +303,55 @@ class Moderation(discord.Cog):
 
         ephemerality = get_setting(ctx.guild.id, "moderation_ephemeral", "true")
         await ctx.defer(ephemeral=ephemerality == "true")
-        if amount > int(get_key("Moderation_MaxPurge", "1000")):
-            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "moderation_purge_max_messages").format(amount),
+        max_purge = int(get_key("Moderation_MaxPurge", "1000"))
+        if amount > max_purge:
+            await ctx.respond(trl(ctx.user.id, ctx.guild.id, "moderation_purge_max_messages").format(amount=max_purge),
                               ephemeral=True)
             return
 
-        messages = []
+        # Messages older than 14 days can't be bulk deleted. History is newest first, so the scan stops at the first one.
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=14)
+
+        deleted = 0
+        chunk = []
+        pending_delete = None  # The next page is fetched while the previous chunk is being deleted
         async for message in ctx.channel.history(limit=amount):
+            if message.created_at <= cutoff:
+                break
+            if message.interaction is not None and message.interaction.id == ctx.interaction.id:
+                continue  # The response to this command
             if include_user and message.author != include_user:
                 continue
             if exclude_user and message.author == exclude_user:
                 continue
-            if (datetime.datetime.now(datetime.UTC) - message.created_at).total_seconds() >= 1209600:
+
+            chunk.append(message)
+            if len(chunk) < PURGE_CHUNK_SIZE:
                 continue
-            messages.append(message)
 
-        chunks = [messages[i:i + 100] for i in range(0, len(messages), 100)]
-        for chunk in chunks:
-            await ctx.channel.delete_messages(chunk)
+            if pending_delete is not None:
+                deleted += await pending_delete
+                if amount >= PURGE_PROGRESS_MIN_AMOUNT:
+                    await ctx.edit(content=trl(ctx.user.id, ctx.guild.id, "moderation_purge_progress").format(
+                        messages=deleted, amount=amount))
+
+            pending_delete = asyncio.create_task(self.delete_purge_chunk(ctx.channel, chunk))
+            chunk = []
+
+        if pending_delete is not None:
+            deleted += await pending_delete
+        if chunk:
+            deleted += await self.delete_purge_chunk(ctx.channel, chunk)
 
         await ctx.respond(
-            trl(ctx.user.id, ctx.guild.id, "moderation_purge_response", append_tip=True).format(messages=str(len(messages))),
+            trl(ctx.user.id, ctx.guild.id, "moderation_purge_response", append_tip=True).format(messages=str(deleted)),
             ephemeral=True)
 
+    @staticmethod
+    async def delete_purge_chunk(channel: discord.TextChannel, chunk: list[discord.Message]) -> int:
+        await channel.delete_messages(chunk)
+        return len(chunk)
+
     warning_group = discord.SlashCommandGroup(name='warn', description='Warning commands')
 
     @warning_group.command(name='add', description='Add a warning to a user')
@@ -390,7 +451,7 @@ class Moderation(discord.Cog):
                                 value=f'{old_warning_message} -> {message}')
 
         # Log the change
-        await log_into_logs(ctx.guild, log_embed)
+        await log_into_logs(ctx.guild, log_embed, users=[ctx.user])
 
         # Set settings
         set_setting(ctx.guild.id, 'send_warning_message', str(enable).lower())
@@ -496,6 +557,8 @@ class Moderation(discord.Cog):
         conn.commit()
         cur.close()
 
+        invalidate_moderator_roles(ctx.guild.id)
+
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "moderation_add_moderator_role_response").format(role=role.mention), ephemeral=True)
 
     @moderation_subcommand.command(name='remove_moderator_role', description='Remove a moderator role from the server')
@@ -513,6 +576,8 @@ class Moderation(discord.Cog):
         conn.commit()
         cur.close()
 
+        invalidate_moderator_roles(ctx.guild.id)
+
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "moderation_remove_moderator_role_response").format(role=role.mention), ephemeral=True)
 
     @moderation_subcommand.command(name='list_moderator_roles', description='List all moderator roles on the server')
@@ -3,6 +3,7 @@ import discord
 from database import conn
 from utils.analytics import analytics
 from utils.languages import get_translation_for_key_localized as trl
+from utils.raid_lockdown import is_raid_lockdown
 
 
 class RolesOnJoin(discord.Cog):
@@ -16,6 +17,9 @@ class RolesOnJoin(discord.Cog):
 
     @discord.Cog.listener()
     async def on_member_join(self, member: discord.Member):
+        if is_raid_lockdown(member.guild.id):
+            return  # Joiners are being kicked
+
         cur = conn.cursor()
         cur.execute("SELECT role_id FROM roles_on_join WHERE guild_id=?", (member.guild.id,))
         rows = cur.fetchall()
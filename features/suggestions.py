@@ -2,8 +2,10 @@ import discord
 from discord.ext import commands
 
 from database import conn
+from utils.channel_features import add_channel_feature, remove_channel_feature, set_feature_channels
 from utils.languages import get_translation_for_key_localized as trl
-from utils.settings import get_setting, set_setting
+from utils.message_pipeline import MessageContext, register_message_stage
+from utils.settings import set_setting
 
 
 class Suggestions(discord.Cog):
@@ -12,18 +14,18 @@ class Suggestions(discord.Cog):
 
         cur = conn.cursor()
         cur.execute('create table if not exists suggestion_channels(id integer primary key, channel_id text)')
+        cur.execute('select channel_id from suggestion_channels')
+        set_feature_channels("suggestions", [i[0] for i in cur.fetchall()])
         cur.close()
         conn.commit()
 
-    @discord.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
+        register_message_stage("suggestions", self.on_pipeline_message)
 
-        cur = conn.cursor()
-        cur.execute('select * from suggestion_channels where channel_id = ?', (message.channel.id,))
-        if cur.fetchone():
-            emojis = get_setting(message.guild.id, 'suggestion_emoji', '👍👎')
+    async def on_pipeline_message(self, ctx: MessageContext):
+        message = ctx.message
+
+        if "suggestions" in ctx.channel_features:
+            emojis = ctx.get_setting('suggestion_emoji', '👍👎')
             if emojis == '👍👎':
                 await message.add_reaction('👍')
                 await message.add_reaction('👎')
@@ -31,9 +33,8 @@ class Suggestions(discord.Cog):
                 await message.add_reaction('✅')
                 await message.add_reaction('❌')
 
-        cur.close()
-        if get_setting(message.guild.id, "suggestion_reminder_enabled", "false") == "true":
-            to_send = get_setting(message.guild.id, "suggestion_reminder_message", "")
+        if ctx.get_setting("suggestion_reminder_enabled", "false") == "true":
+            to_send = ctx.get_setting("suggestion_reminder_message", "")
             sent = await message.reply(to_send)
             await sent.delete(delay=5)
 
@@ -46,7 +47,7 @@ class Suggestions(discord.Cog):
     async def cmd_add_channel(self, ctx: discord.ApplicationContext, channel: discord.TextChannel):
         cur = conn.cursor()
 
-        cur.execute('select * from suggestion_channels where id = ?', (channel.id,))
+        cur.execute('select * from suggestion_channels where channel_id = ?', (channel.id,))
         if cur.fetchone():
             await ctx.respond(trl(ctx.user.id, ctx.guild.id, 'suggestions_channel_already_exists'), ephemeral=True)
             cur.close()
@@ -56,6 +57,8 @@ class Suggestions(discord.Cog):
         cur.close()
         conn.commit()
 
+        add_channel_feature(channel.id, "suggestions")
+
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, 'suggestions_channel_added', append_tip=True).format(channel=channel.mention), ephemeral=True)
 
     @suggestions_group.command(name='remove_channel', description='Remove a suggestion channel')
@@ -64,16 +67,18 @@ class Suggestions(discord.Cog):
     @commands.has_permissions(manage_guild=True)
     async def cmd_remove_channel(self, ctx: discord.ApplicationContext, channel: discord.TextChannel):
         cur = conn.cursor()
-        cur.execute('select * from suggestion_channels where id = ?', (channel.id,))
+        cur.execute('select * from suggestion_channels where channel_id = ?', (channel.id,))
         if not cur.fetchone():
             await ctx.respond(trl(ctx.user.id, ctx.guild.id, "suggestions_channel_not_found"), ephemeral=True)
             cur.close()
             return
 
-        cur.execute('delete from suggestion_channels where id = ?', (channel.id,))
+        cur.execute('delete from suggestion_channels where channel_id = ?', (channel.id,))
         cur.close()
         conn.commit()
 
+        remove_channel_feature(channel.id, "suggestions")
+
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "suggestions_channel_removed", append_tip=True).format(channel=channel.mention), ephemeral=True)
 
     @suggestions_group.command(name='emoji', description='Choose emoji')
@@ -4,6 +4,9 @@ import discord
 from discord.ext import commands, tasks
 
 from database import conn
+from utils.channel_features import add_channel_feature, has_channel_feature, remove_channel_feature, \
+    set_feature_channels
+from utils.message_pipeline import MessageContext, register_message_stage
 from utils.settings import set_setting, get_setting
 from utils.tzutil import get_now_for_server
 
@@ -27,6 +30,17 @@ def db_init():
     conn.commit()
 
 
+def db_load_ticket_channels():
+    """Load ticket channels into the channel feature registry, archived tickets also get "ticket_archived"."""
+    cur = conn.cursor()
+    cur.execute("select ticket_channel_id, atime from tickets")
+    tickets = cur.fetchall()
+    cur.close()
+
+    set_feature_channels("ticket", [i[0] for i in tickets])
+    set_feature_channels("ticket_archived", [i[0] for i in tickets if i[1] != "None"])
+
+
 def db_add_ticket_channel(guild_id: int, ticket_category: int, user_id: int):
     cur = conn.cursor()
     cur.execute("insert into tickets(guild_id, ticket_channel_id, user_id, mtime, atime) values (?, ?, ?, ?, ?)",
@@ -34,6 +48,8 @@ def db_add_ticket_channel(guild_id: int, ticket_category: int, user_id: int):
     cur.close()
     conn.commit()
 
+    add_channel_feature(ticket_category, "ticket")
+
 
 def db_is_ticket_channel(guild_id: int, ticket_channel_id: int):
     cur = conn.cursor()
@@ -58,6 +74,9 @@ def db_remove_ticket_channel(guild_id: int, ticket_channel_id: int):
     cur.close()
     conn.commit()
 
+    remove_channel_feature(ticket_channel_id, "ticket")
+    remove_channel_feature(ticket_channel_id, "ticket_archived")
+
 
 def db_update_mtime(guild_id: int, ticket_channel_id: int):
     cur = conn.cursor()
@@ -126,6 +145,8 @@ def db_archive_ticket(guild_id: int, ticket_channel_id: int):
     cur.close()
     conn.commit()
 
+    add_channel_feature(ticket_channel_id, "ticket_archived")
+
 
 def db_list_archived_tickets():
     """
@@ -227,6 +248,9 @@ class Tickets(discord.Cog):
     def __init__(self, bot: discord.Bot):
         self.bot = bot
         db_init()
+        db_load_ticket_channels()
+
+        register_message_stage("tickets", self.on_pipeline_message)
 
     tickets_commands = discord.SlashCommandGroup(name="tickets", description="Manage tickets")
 
@@ -235,15 +259,11 @@ class Tickets(discord.Cog):
         self.handle_hiding.start()
         self.handle_auto_archive.start()
 
-    @discord.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-
-        if not db_is_ticket_channel(message.guild.id, message.channel.id):
-            return
+    async def on_pipeline_message(self, ctx: MessageContext):
+        message = ctx.message
 
-        if db_is_archived(message.guild.id, message.channel.id):
+        features = ctx.channel_features
+        if "ticket" not in features or "ticket_archived" in features:
             return
 
         db_update_mtime(message.guild.id, message.channel.id)
@@ -253,7 +273,7 @@ class Tickets(discord.Cog):
         if after.author.bot:
             return
 
-        if not db_is_ticket_channel(after.guild.id, after.channel.id):
+        if after.guild is None or not has_channel_feature(after.channel.id, "ticket"):
             return
 
         db_update_mtime(after.guild.id, after.channel.id)
@@ -263,10 +283,8 @@ class Tickets(discord.Cog):
         if user.bot:
             return
 
-        if not db_is_ticket_channel(reaction.message.guild.id, reaction.message.channel.id):
-            return
-
-        if db_is_archived(reaction.message.guild.id, reaction.message.channel.id):
+        channel_id = reaction.message.channel.id
+        if not has_channel_feature(channel_id, "ticket") or has_channel_feature(channel_id, "ticket_archived"):
             return
 
         db_update_mtime(reaction.message.guild.id, reaction.message.channel.id)
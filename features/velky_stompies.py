@@ -29,7 +29,7 @@ class VelkyStompies(discord.Cog):
             logging_embed.add_field(name="Value",
                                     value=f'{"Enabled" if old_value else "Disabled"} -> {"Enabled" if enabled else "Disabled"}')
 
-            await log_into_logs(ctx.guild, logging_embed)
+            await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         set_setting(ctx.guild.id, 'stompies_enabled', str(enabled))
 
@@ -319,7 +319,7 @@ class Verification(discord.Cog):
                                 value=f"{old_difficulty} -> {difficulty}")
 
         # Send to logs
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(
@@ -1,77 +1,170 @@
+import asyncio
+import logging
+import re
+
 import discord
+import sentry_sdk
 from discord.ext import commands as commands_ext
 
 from utils.analytics import analytics
 from utils.languages import get_translation_for_key_localized as trl
 from utils.logging_util import log_into_logs
+from utils.raid_lockdown import is_raid_lockdown
 from utils.settings import get_setting, set_setting
 
+# Members named in a coalesced message, the rest are counted as "and N others"
+WELCOME_BATCH_NAMES = 10
+
+# Discord rejects embeds with longer titles
+EMBED_TITLE_LIMIT = 256
+
+# kind -> (default title, default text, embed color)
+GREETING_DEFAULTS = {
+    'welcome': ('Welcome', 'Welcome {user} to {server}!', discord.Color.green()),
+    'goodbye': ('Goodbye', 'Goodbye {user}!', discord.Color.red()),
+}
+
+_placeholder_pattern = re.compile(r'(\{user}|\{server}|\{memberCount}|\{mention})')
+
+# (guild_id, kind) -> (title setting, text setting, compiled title, compiled text)
+_compiled_templates: dict[tuple[int, str], tuple[str, str, list[str], list[str]]] = {}
+
+
+def compile_template(template: str) -> list[str]:
+    """Split a template into literal text and placeholders, placeholders are at odd indexes"""
+    return _placeholder_pattern.split(template)
+
+
+def render_template(compiled: list[str], values: dict[str, str]) -> str:
+    return ''.join(part if i % 2 == 0 else values[part] for i, part in enumerate(compiled))
+
+
+def get_compiled_templates(guild_id: int, kind: str) -> tuple[list[str], list[str]]:
+    """Get the compiled title and text of a greeting, they are compiled again only when the settings change
+
+    Args:
+        guild_id (int): Guild ID
+        kind (str): "welcome" or "goodbye"
+
+    Returns:
+        tuple: (compiled title, compiled text)
+    """
+    default_title, default_text, _ = GREETING_DEFAULTS[kind]
+    title = get_setting(guild_id, f'{kind}_title', default_title)
+    text = get_setting(guild_id, f'{kind}_text', default_text)
+
+    compiled = _compiled_templates.get((guild_id, kind))
+    if compiled is None or compiled[0] != title or compiled[1] != text:
+        compiled = _compiled_templates[(guild_id, kind)] = (title, text, compile_template(title),
+                                                             compile_template(text))
+
+    return compiled[2], compiled[3]
+
+
+def truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def join_names(guild_id: int, names: list[str], total: int) -> str:
+    """Join names like "A, B and C", or "A, B, C and 12 others" when only some of the members are named"""
+    if total > len(names):
+        return trl(0, guild_id, "welcome_batch_others").format(names=', '.join(names), count=total - len(names))
+    if len(names) == 1:
+        return names[0]
+    return trl(0, guild_id, "welcome_batch_and").format(names=', '.join(names[:-1]), last=names[-1])
+
 
 class Welcoming(discord.Cog):
     def __init__(self, bot: discord.Bot) -> None:
         self.bot = bot
 
-    @discord.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
-        target_channel_id = get_setting(member.guild.id, 'welcome_channel', '0')
-        if target_channel_id == '0':
-            return  # The channel was not set and was initialised as we just ran this
-        message_type = get_setting(member.guild.id, 'welcome_type', 'embed')  # embed or text
-        message_title = get_setting(member.guild.id, 'welcome_title', 'Welcome')  # embed title (if type is embed)
-        message_text = get_setting(member.guild.id, 'welcome_text',
-                                   'Welcome {user} to {server}!')  # text of the message or description of embed
-
-        target_channel = member.guild.get_channel(int(target_channel_id))
+        # (guild_id, kind) -> members waiting for a coalesced message
+        self.pending: dict[tuple[int, str], list[discord.Member]] = {}
+
+        # Running flush_greeting_later tasks, the event loop only keeps weak references to them
+        self.flush_tasks: set[asyncio.Task] = set()
+
+    async def greet(self, member: discord.Member, kind: str):
+        if get_setting(member.guild.id, f'{kind}_channel', '0') == '0':
+            return  # The channel was not set
+
+        seconds = int(get_setting(member.guild.id, f'{kind}_coalesce_seconds', '0'))
+        if seconds == 0:
+            await self.send_greeting(member.guild, kind, [member])
+            return
+
+        key = (member.guild.id, kind)
+        members = self.pending.get(key)
+        if members is None:
+            # First member of the window, everyone joining in the next seconds is greeted together
+            members = self.pending[key] = []
+            task = asyncio.create_task(self.flush_greeting_later(member.guild, kind, members, seconds))
+            self.flush_tasks.add(task)
+            task.add_done_callback(self.flush_task_done)
+
+        members.append(member)
+        if len(members) >= int(get_setting(member.guild.id, f'{kind}_coalesce_max', '25')):
+            await self.flush_greeting(member.guild, kind, members)
+
+    async def flush_greeting_later(self, guild: discord.Guild, kind: str, members: list[discord.Member],
+                                   seconds: int):
+        await asyncio.sleep(seconds)
+        await self.flush_greeting(guild, kind, members)
+
+    def flush_task_done(self, task: asyncio.Task):
+        self.flush_tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+
+        logging.error("Sending a coalesced greeting failed", exc_info=task.exception())
+        sentry_sdk.capture_exception(task.exception())
+
+    async def flush_greeting(self, guild: discord.Guild, kind: str, members: list[discord.Member]):
+        # The batch might have been sent already because it was full
+        if self.pending.get((guild.id, kind)) is not members:
+            return
+
+        del self.pending[(guild.id, kind)]
+        await self.send_greeting(guild, kind, members)
+
+    async def send_greeting(self, guild: discord.Guild, kind: str, members: list[discord.Member]):
+        target_channel = guild.get_channel(int(get_setting(guild.id, f'{kind}_channel', '0')))
         if target_channel is None:
             return  # Cannot find channel, don't do any further actions
 
-        message_title = message_title.replace('{user}', member.display_name)
-        message_title = message_title.replace('{server}', member.guild.name)
-        message_title = message_title.replace('{memberCount}', str(member.guild.member_count))
-        message_title = message_title.replace('{mention}', member.mention)
+        message_type = get_setting(guild.id, f'{kind}_type', 'embed')  # embed or text
+        title, text = get_compiled_templates(guild.id, kind)
 
-        message_text = message_text.replace('{user}', member.display_name)
-        message_text = message_text.replace('{server}', member.guild.name)
-        message_text = message_text.replace('{memberCount}', str(member.guild.member_count))
-        message_text = message_text.replace('{mention}', member.mention)
+        named = members[:WELCOME_BATCH_NAMES]
+        values = {
+            '{user}': join_names(guild.id, [m.display_name for m in named], len(members)),
+            '{server}': guild.name,
+            '{memberCount}': str(guild.member_count),
+            '{mention}': join_names(guild.id, [m.mention for m in named], len(members)),
+        }
 
         if message_type == 'embed':
-            embed = discord.Embed(title=message_title, description=message_text,
-                                  color=discord.Color.green())  # Create the embed
+            # Many names in a coalesced title could go over the title limit
+            embed = discord.Embed(title=truncate(render_template(title, values), EMBED_TITLE_LIMIT),
+                                  description=render_template(text, values),
+                                  color=GREETING_DEFAULTS[kind][2])  # Create the embed
             await target_channel.send(embed=embed)  # Send it in the welcoming channel
         if message_type == 'text':
-            await target_channel.send(content=message_text)  # Send it as text only
+            await target_channel.send(content=render_template(text, values))  # Send it as text only
 
     @discord.Cog.listener()
-    async def on_member_remove(self, member: discord.Member):
-        target_channel_id = get_setting(member.guild.id, 'goodbye_channel', '0')
-        if target_channel_id == '0':
-            return  # The channel was not set and was initialised as we just ran this
-        message_type = get_setting(member.guild.id, 'goodbye_type', 'embed')  # embed or text
-        message_title = get_setting(member.guild.id, 'goodbye_title', 'Goodbye')  # embed title (if type is embed)
-        message_text = get_setting(member.guild.id, 'goodbye_text',
-                                   'Goodbye {user}!')  # text of the message or description of embed
-
-        target_channel = member.guild.get_channel(int(target_channel_id))
-        if target_channel is None:
-            return  # Cannot find channel, don't do any further actions
+    async def on_member_join(self, member: discord.Member):
+        if is_raid_lockdown(member.guild.id):
+            return  # Joiners are being kicked, AntiRaid sends summaries instead
 
-        message_title = message_title.replace('{user}', member.display_name)
-        message_title = message_title.replace('{server}', member.guild.name)
-        message_title = message_title.replace('{memberCount}', str(member.guild.member_count))
-        message_title = message_title.replace('{mention}', member.mention)
+        await self.greet(member, 'welcome')
 
-        message_text = message_text.replace('{user}', member.display_name)
-        message_text = message_text.replace('{server}', member.guild.name)
-        message_text = message_text.replace('{memberCount}', str(member.guild.member_count))
-        message_text = message_text.replace('{mention}', member.mention)
+    @discord.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        if is_raid_lockdown(member.guild.id):
+            return
 
-        if message_type == 'embed':
-            embed = discord.Embed(title=message_title, description=message_text,
-                                  color=discord.Color.red())  # Create the embed
-            await target_channel.send(embed=embed)  # Send it in the welcoming channel
-        if message_type == 'text':
-            await target_channel.send(content=message_text)  # Send it as text only
+        await self.greet(member, 'goodbye')
 
     welcome_subcommands = discord.SlashCommandGroup(name="welcome", description="Change the welcoming message")
 
@@ -119,7 +212,7 @@ class Welcoming(discord.Cog):
                                     value=f"{old_welcome_channel.mention} -> {channel.mention}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "welcome_channel_set", append_tip=True).format(channel=channel.mention),
@@ -146,7 +239,7 @@ class Welcoming(discord.Cog):
                                 value=f"{old_welcome_type} -> {message_type}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "welcome_type_set", append_tip=True).format(type=message_type), ephemeral=True)
@@ -170,7 +263,7 @@ class Welcoming(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "title"), value=f"{old_welcome_title} -> {title}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "welcome_title_set", append_tip=True).format(title=title), ephemeral=True)
@@ -194,11 +287,44 @@ class Welcoming(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_text"), value=f"{old_welcome_text} -> {text}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "welcome_text_sent", append_tip=True).format(text=text), ephemeral=True)
 
+    @welcome_subcommands.command(name='coalesce', description="Greet members joining within a few seconds in one message")
+    @discord.default_permissions(manage_guild=True)
+    @commands_ext.has_permissions(manage_guild=True)
+    @commands_ext.guild_only()
+    @discord.option(name="seconds", description="Seconds to wait for more members, 0 sends a message for every member",
+                    min_value=0, max_value=300)
+    @discord.option(name="max_members", description="Send the message early once this many members are waiting",
+                    min_value=2, max_value=100)
+    @analytics("welcome coalesce")
+    async def welcome_coalesce(self, ctx: discord.ApplicationContext, seconds: int, max_members: int):
+        # Get old settings
+        old_seconds = get_setting(ctx.guild.id, "welcome_coalesce_seconds", '0')
+        old_max_members = get_setting(ctx.guild.id, "welcome_coalesce_max", '25')
+
+        # Set new settings
+        set_setting(ctx.guild.id, 'welcome_coalesce_seconds', str(seconds))
+        set_setting(ctx.guild.id, 'welcome_coalesce_max', str(max_members))
+
+        # Logging embed
+        logging_embed = discord.Embed(title=trl(0, ctx.guild.id, "welcome_coalesce_log_title"))
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_user"), value=f"{ctx.user.mention}")
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "welcome_coalesce_seconds"),
+                                value=f"{old_seconds} -> {seconds}")
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "welcome_coalesce_max_members"),
+                                value=f"{old_max_members} -> {max_members}")
+
+        # Send log
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
+
+        # Respond
+        await ctx.respond(trl(ctx.user.id, ctx.guild.id, "welcome_coalesce_set", append_tip=True).format(
+            seconds=seconds, max_members=max_members), ephemeral=True)
+
     goodbye_subcommands = discord.SlashCommandGroup(name="goodbye", description="Change the goodbye message")
 
     @goodbye_subcommands.command(name="list", description="List the goodbye settings")
@@ -241,7 +367,7 @@ class Welcoming(discord.Cog):
                                 value=f"{old_goodbye_channel} -> {channel.mention}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "goodbye_channel_set", append_tip=True).format(channel=channel.mention),
@@ -268,7 +394,7 @@ class Welcoming(discord.Cog):
                                 value=f"{old_goodbye_type} -> {message_type}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "goodbye_type_set", append_tip=True).format(type=message_type), ephemeral=True)
@@ -292,7 +418,7 @@ class Welcoming(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "title"), value=f"{old_goodbye_title} -> {title}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "goodbye_title_set", append_tip=True).format(title=title), ephemeral=True)
@@ -316,7 +442,40 @@ class Welcoming(discord.Cog):
         logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_text"), value=f"{old_goodbye_text} -> {text}")
 
         # Send log
-        await log_into_logs(ctx.guild, logging_embed)
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
 
         # Respond
         await ctx.respond(trl(ctx.user.id, ctx.guild.id, "goodbye_text_set", append_tip=True).format(text=text), ephemeral=True)
+
+    @goodbye_subcommands.command(name='coalesce', description="Say goodbye to members leaving within a few seconds in one message")
+    @discord.default_permissions(manage_guild=True)
+    @commands_ext.has_permissions(manage_guild=True)
+    @commands_ext.guild_only()
+    @discord.option(name="seconds", description="Seconds to wait for more members, 0 sends a message for every member",
+                    min_value=0, max_value=300)
+    @discord.option(name="max_members", description="Send the message early once this many members are waiting",
+                    min_value=2, max_value=100)
+    @analytics("goodbye coalesce")
+    async def goodbye_coalesce(self, ctx: discord.ApplicationContext, seconds: int, max_members: int):
+        # Get old settings
+        old_seconds = get_setting(ctx.guild.id, "goodbye_coalesce_seconds", '0')
+        old_max_members = get_setting(ctx.guild.id, "goodbye_coalesce_max", '25')
+
+        # Set new settings
+        set_setting(ctx.guild.id, 'goodbye_coalesce_seconds', str(seconds))
+        set_setting(ctx.guild.id, 'goodbye_coalesce_max', str(max_members))
+
+        # Logging embed
+        logging_embed = discord.Embed(title=trl(0, ctx.guild.id, "goodbye_coalesce_log_title"))
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "logging_user"), value=f"{ctx.user.mention}")
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "welcome_coalesce_seconds"),
+                                value=f"{old_seconds} -> {seconds}")
+        logging_embed.add_field(name=trl(0, ctx.guild.id, "welcome_coalesce_max_members"),
+                                value=f"{old_max_members} -> {max_members}")
+
+        # Send log
+        await log_into_logs(ctx.guild, logging_embed, users=[ctx.user])
+
+        # Respond
+        await ctx.respond(trl(ctx.user.id, ctx.guild.id, "goodbye_coalesce_set", append_tip=True).format(
+            seconds=seconds, max_members=max_members), ephemeral=True)
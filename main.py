@@ -9,9 +9,12 @@ from features import welcoming, leveling, antiraid, chat_streaks, chat_revive, c
     logging_mod, admin_cmds, giveaways, feedback_cmd, moderation, cleanup_task, verification, velky_stompies, \
     roles_on_join, heartbeat, automod_actions, power_outage_announcement, per_user_settings, server_settings, \
     bot_help, announcement_channels, tickets, debug_commands, birthday_announcements, send_server_count, \
-    suggestions, temporary_vc
+    suggestions, temporary_vc, message_pipeline
+from database import db_shutdown
 from utils.config import get_key
+from utils.debouncer import flush_debouncers
 from utils.languages import get_translation_for_key_localized as trl
+from utils.logging_util import flush_log_outboxes
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,7 +33,18 @@ if get_key("Sentry_Enabled", "false") == "true":
 intents = discord.Intents.default()
 intents.members = True
 
-bot = discord.Bot(intents=intents)
+
+class Akabot(discord.Bot):
+    async def close(self):
+        # Send queued logs while the connection is still open, also runs when the bot is stopped with a signal.
+        # Debounced events are logged first so they end up in the outboxes
+        await flush_debouncers()
+        await flush_log_outboxes()
+        await super().close()
+
+
+bot = Akabot(intents=intents)
+bot.add_cog(message_pipeline.MessagePipeline(bot))
 
 
 @bot.event
@@ -138,3 +152,4 @@ if get_key('Feature_TemporaryVC', 'true') == 'true':
     bot.add_cog(temporary_vc.TemporaryVC(bot))
 
 bot.run(get_key("Bot_Token"))
+db_shutdown()
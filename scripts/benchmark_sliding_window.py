@@ -0,0 +1,44 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils.sliding_window import SlidingWindowCounter  # noqa: E402
+
+MESSAGES_PER_SECOND = 10000
+SECONDS = 30
+GUILDS = 500
+USERS_PER_GUILD = 2000
+WINDOW = 5
+
+
+class SimulatedClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+if __name__ == '__main__':
+    # Simulates the antiraid message counter at 10k messages per second, one count and one add per message.
+    # Latency per message should stay flat while the number of tracked keys settles.
+    print(f"Simulating {MESSAGES_PER_SECOND} messages/second for {SECONDS} seconds...")
+
+    clock = SimulatedClock()
+    counter = SlidingWindowCounter(clock=clock)
+    rng = random.Random(0)
+
+    for second in range(SECONDS):
+        keys = [(rng.randrange(GUILDS), rng.randrange(USERS_PER_GUILD), 'message') for _ in range(MESSAGES_PER_SECOND)]
+
+        start = time.perf_counter()
+        for i, key in enumerate(keys):
+            clock.now = second + i / MESSAGES_PER_SECOND
+            if counter.count(key) <= 5:
+                counter.add(key, WINDOW)
+        elapsed = time.perf_counter() - start
+
+        print(f"second {second:2}: {elapsed / MESSAGES_PER_SECOND * 1e6:6.2f} us/message, {len(counter)} keys")
@@ -0,0 +1,65 @@
+import json
+import sqlite3
+
+import pytest
+
+from utils.summary_counters import SummaryCounters, db_create_tables, db_load_counter, db_rollup_counts, \
+    db_write_counts
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'chat_summary.db')
+    db_create_tables(conn)
+    yield conn
+    conn.close()
+
+
+def test_remove_channel_with_pending_counts(conn):
+    conn.execute('INSERT INTO chat_summary(guild_id, channel_id, enabled, messages) VALUES (1, 10, 1, 2)')
+    counts = SummaryCounters()
+    counts.counters[10] = db_load_counter(conn, 1, 10)
+    counts.count_message(10, 7, 13)
+    counts.count_message(10, 7, 13)
+    counts.count_message(10, 8, 14)
+
+    db_write_counts(conn, *counts.remove_channel(10))
+
+    assert conn.execute('SELECT messages FROM chat_summary WHERE channel_id = 10').fetchone() == (5,)
+    assert conn.execute('SELECT member_id, messages FROM chat_summary_members ORDER BY member_id').fetchall() == \
+        [(7, 2), (8, 1)]
+    assert db_load_counter(conn, 1, 10).hours[13] == 2
+    assert counts.counters == {} and counts.dirty_channels == set()
+    assert counts.take_pending_counts() == ({}, [], [])
+
+
+def test_failed_flush_is_not_restored_into_a_new_day(conn):
+    counts = SummaryCounters()
+    counts.counters[10] = db_load_counter(conn, 1, 10)
+    counts.counters[11] = db_load_counter(conn, 1, 11)
+    counts.count_message(10, 7, 23)
+    counts.count_message(11, 7, 23)
+
+    taken_from, channel_rows, member_rows = counts.take_pending_counts()
+    finished = counts.start_day(10)  # Midnight while the flush was being written
+    counts.restore_pending_counts(taken_from, channel_rows, member_rows)
+
+    assert finished.messages == 1
+    assert counts.counters[10].pending_messages == 0 and counts.counters[10].pending_members == {}
+    assert counts.counters[11].pending_messages == 1 and counts.counters[11].pending_members == {7: 1}
+    assert counts.dirty_channels == {11}
+
+
+def test_rollup_merges_a_day_summarized_twice(conn):
+    counts = SummaryCounters()
+    counts.counters[10] = db_load_counter(conn, 1, 10)
+    for member_id, hour in ((7, 1), (7, 2), (8, 2)):
+        counts.count_message(10, member_id, hour)
+    db_rollup_counts(conn, 1, 10, '2026-01-01', counts.start_day(10))
+
+    counts.count_message(10, 8, 2)
+    db_rollup_counts(conn, 1, 10, '2026-01-01', counts.start_day(10))
+
+    messages, top_members = conn.execute('SELECT messages, top_members FROM chat_summary_days').fetchone()
+    assert messages == 4
+    assert sorted(json.loads(top_members)) == [[7, 2], [8, 2]]
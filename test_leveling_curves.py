@@ -0,0 +1,53 @@
+from utils.leveling_curves import LEVELING_CURVES, get_level_for_xp_on_curve, get_xp_for_level_on_curve
+
+
+def loop_level_for_xp(xp: int, xp_per_level: int) -> int:
+    # The per-level loop leveling.get_level_for_xp used before the closed form
+    level = 0
+    while xp >= xp_per_level:
+        level += 1
+        xp -= xp_per_level
+    return level
+
+
+def loop_xp_for_level(level: int, xp_per_level: int) -> int:
+    xp = 0
+    for _ in range(level):
+        xp += xp_per_level
+    return xp
+
+
+def test_linear_matches_loop():
+    for xp_per_level in [1, 3, 500, 1000, 1337]:
+        for xp in list(range(0, 5000, 7)) + [xp_per_level * 80, xp_per_level * 80 - 1]:
+            assert get_level_for_xp_on_curve(xp, xp_per_level, "linear") == loop_level_for_xp(xp, xp_per_level)
+
+        for level in range(0, 120):
+            assert get_xp_for_level_on_curve(level, xp_per_level, "linear") == loop_xp_for_level(level, xp_per_level)
+
+
+def test_unknown_curve_is_linear():
+    assert get_level_for_xp_on_curve(12345, 500, "does_not_exist") == get_level_for_xp_on_curve(12345, 500, "linear")
+    assert get_xp_for_level_on_curve(24, 500, "does_not_exist") == get_xp_for_level_on_curve(24, 500, "linear")
+
+
+def test_level_boundaries():
+    for curve in LEVELING_CURVES:
+        for xp_per_level in [1, 7, 500, 2000]:
+            for level in range(1, 200):
+                xp = get_xp_for_level_on_curve(level, xp_per_level, curve)
+                assert get_level_for_xp_on_curve(xp, xp_per_level, curve) == level
+                assert get_level_for_xp_on_curve(xp - 1, xp_per_level, curve) == level - 1
+
+
+def test_curves_grow():
+    linear = get_xp_for_level_on_curve(100, 500, "linear")
+    quadratic = get_xp_for_level_on_curve(100, 500, "quadratic")
+    exponential = get_xp_for_level_on_curve(100, 500, "exponential")
+    assert linear < quadratic < exponential
+
+
+def test_invalid_xp_per_level():
+    for curve in LEVELING_CURVES:
+        assert get_level_for_xp_on_curve(1000, 0, curve) == 0
+        assert get_level_for_xp_on_curve(1000, -5, curve) == 0
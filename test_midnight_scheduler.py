@@ -0,0 +1,55 @@
+import asyncio
+
+import datetime
+
+from utils.midnight_scheduler import MidnightScheduler, next_midnight, server_time
+
+DAY = 86400
+
+
+def test_next_midnight():
+    assert next_midnight(DAY * 5 + 10, 0) == DAY * 6
+    assert next_midnight(DAY * 5, 0) == DAY * 6  # Exactly midnight waits for the next one
+    assert next_midnight(DAY * 5, 2) == DAY * 6 - 7200
+    assert next_midnight(DAY * 5, -5.5) == DAY * 5 + 5.5 * 3600
+
+
+def test_server_time_matches_midnight():
+    midnight = next_midnight(DAY * 5 + 10, -5.5)
+    assert server_time(midnight, -5.5) == datetime.datetime(1970, 1, 6)
+    assert server_time(midnight - 1, -5.5).hour == 23
+
+    scheduler = MidnightScheduler(clock=lambda: midnight)
+    scheduler.add(1, -5.5)
+    assert scheduler.now_for(1) == datetime.datetime(1970, 1, 6)
+    assert scheduler.now_for(2) is None
+
+
+def test_due_buckets():
+    now = [DAY * 10 - 1]
+    scheduler = MidnightScheduler(clock=lambda: now[0])
+    scheduler.add(1, 0)
+    scheduler.add(2, 0)
+    scheduler.add(3, 1)
+    scheduler.add(3, 0)  # Moved after a timezone change
+    scheduler.add(4, -3)
+    scheduler.remove(2)
+
+    deadlines = {0: next_midnight(now[0], 0), -3: next_midnight(now[0], -3)}
+    assert scheduler.get_due(deadlines) == []
+
+    now[0] += 1
+    assert scheduler.get_due(deadlines) == [(0, DAY * 10, [1, 3])]
+    assert len(scheduler) == 3
+
+
+def test_wait_returns_at_midnight():
+    async def wait():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        scheduler = MidnightScheduler(clock=lambda: DAY * 10 - 0.05 + (loop.time() - start))
+        scheduler.add(1, 0)
+        scheduler.add(2, 5)
+        return await scheduler.wait()
+
+    assert asyncio.run(wait()) == [(0, DAY * 10, [1])]
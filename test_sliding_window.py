@@ -0,0 +1,57 @@
+from utils.sliding_window import SlidingWindowCounter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_counts_within_window():
+    clock = FakeClock()
+    counter = SlidingWindowCounter(clock=clock)
+
+    for _ in range(3):
+        counter.add((1, 2, 'message'), 5)
+        clock.now += 1
+
+    assert counter.count((1, 2, 'message')) == 3
+    assert counter.count((1, 3, 'message')) == 0
+    assert counter.count((2, 2, 'message')) == 0
+
+    clock.now += 2.5  # First event added at 1000 expires at 1005
+    assert counter.count((1, 2, 'message')) == 2
+
+    clock.now += 10
+    assert counter.count((1, 2, 'message')) == 0
+    assert len(counter) == 0
+
+
+def test_idle_keys_expire():
+    clock = FakeClock()
+    counter = SlidingWindowCounter(clock=clock)
+
+    for user_id in range(100):
+        counter.add((1, user_id, 'join'), 60)
+    assert len(counter) == 100
+
+    clock.now += 61
+    counter.add((1, 1000, 'join'), 60)
+    assert len(counter) == 1
+
+
+def test_memory_cap():
+    clock = FakeClock()
+    counter = SlidingWindowCounter(max_keys=10, max_events=4, clock=clock)
+
+    for user_id in range(20):
+        counter.add(user_id, 60)
+    assert len(counter) == 10
+    assert counter.count(0) == 0
+    assert counter.count(19) == 1
+
+    for _ in range(10):
+        counter.add(19, 60)
+    assert counter.count(19) == 4
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import deque
+
+import discord
+
+# Seconds an audit log entry can be matched to an event
+AUDIT_LOG_CACHE_TTL = 30
+
+# Entries kept per guild
+AUDIT_LOG_CACHE_SIZE = 50
+
+# Seconds to wait for the audit log entry of an event, the gateway usually sends it right after the event itself
+AUDIT_LOG_WAIT = 1.5
+
+# guild_id -> (time added, entry), newest last
+_entries: dict[int, deque[tuple[float, discord.AuditLogEntry]]] = {}
+
+# guild_id -> [(action, target_id, future)]
+_waiters: dict[int, list[tuple[discord.AuditLogAction, int | None, asyncio.Future]]] = {}
+
+_stats = {"hits": 0, "waited": 0, "misses": 0}
+
+
+def _matches(entry: discord.AuditLogEntry, action: discord.AuditLogAction, target_id: int | None) -> bool:
+    if entry.action != action:
+        return False
+    return target_id is None or getattr(entry.target, 'id', None) == target_id
+
+
+def add_audit_log_entry(entry: discord.AuditLogEntry):
+    """Cache an audit log entry from the gateway and hand it to listeners waiting for it"""
+    entries = _entries.get(entry.guild.id)
+    if entries is None:
+        entries = _entries[entry.guild.id] = deque(maxlen=AUDIT_LOG_CACHE_SIZE)
+    entries.append((time.monotonic(), entry))
+
+    waiters = _waiters.get(entry.guild.id)
+    if not waiters:
+        return
+
+    for waiter in list(waiters):
+        action, target_id, future = waiter
+        if not future.done() and _matches(entry, action, target_id):
+            future.set_result(entry)
+            waiters.remove(waiter)
+
+
+def get_cached_audit_log_entry(guild_id: int, action: discord.AuditLogAction,
+                               target_id: int | None = None) -> discord.AuditLogEntry | None:
+    """Get the newest cached entry of an action, optionally for a specific target"""
+    entries = _entries.get(guild_id)
+    if entries is None:
+        return None
+
+    expired = time.monotonic() - AUDIT_LOG_CACHE_TTL
+    for added, entry in reversed(entries):
+        if added < expired:
+            break
+        if _matches(entry, action, target_id):
+            return entry
+
+    return None
+
+
+async def find_audit_log_entry(guild: discord.Guild, action: discord.AuditLogAction,
+                               target_id: int | None = None) -> discord.AuditLogEntry | None:
+    """Find the audit log entry that caused an event
+
+    Looks in the entries received from the gateway first, waits up to AUDIT_LOG_WAIT seconds for the entry to arrive
+    and only fetches the audit log over REST when it doesn't.
+
+    Args:
+        guild (discord.Guild): Guild of the event
+        action (discord.AuditLogAction): Audit log action of the event
+        target_id (int | None, optional): ID of the changed object, any target matches if None. Defaults to None.
+
+    Returns:
+        discord.AuditLogEntry | None: The entry, or None if it wasn't found or the bot can't view the audit log
+    """
+    if not guild.me.guild_permissions.view_audit_log:
+        return None
+
+    entry = get_cached_audit_log_entry(guild.id, action, target_id)
+    if entry is not None:
+        _stats["hits"] += 1
+        return entry
+
+    future = asyncio.get_running_loop().create_future()
+    waiter = (action, target_id, future)
+    _waiters.setdefault(guild.id, []).append(waiter)
+    try:
+        entry = await asyncio.wait_for(future, AUDIT_LOG_WAIT)
+        _stats["waited"] += 1
+        return entry
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        waiters = _waiters.get(guild.id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+        if not waiters:
+            _waiters.pop(guild.id, None)
+
+    _stats["misses"] += 1
+    async for entry in guild.audit_logs(limit=1, action=action):
+        if target_id is None or getattr(entry.target, 'id', None) == target_id:
+            return entry
+
+    return None
+
+
+def get_audit_log_cache_stats() -> dict:
+    """Get the number of entries found in the cache, found after waiting for the gateway and fetched over REST"""
+    lookups = _stats["hits"] + _stats["waited"] + _stats["misses"]
+    return {
+        **_stats,
+        "guilds": len(_entries),
+        "hit_rate": (_stats["hits"] + _stats["waited"]) / lookups if lookups else 0.0,
+    }
@@ -0,0 +1,38 @@
+# channel_id -> features configured in that channel, e.g. "ticket", "suggestions", "chat_revive", "chat_summary".
+# Features load their channels at startup and keep this up to date from their add/remove commands, so message
+# listeners can skip unconfigured channels without querying the database.
+_channel_features: dict[int, set[str]] = {}
+
+_no_features = frozenset()
+
+
+def set_feature_channels(feature: str, channel_ids):
+    """Replace every channel of a feature, used when loading from the database"""
+    for channel_id in list(_channel_features):
+        remove_channel_feature(channel_id, feature)
+
+    for channel_id in channel_ids:
+        add_channel_feature(int(channel_id), feature)
+
+
+def add_channel_feature(channel_id: int, feature: str):
+    _channel_features.setdefault(channel_id, set()).add(feature)
+
+
+def remove_channel_feature(channel_id: int, feature: str):
+    features = _channel_features.get(channel_id)
+    if features is None:
+        return
+
+    features.discard(feature)
+    if not features:
+        del _channel_features[channel_id]
+
+
+def has_channel_feature(channel_id: int, feature: str) -> bool:
+    return feature in _channel_features.get(channel_id, _no_features)
+
+
+def get_channel_features(channel_id: int) -> set[str] | frozenset[str]:
+    """Get the features configured in a channel. Do not modify the result."""
+    return _channel_features.get(channel_id, _no_features)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import weakref
+
+import sentry_sdk
+
+# Every debouncer, so the waiting events can be flushed on shutdown
+_debouncers: weakref.WeakSet = weakref.WeakSet()
+
+
+class KeyedDebouncer:
+    """Merges bursts of before/after events per key into one call with the net change.
+
+    The first event of a key starts a window of `window` seconds. Events in the window only replace the latest
+    arguments, then the callback is called once with the "before" state of the first event and the other arguments of
+    the last one.
+    """
+
+    def __init__(self, window: float, callback) -> None:
+        """
+        Args:
+            window (float): Seconds to collect events of a key for
+            callback: async function taking the arguments of push after the key
+        """
+        self.window = window
+        self.callback = callback
+
+        # key -> (first before, latest arguments)
+        self._pending: dict[object, tuple] = {}
+
+        # key -> task waiting for the end of the window
+        self._tasks: dict[object, asyncio.Task] = {}
+
+        _debouncers.add(self)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def push(self, key, before, *after):
+        """Record an event, only before of the first event in the window is kept
+
+        Args:
+            key: Hashable key of the changed object, for example (guild_id, member_id)
+            before: State before the event
+            *after: State after the event and any other arguments of the callback
+        """
+        pending = self._pending.get(key)
+        if pending is not None:
+            self._pending[key] = (pending[0], after)
+            return
+
+        self._pending[key] = (before, after)
+        self._tasks[key] = asyncio.create_task(self._call_later(key))
+
+    async def flush(self):
+        """Cancel the waiting windows and make their calls now"""
+        tasks, self._tasks = self._tasks, {}
+        for key, task in tasks.items():
+            task.cancel()
+            await self._call(key)
+
+    async def _call_later(self, key):
+        await asyncio.sleep(self.window)
+        del self._tasks[key]
+        await self._call(key)
+
+    async def _call(self, key):
+        before, after = self._pending.pop(key)
+        try:
+            await self.callback(before, *after)
+        except Exception as e:
+            logging.exception("Debounced callback failed")
+            sentry_sdk.capture_exception(e)
+
+
+async def flush_debouncers():
+    """Make the calls of every waiting event now, called when the bot shuts down"""
+    for debouncer in list(_debouncers):
+        await debouncer.flush()
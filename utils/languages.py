@@ -6,6 +6,43 @@ from utils.per_user_settings import get_per_user_setting, set_per_user_setting
 from utils.settings import get_setting, set_setting
 from utils.tips import append_tip_to_message
 
+# Raw contents of every language file, keyed by language code
+_language_files: dict[str, dict[str, str]] = {}
+
+# Every language with the English fallback already merged in, so a lookup is a single dict access
+_catalog: dict[str, dict[str, str]] = {}
+
+
+def load_translations():
+    """Load every language file into memory and build the merged translation catalog.
+
+    Called once on import. Call it again (or use reload_translations) after editing files in lang/.
+    """
+    language_files = {}
+    for file in os.listdir("lang"):
+        if file.endswith(".json"):
+            with open(f"lang/{file}", encoding='utf8') as f:
+                language_files[file[:-5]] = json.load(f)
+
+    en_translations = language_files.get("en", {})
+
+    catalog = {}
+    for lang, translations in language_files.items():
+        merged = dict(en_translations)
+        # Empty strings fall back to English, same as before
+        merged.update({k: v for k, v in translations.items() if v})
+        catalog[lang] = merged
+
+    # Swap both at once so lookups never see a half built catalog
+    global _language_files, _catalog
+    _language_files, _catalog = language_files, catalog
+
+
+def reload_translations():
+    """Reload the translation catalog from the lang/ directory"""
+    load_translations()
+    logging.info("Reloaded %d languages", len(_catalog))
+
 
 def get_translation_for_key_localized(user_id: int, guild_id: int, key: str, append_tip=False) -> str:
     """Get translation for a key in the user's language, server language, or English
@@ -19,16 +56,8 @@ def get_translation_for_key_localized(user_id: int, guild_id: int, key: str, app
     Returns:
         str: Translation
     """
-    translation = ""
     language = get_language(guild_id, user_id)
-
-    with open(f"lang/{language}.json", encoding='utf8') as f:
-        translations: dict = json.load(f)
-
-    with open('lang/en.json', encoding='utf8') as f:
-        en_translations: dict = json.load(f)
-
-    translation = translations.get(key, translation) or en_translations.get(key, translation) or f"lang.en.{key}"
+    translation = _catalog[language].get(key) or f"lang.en.{key}"
 
     if append_tip and get_per_user_setting(user_id, "tips_enabled", "true") == "true":
         return append_tip_to_message(guild_id, user_id, translation, language)
@@ -50,21 +79,23 @@ def get_language(guild_id: int, user_id: int) -> str:
     # Get user language
     if user_id != 0:
         user_lang = get_per_user_setting(user_id, "language", "en")
-        if not os.path.exists(f"lang/{user_lang}.json"):
+        if user_lang not in _catalog:
             set_per_user_setting(user_id, "language", "en")
             logging.error(
                 "WARNING: User {id} has somehow set the user language to {lang}, which is not a valid language. "
                 "Reset to EN".format(id=user_id, lang=user_lang))
+            return "en"
         return user_lang
 
     # Get server language
     if guild_id != 0:
         server_lang = get_setting(guild_id, "language", "en")
-        if not os.path.exists(f"lang/{server_lang}.json"):
+        if server_lang not in _catalog:
             set_setting(guild_id, "language", "en")
             logging.error(
                 "WARNING: Server {id} has somehow set the server language to {lang}, which is not a valid language. "
                 "Reset to EN".format(id=guild_id, lang=server_lang))
+            return "en"
         return server_lang
 
     # Global (English)
@@ -77,12 +108,7 @@ def get_list_of_languages():
     Returns:
         list: List of languages
     """
-    languages = []
-    for file in os.listdir("lang"):
-        if file.endswith(".json"):
-            languages.append(file[:-5])
-
-    return languages
+    return list(_language_files.keys())
 
 
 def get_language_completeness(lang: str) -> int:
@@ -92,16 +118,11 @@ def get_language_completeness(lang: str) -> int:
         int: Percentage of translations completed
     """
     # Validate lang exists
-    if not os.path.exists(f"lang/{lang}.json"):
+    if lang not in _language_files:
         raise ValueError("Language does not exist")
 
-    # Load English translations
-    with open("lang/en.json", encoding='utf8') as f:
-        en_translations: dict = json.load(f)
-
-    # Load target language
-    with open(f"lang/{lang}.json", encoding='utf8') as f:
-        lang_translations: dict = json.load(f)
+    en_translations = _language_files["en"]
+    lang_translations = _language_files[lang]
 
     total = len(en_translations)
     translated = 0
@@ -125,11 +146,10 @@ def get_language_name(lang_code: str, completeness: bool = True) -> str:
         return 'English'
 
     # Validate lang exists
-    if not os.path.exists(f"lang/{lang_code}.json"):
+    if lang_code not in _language_files:
         raise ValueError("Language does not exist")
 
-    with open(f"lang/{lang_code}.json", encoding='utf8') as f:
-        name = json.load(f).get("language", lang_code)
+    name = _language_files[lang_code].get("language", lang_code)
 
     completeness_percent = get_language_completeness(lang_code)
     if completeness:
@@ -168,3 +188,6 @@ def language_name_to_code(lang_name: str) -> str:
             return i
 
     return 'en'
+
+
+load_translations()
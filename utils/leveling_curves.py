@@ -0,0 +1,63 @@
+import math
+
+LEVELING_CURVES = ["linear", "quadratic", "exponential"]
+
+# Every level on the exponential curve costs this many times more XP than the one before it
+EXPONENTIAL_CURVE_GROWTH = 1.1
+
+
+def get_xp_for_level_on_curve(level: int, xp_per_level: int, curve: str) -> int:
+    """Get the total XP needed to reach a level
+
+    Args:
+        level (int): Level
+        xp_per_level (int): XP needed for the first level, multiplier already applied
+        curve (str): One of LEVELING_CURVES, unknown curves are treated as linear
+
+    Returns:
+        int: Total XP
+    """
+    if level <= 0:
+        return 0
+
+    if curve == "quadratic":
+        # Level n costs n * xp_per_level
+        return xp_per_level * level * (level + 1) // 2
+
+    if curve == "exponential":
+        # Level n costs xp_per_level * growth^(n - 1)
+        return int(xp_per_level * (EXPONENTIAL_CURVE_GROWTH ** level - 1) / (EXPONENTIAL_CURVE_GROWTH - 1))
+
+    return xp_per_level * level
+
+
+def get_level_for_xp_on_curve(xp: int, xp_per_level: int, curve: str) -> int:
+    """Get the level reached with an amount of XP
+
+    Args:
+        xp (int): Total XP
+        xp_per_level (int): XP needed for the first level, multiplier already applied
+        curve (str): One of LEVELING_CURVES, unknown curves are treated as linear
+
+    Returns:
+        int: Level
+    """
+    if xp_per_level <= 0 or xp < xp_per_level:
+        return 0
+
+    if curve == "quadratic":
+        # Largest level with level * (level + 1) / 2 <= xp // xp_per_level
+        return (math.isqrt(8 * (xp // xp_per_level) + 1) - 1) // 2
+
+    if curve == "exponential":
+        level = int(math.log(xp * (EXPONENTIAL_CURVE_GROWTH - 1) / xp_per_level + 1, EXPONENTIAL_CURVE_GROWTH))
+
+        # Correct floating point error around level boundaries
+        while get_xp_for_level_on_curve(level + 1, xp_per_level, curve) <= xp:
+            level += 1
+        while level > 0 and get_xp_for_level_on_curve(level, xp_per_level, curve) > xp:
+            level -= 1
+
+        return level
+
+    return xp // xp_per_level
@@ -0,0 +1,134 @@
+import bisect
+
+# Entries per bucket when the ranking is built, buckets are split when they grow to twice this
+BUCKET_SIZE = 1000
+
+
+class LevelingRanking:
+    """XP ranking of a single guild.
+
+    Keeps (-xp, user_id) pairs sorted across buckets of about BUCKET_SIZE entries, with a Fenwick tree over the bucket
+    sizes. Updates and rank lookups are O(log n) plus a small in-bucket insert. Members with the same XP share a rank.
+    """
+
+    def __init__(self, rows: list[tuple[int, int]]) -> None:
+        """
+        Args:
+            rows (list): (user_id, xp) pairs
+        """
+        self.user_xp: dict[int, int] = dict(rows)
+        entries = sorted((-xp, user_id) for user_id, xp in self.user_xp.items())
+        self.buckets: list[list[tuple[int, int]]] = [entries[i:i + BUCKET_SIZE] for i in range(0, len(entries), BUCKET_SIZE)]
+        self.maxes: list[tuple[int, int]] = []
+        self.tree: list[int] = []
+        self._rebuild_index()
+
+    def __len__(self) -> int:
+        return len(self.user_xp)
+
+    def _rebuild_index(self):
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+
+        self.tree = [0] * (len(self.buckets) + 1)
+        for i, bucket in enumerate(self.buckets, 1):
+            self.tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def _add_to_bucket_size(self, bucket_index: int, delta: int):
+        i = bucket_index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _count_in_buckets_before(self, bucket_index: int) -> int:
+        count = 0
+        i = bucket_index
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def _insert(self, entry: tuple[int, int]):
+        if not self.buckets:
+            self.buckets.append([entry])
+            self._rebuild_index()
+            return
+
+        i = min(bisect.bisect_left(self.maxes, entry), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        bisect.insort(bucket, entry)
+
+        if len(bucket) >= BUCKET_SIZE * 2:
+            self.buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._rebuild_index()
+        else:
+            self.maxes[i] = bucket[-1]
+            self._add_to_bucket_size(i, 1)
+
+    def _remove(self, entry: tuple[int, int]):
+        i = bisect.bisect_left(self.maxes, entry)
+        bucket = self.buckets[i]
+        del bucket[bisect.bisect_left(bucket, entry)]
+
+        if not bucket:
+            del self.buckets[i]
+            self._rebuild_index()
+        else:
+            self.maxes[i] = bucket[-1]
+            self._add_to_bucket_size(i, -1)
+
+    def _count_before(self, key: tuple) -> int:
+        """Number of entries sorting before key"""
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            return len(self)
+        return self._count_in_buckets_before(i) + bisect.bisect_left(self.buckets[i], key)
+
+    def update(self, user_id: int, xp: int):
+        """Set the total XP of a member"""
+        old_xp = self.user_xp.get(user_id)
+        if old_xp == xp:
+            return
+
+        if old_xp is not None:
+            self._remove((-old_xp, user_id))
+
+        self.user_xp[user_id] = xp
+        self._insert((-xp, user_id))
+
+    def get_rank(self, user_id: int) -> int | None:
+        """Get the 1-based rank of a member, or None if they have no XP yet"""
+        xp = self.user_xp.get(user_id)
+        if xp is None:
+            return None
+
+        # Members with more XP, (-xp,) sorts before every (-xp, user_id)
+        return self._count_before((-xp,)) + 1
+
+    def get_page(self, page: int, page_size: int) -> list[tuple[int, int, int]]:
+        """Get a page of the leaderboard
+
+        Args:
+            page (int): 0-based page number
+            page_size (int): Entries per page
+
+        Returns:
+            list: (rank, user_id, xp) tuples
+        """
+        skip = page * page_size
+        result = []
+        for bucket in self.buckets:
+            if skip >= len(bucket):
+                skip -= len(bucket)
+                continue
+
+            for neg_xp, user_id in bucket[skip:skip + page_size - len(result)]:
+                result.append((self._count_before((neg_xp,)) + 1, user_id, -neg_xp))
+            skip = 0
+
+            if len(result) == page_size:
+                break
+
+        return result
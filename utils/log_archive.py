@@ -0,0 +1,166 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from database import DB_PATH, conn, on_db_shutdown
+
+# Log entries are appended to the newest segment as JSON lines, full segments are gzip compressed
+LOG_ARCHIVE_DIR = os.path.join(os.path.dirname(DB_PATH), 'log_archive')
+
+# Uncompressed bytes per segment before a new one is started
+LOG_ARCHIVE_SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Index rows with this user ID are written for every entry, so searches without a user use the same index
+ANY_USER = 0
+
+
+def db_init():
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE IF NOT EXISTS log_archive(guild_id INTEGER, user_id INTEGER, event TEXT, time INTEGER, '
+                'segment INTEGER, offset INTEGER)')
+    cur.execute('CREATE INDEX IF NOT EXISTS log_archive_user ON log_archive(guild_id, user_id, time)')
+    cur.execute('CREATE INDEX IF NOT EXISTS log_archive_user_event ON log_archive(guild_id, user_id, event, time)')
+    cur.close()
+    conn.commit()
+
+
+def get_segment_path(segment: int, compressed: bool) -> str:
+    return os.path.join(LOG_ARCHIVE_DIR, f'{segment:08d}.jsonl' + ('.gz' if compressed else ''))
+
+
+class LogArchiveWriter(threading.Thread):
+    """Writes archived log entries and their index rows on its own thread, in one transaction per batch"""
+
+    def __init__(self) -> None:
+        super().__init__(name='log_archive', daemon=True)
+        self.entries: queue.Queue = queue.Queue()
+
+        os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+        segments = [int(name.split('.')[0]) for name in os.listdir(LOG_ARCHIVE_DIR) if name[0].isdigit()]
+        self.segment = max(segments, default=0)
+        if os.path.exists(get_segment_path(self.segment, True)):
+            self.segment += 1  # Compressed segments are never appended to
+
+    def run(self):
+        db = sqlite3.connect(DB_PATH, timeout=30)
+        file = open(get_segment_path(self.segment, False), 'ab')
+
+        while True:
+            batch = [self.entries.get()]
+            while not self.entries.empty():
+                batch.append(self.entries.get())
+
+            stop = None in batch
+            try:
+                file = self.write_batch(db, file, [entry for entry in batch if entry is not None])
+            except Exception:
+                logging.exception("Couldn't write %d log archive entries", len(batch))
+
+            if stop:
+                file.close()
+                db.close()
+                return
+
+    def write_batch(self, db: sqlite3.Connection, file, batch: list[dict]):
+        rows = []
+        for entry in batch:
+            offset = file.tell()
+            file.write(json.dumps(entry, separators=(',', ':')).encode('utf8') + b'\n')
+
+            for user_id in {ANY_USER, *entry['users']}:
+                rows.append((entry['guild_id'], user_id, entry['event'], entry['time'], self.segment, offset))
+
+        file.flush()
+        db.executemany('INSERT INTO log_archive(guild_id, user_id, event, time, segment, offset) '
+                       'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        db.commit()
+
+        if file.tell() < LOG_ARCHIVE_SEGMENT_SIZE:
+            return file
+
+        file.close()
+        self.compress_segment(self.segment)
+        self.segment += 1
+        return open(get_segment_path(self.segment, False), 'ab')
+
+    @staticmethod
+    def compress_segment(segment: int):
+        path = get_segment_path(segment, False)
+        compressed_path = get_segment_path(segment, True)
+
+        with open(path, 'rb') as src, gzip.open(compressed_path + '.tmp', 'wb') as dst:
+            while chunk := src.read(1024 * 1024):
+                dst.write(chunk)
+
+        # Readers look for the compressed segment first, the plain one is removed only once it exists
+        os.replace(compressed_path + '.tmp', compressed_path)
+        os.remove(path)
+
+
+_writer: LogArchiveWriter | None = None
+
+
+def archive_log_entry(guild_id: int, event: str, embed: dict, user_ids: list[int]):
+    """Queue a log entry for the archive, this never waits for the disk
+
+    Args:
+        guild_id (int): Guild ID
+        event (str): Event type, for example "member_ban"
+        embed (dict): The logged embed, from discord.Embed.to_dict()
+        user_ids (list): Users involved in the event, the entry is found when searching for any of them
+    """
+    global _writer
+    if _writer is None:
+        _writer = LogArchiveWriter()
+        _writer.start()
+
+    _writer.entries.put({'guild_id': guild_id, 'event': event, 'time': int(time.time()), 'embed': embed,
+                         'users': user_ids})
+
+
+@on_db_shutdown
+def close_log_archive():
+    """Write the queued entries and stop the writer thread"""
+    if _writer is not None:
+        # The writer needs the write lock, a transaction still open on the main connection would make it time out
+        conn.commit_if_pending()
+        _writer.entries.put(None)
+        _writer.join()
+
+
+def read_archived_entries(locations: list[tuple[int, int]]) -> list[dict]:
+    """Read archived entries, call it off the event loop
+
+    Each segment is opened once and read forward, so a compressed segment is decompressed at most once.
+
+    Args:
+        locations (list): (segment, offset) pairs from the index
+
+    Returns:
+        list: Entries in the same order, entries that couldn't be read are left out
+    """
+    found = {}
+    for segment in sorted({segment for segment, _ in locations}):
+        offsets = sorted(offset for s, offset in locations if s == segment)
+        try:
+            if os.path.exists(get_segment_path(segment, True)):
+                file = gzip.open(get_segment_path(segment, True), 'rb')
+            else:
+                file = open(get_segment_path(segment, False), 'rb')
+
+            with file:
+                for offset in offsets:
+                    file.seek(offset)
+                    found[(segment, offset)] = json.loads(file.readline())
+        except (OSError, ValueError):
+            logging.warning("Couldn't read log archive segment %d", segment)
+
+    return [found[location] for location in locations if location in found]
+
+
+db_init()
@@ -1,16 +1,163 @@
+import asyncio
+import logging
+from collections import deque
 
 import discord
 
+from utils.languages import get_translation_for_key_localized as trl
+from utils.log_archive import archive_log_entry
 from utils.settings import get_setting
 
+# Seconds logs are collected before they are sent, so bursts of changes share messages
+LOG_OUTBOX_INTERVAL = 1
 
-async def log_into_logs(server: discord.Guild, message: discord.Embed):
+# Embeds waiting per guild, logs past this are dropped and counted in a summary
+LOG_OUTBOX_MAX_EMBEDS = 100
+
+# Discord limits of a single message
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARACTERS_PER_MESSAGE = 6000
+
+# Room kept in a message for the dropped logs summary
+DROPPED_SUMMARY_CHARACTERS = 200
+
+
+class LogOutbox:
+    """Logs of a guild waiting to be sent to its logging channel"""
+
+    def __init__(self, guild: discord.Guild) -> None:
+        self.guild = guild
+        self.embeds: deque[discord.Embed] = deque()
+        self.dropped = 0
+        self.task: asyncio.Task | None = None
+
+
+# guild_id -> outbox, removed once everything was sent
+_outboxes: dict[int, LogOutbox] = {}
+
+# guild_id -> (logging_channel setting, resolved channel)
+_log_channels: dict[int, tuple[str, discord.TextChannel]] = {}
+
+
+def get_log_channel(server: discord.Guild) -> discord.TextChannel | None:
+    """Get the logging channel of a guild, resolved again only when the setting changes
+
+    Channels that weren't found aren't cached, the guild may not be cached yet or access may come back.
+    """
     log_id = get_setting(server.id, 'logging_channel', '0')
+
+    cached = _log_channels.get(server.id)
+    if cached is not None and cached[0] == log_id:
+        return cached[1]
+
     log_chan = server.get_channel(int(log_id))
     if log_chan is None:
-        return
+        _log_channels.pop(server.id, None)
+    else:
+        _log_channels[server.id] = (log_id, log_chan)
+    return log_chan
 
-    if not log_chan.can_send():
+
+async def log_into_logs(server: discord.Guild, message: discord.Embed, event: str = 'other',
+                        users: list[discord.abc.Snowflake | None] = ()):
+    """Queue an embed for the logging channel of a guild and the log archive
+
+    Embeds are sent together after LOG_OUTBOX_INTERVAL.
+
+    Args:
+        server (discord.Guild): Guild to log into
+        message (discord.Embed): The log embed
+        event (str, optional): Event type stored in the archive index, for example "member_ban". Defaults to 'other'.
+        users (list, optional): Users involved in the event, like the moderator and the affected member. They can
+            find the log with /logging search. None entries, for example an unknown moderator, are skipped.
+    """
+    if get_log_channel(server) is None:
         return
 
-    await log_chan.send(embed=message)
+    archive_log_entry(server.id, event, message.to_dict(), [user.id for user in users if user is not None])
+
+    outbox = _outboxes.get(server.id)
+    if outbox is None:
+        outbox = _outboxes[server.id] = LogOutbox(server)
+
+    if len(outbox.embeds) >= LOG_OUTBOX_MAX_EMBEDS:
+        outbox.dropped += 1
+    else:
+        outbox.embeds.append(message)
+
+    if outbox.task is None:
+        outbox.task = asyncio.create_task(_send_outbox_later(outbox))
+
+
+def _take_batch(outbox: LogOutbox) -> list[discord.Embed]:
+    batch = []
+    size = 0
+    while outbox.embeds and len(batch) < EMBEDS_PER_MESSAGE:
+        embed_size = len(outbox.embeds[0])
+        if batch and size + embed_size > EMBED_CHARACTERS_PER_MESSAGE:
+            break
+
+        batch.append(outbox.embeds.popleft())
+        size += embed_size
+
+    if (not outbox.embeds and outbox.dropped > 0 and len(batch) < EMBEDS_PER_MESSAGE
+            and size + DROPPED_SUMMARY_CHARACTERS <= EMBED_CHARACTERS_PER_MESSAGE):
+        batch.append(discord.Embed(description=trl(0, outbox.guild.id, "logging_outbox_dropped").format(
+            count=outbox.dropped), color=discord.Color.orange()))
+        outbox.dropped = 0
+
+    return batch
+
+
+async def _send_outbox(outbox: LogOutbox):
+    while outbox.embeds or outbox.dropped:
+        log_chan = get_log_channel(outbox.guild)
+        if log_chan is None or not log_chan.can_send():
+            outbox.embeds.clear()
+            outbox.dropped = 0
+            return
+
+        batch = _take_batch(outbox)
+        try:
+            await log_chan.send(embeds=batch)
+        except (discord.Forbidden, discord.NotFound):
+            # The channel was deleted or the bot can't send there anymore, resolve it again for new logs
+            _log_channels.pop(outbox.guild.id, None)
+            outbox.embeds.clear()
+            outbox.dropped = 0
+            return
+        except discord.HTTPException as e:
+            logging.warning("Couldn't send logs to %s: %s", outbox.guild.id, e)
+            if len(batch) > 1:
+                # One invalid embed fails the whole message, send them one by one so only that one is lost
+                await _send_each(outbox, log_chan, batch)
+
+
+async def _send_each(outbox: LogOutbox, log_chan: discord.TextChannel, batch: list[discord.Embed]):
+    for embed in batch:
+        try:
+            await log_chan.send(embed=embed)
+        except discord.HTTPException as e:
+            logging.warning("Couldn't send a log to %s: %s", outbox.guild.id, e)
+
+
+async def _send_outbox_later(outbox: LogOutbox):
+    try:
+        await asyncio.sleep(LOG_OUTBOX_INTERVAL)
+        await _send_outbox(outbox)
+    finally:
+        outbox.task = None
+
+        # Logs are left in the outbox if the task was cancelled, flush_log_outboxes sends them
+        if not outbox.embeds and not outbox.dropped and _outboxes.get(outbox.guild.id) is outbox:
+            del _outboxes[outbox.guild.id]
+
+
+async def flush_log_outboxes():
+    """Send every queued log now, called when the bot shuts down"""
+    for outbox in list(_outboxes.values()):
+        if outbox.task is not None:
+            outbox.task.cancel()
+        await _send_outbox(outbox)
+
+    _outboxes.clear()
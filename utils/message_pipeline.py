@@ -0,0 +1,93 @@
+import logging
+import time
+
+import discord
+import sentry_sdk
+
+from utils.channel_features import get_channel_features
+from utils.settings import get_guild_settings
+
+
+class MessageContext:
+    """Data about a guild message that is shared by every pipeline stage, resolved once per message"""
+
+    def __init__(self, message: discord.Message) -> None:
+        self.message = message
+        self.guild = message.guild
+        self.author = message.author
+        self.channel = message.channel
+
+        # Guild settings snapshot, a single cache lookup for every stage
+        self.settings = get_guild_settings(message.guild.id)
+
+        # Features configured in the message channel, see utils.channel_features
+        self.channel_features = get_channel_features(message.channel.id)
+
+        # Member and channel flags
+        self.author_is_moderator = isinstance(message.author, discord.Member) and message.author.guild_permissions.manage_messages
+        self.bot_can_send = message.channel.permissions_for(message.guild.me).send_messages
+
+        # Set by a stage to skip the stages after it, for example when the message was deleted
+        self.stopped = False
+
+    def get_setting(self, key: str, default: str) -> str:
+        return self.settings.get(key) or default
+
+
+# (priority, name, stage), stages run in ascending priority
+_stages = []
+
+# name -> [calls, total seconds, slowest seconds]
+_stage_stats: dict[str, list] = {}
+
+
+def register_message_stage(name: str, stage, priority: int = 100):
+    """Register a coroutine function that handles every non-bot guild message
+
+    Args:
+        name (str): Name shown in stage timing statistics
+        stage: async function taking a MessageContext
+        priority (int, optional): Stages with lower priority run first. Defaults to 100.
+    """
+    _stages.append((priority, name, stage))
+    _stages.sort(key=lambda s: s[0])
+    _stage_stats.setdefault(name, [0, 0.0, 0.0])
+
+
+async def run_message_pipeline(message: discord.Message):
+    """Build the message context and run every registered stage in order, until a stage sets ctx.stopped.
+    A failing stage doesn't stop the others."""
+    if message.guild is None or message.author.bot:
+        return
+
+    ctx = MessageContext(message)
+
+    for _, name, stage in _stages:
+        start = time.perf_counter()
+        try:
+            await stage(ctx)
+        except Exception as e:
+            logging.exception("Message pipeline stage %s failed", name)
+            sentry_sdk.capture_exception(e)
+
+        elapsed = time.perf_counter() - start
+        stats = _stage_stats[name]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+        if ctx.stopped:
+            break
+
+
+def get_message_stage_stats() -> list[tuple[str, int, float, float]]:
+    """Get timing statistics of every stage, slowest total first
+
+    Returns:
+        list: (name, calls, average ms, slowest ms) tuples
+    """
+    result = []
+    for name, (calls, total, slowest) in _stage_stats.items():
+        result.append((name, calls, total / calls * 1000 if calls else 0.0, slowest * 1000))
+    result.sort(key=lambda s: s[1] * s[2], reverse=True)
+    return result
@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import math
+import time
+
+
+def next_midnight(now: float, offset: float) -> float:
+    """Get the next midnight after now in a UTC offset
+
+    Args:
+        now (float): UNIX timestamp
+        offset (float): UTC offset in hours
+
+    Returns:
+        float: UNIX timestamp of the midnight
+    """
+    shift = offset * 3600
+    return (math.floor((now + shift) / 86400) + 1) * 86400 - shift
+
+
+def server_time(now: float, offset: float) -> datetime.datetime:
+    """Get the wall clock time in a UTC offset, on the same clock as next_midnight
+
+    Args:
+        now (float): UNIX timestamp
+        offset (float): UTC offset in hours
+
+    Returns:
+        datetime: Naive time in the offset
+    """
+    return datetime.datetime.fromtimestamp(now + offset * 3600, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class MidnightScheduler:
+    """Waits for midnight in the timezones of many keys, for example channels of guilds with different timezones.
+
+    Keys are grouped by their UTC offset, so waiting only looks at one deadline per offset and nothing runs between
+    midnights.
+    """
+
+    def __init__(self, clock=time.time) -> None:
+        self.clock = clock
+
+        # offset -> keys, and key -> offset
+        self._buckets: dict[float, set] = {}
+        self._offsets: dict[object, float] = {}
+
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def add(self, key, offset: float):
+        """Add a key or move it to another offset"""
+        if self._offsets.get(key) == offset:
+            return
+
+        self.remove(key)
+        self._offsets[key] = offset
+        self._buckets.setdefault(offset, set()).add(key)
+        self._changed.set()
+
+    def remove(self, key):
+        offset = self._offsets.pop(key, None)
+        if offset is None:
+            return
+
+        bucket = self._buckets[offset]
+        bucket.discard(key)
+        if not bucket:
+            del self._buckets[offset]
+
+    def now_for(self, key) -> datetime.datetime | None:
+        """Get the current time in the offset of a key, None if the key isn't scheduled"""
+        offset = self._offsets.get(key)
+        if offset is None:
+            return None
+        return server_time(self.clock(), offset)
+
+    def get_due(self, deadlines: dict[float, float]) -> list[tuple[float, float, list]]:
+        """Get the buckets whose deadline has passed
+
+        Args:
+            deadlines (dict): offset -> midnight timestamp, from the time waiting started
+
+        Returns:
+            list: (offset, midnight timestamp, keys) of every due bucket
+        """
+        now = self.clock()
+        return [(offset, deadline, list(self._buckets[offset])) for offset, deadline in deadlines.items()
+                if deadline <= now and offset in self._buckets]
+
+    async def wait(self) -> list[tuple[float, float, list]]:
+        """Sleep until midnight in any of the offsets, keys added or moved while sleeping are taken into account
+
+        Returns:
+            list: (offset, midnight timestamp, keys) of every bucket that reached midnight
+        """
+        while True:
+            self._changed.clear()
+            now = self.clock()
+            deadlines = {offset: next_midnight(now, offset) for offset in self._buckets}
+
+            try:
+                timeout = min(deadlines.values()) - now if deadlines else None
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                continue  # Keys changed, work out the deadlines again
+            except asyncio.TimeoutError:
+                pass
+
+            due = self.get_due(deadlines)
+            if due:
+                return due
@@ -0,0 +1,89 @@
+import time
+from collections import deque
+
+import discord
+
+# Seconds without joins after which a raid lockdown ends
+RAID_LOCKDOWN_DURATION = 300
+
+# Seconds between lockdown summaries sent to the logging channel
+RAID_LOCKDOWN_SUMMARY_INTERVAL = 60
+
+
+class RaidLockdown:
+    """A guild in raid lockdown. Joiners are queued for kicking and per-join features are paused."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.until = self.started + RAID_LOCKDOWN_DURATION
+        self.last_summary = self.started
+
+        self.kick_queue: deque[discord.Member] = deque()
+
+        # Since the last summary
+        self.joins = 0
+        self.kicks = 0
+
+        # Since the lockdown started
+        self.total_joins = 0
+        self.total_kicks = 0
+
+    def add_join(self, member: discord.Member):
+        """Queue a joiner for kicking and extend the lockdown"""
+        self.until = time.monotonic() + RAID_LOCKDOWN_DURATION
+        self.kick_queue.append(member)
+        self.joins += 1
+        self.total_joins += 1
+
+    def add_kick(self):
+        self.kicks += 1
+        self.total_kicks += 1
+
+    def stop(self):
+        """End the lockdown early, queued joiners are not kicked"""
+        self.until = 0
+        self.kick_queue.clear()
+
+    def is_active(self) -> bool:
+        return time.monotonic() < self.until
+
+    def take_summary(self) -> tuple[int, int]:
+        """Get the joins and kicks since the last summary and start counting again
+
+        Returns:
+            tuple: (joins, kicks)
+        """
+        summary = self.joins, self.kicks
+        self.joins = 0
+        self.kicks = 0
+        self.last_summary = time.monotonic()
+        return summary
+
+
+# guild_id -> lockdown, kept until its queue is empty and the end summary was sent
+_lockdowns: dict[int, RaidLockdown] = {}
+
+
+def start_raid_lockdown(guild_id: int) -> RaidLockdown:
+    lockdown = _lockdowns.get(guild_id)
+    if lockdown is None:
+        lockdown = _lockdowns[guild_id] = RaidLockdown()
+    return lockdown
+
+
+def get_raid_lockdown(guild_id: int) -> RaidLockdown | None:
+    return _lockdowns.get(guild_id)
+
+
+def get_raid_lockdowns() -> list[tuple[int, RaidLockdown]]:
+    return list(_lockdowns.items())
+
+
+def end_raid_lockdown(guild_id: int) -> RaidLockdown | None:
+    return _lockdowns.pop(guild_id, None)
+
+
+def is_raid_lockdown(guild_id: int) -> bool:
+    """Check whether per-join work like welcome messages, join roles and join logs should be skipped in a guild"""
+    lockdown = _lockdowns.get(guild_id)
+    return lockdown is not None and (lockdown.is_active() or len(lockdown.kick_queue) > 0)
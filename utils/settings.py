@@ -1,6 +1,17 @@
+from collections import OrderedDict
 
 from database import conn as db
 
+# Maximum number of guilds whose settings are kept in memory, least recently used guilds are evicted first
+SETTINGS_CACHE_MAX_GUILDS = 10000
+
+# guild_id -> {key: value}, holds every stored setting of the guild
+_settings_cache: OrderedDict[int, dict[str, str]] = OrderedDict()
+_settings_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# key -> functions called with (guild_id, value) after the setting is changed
+_setting_watchers: dict[str, list] = {}
+
 
 def db_init():
     cur = db.cursor()
@@ -17,7 +28,6 @@ def db_init():
 
 
 def db_get_key(guild_id: int, key: str):
-    db_init()
     cur = db.cursor()
     cur.execute(
         "SELECT value FROM settings WHERE guild_id = ? AND key = ?", (guild_id, key))
@@ -26,26 +36,88 @@ def db_get_key(guild_id: int, key: str):
     return result[0] if result else None
 
 
+def db_get_key_for_all_guilds(key: str) -> dict[int, str]:
+    """Get a setting of every guild that has it stored, guild_id -> value"""
+    cur = db.cursor()
+    cur.execute("SELECT guild_id, value FROM settings WHERE key = ?", (key,))
+    result = cur.fetchall()
+    cur.close()
+    return dict(result)
+
+
+def db_get_all_keys(guild_id: int) -> dict[str, str]:
+    cur = db.cursor()
+    cur.execute("SELECT key, value FROM settings WHERE guild_id = ?", (guild_id,))
+    result = cur.fetchall()
+    cur.close()
+    return dict(result)
+
+
 def db_set_key(guild_id: int, key: str, value: str):
-    db_init()
     cur = db.cursor()
     cur.execute(
-        "select * from settings where guild_id = ? and key = ?", (guild_id, key))
-    if cur.fetchone():
-        cur.execute(
-            "update settings set value = ? where guild_id = ? and key = ?", (value, guild_id, key))
-    else:
-        cur.execute(
-            "insert into settings (guild_id, key, value) values (?, ?, ?)", (guild_id, key, value))
+        "insert into settings (guild_id, key, value) values (?, ?, ?) "
+        "on conflict (guild_id, key) do update set value = excluded.value", (guild_id, key, value))
     cur.close()
     db.commit()
 
 
+def get_guild_settings(server_id: int) -> dict[str, str]:
+    """Get every stored setting of a guild, loading it into the cache with a single query on a miss
+
+    Args:
+        server_id (int): Server ID
+
+    Returns:
+        dict: Setting key -> value. Do not modify, use set_setting
+    """
+    settings = _settings_cache.get(server_id)
+    if settings is not None:
+        _settings_cache_stats["hits"] += 1
+        _settings_cache.move_to_end(server_id)
+        return settings
+
+    _settings_cache_stats["misses"] += 1
+    settings = db_get_all_keys(server_id)
+    _settings_cache[server_id] = settings
+    if len(_settings_cache) > SETTINGS_CACHE_MAX_GUILDS:
+        _settings_cache.popitem(last=False)
+        _settings_cache_stats["evictions"] += 1
+    return settings
+
+
 def get_setting(server_id: int, key: str, default: str) -> str:
-    db_init()
-    return db_get_key(server_id, key) or default
+    return get_guild_settings(server_id).get(key) or default
 
 
 def set_setting(server_id: int, key: str, value: str) -> None:
-    db_init()
     db_set_key(server_id, key, value)
+
+    # Write through, only guilds already in the cache need updating
+    settings = _settings_cache.get(server_id)
+    if settings is not None:
+        settings[key] = value
+
+    for func in _setting_watchers.get(key, []):
+        func(server_id, value)
+
+
+def watch_setting(key: str, func) -> None:
+    """Call func(guild_id, value) whenever a setting is changed with set_setting"""
+    _setting_watchers.setdefault(key, []).append(func)
+
+
+def invalidate_settings_cache(server_id: int | None = None) -> None:
+    """Drop cached settings of a guild, or of every guild when no ID is given"""
+    if server_id is None:
+        _settings_cache.clear()
+    else:
+        _settings_cache.pop(server_id, None)
+
+
+def get_settings_cache_stats() -> dict[str, int]:
+    """Get hit/miss/eviction counters and the current size of the settings cache"""
+    return {**_settings_cache_stats, "size": len(_settings_cache)}
+
+
+db_init()
@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict, deque
+
+# Keys tracked at once, the least recently active keys are dropped first when this is reached
+SLIDING_WINDOW_MAX_KEYS = 100000
+
+# Events kept per key, counts are capped at this value
+SLIDING_WINDOW_MAX_EVENTS = 1000
+
+
+class SlidingWindowCounter:
+    """Counts events per key in a sliding time window.
+
+    Every key has a deque of event expiry times. Expired events are popped from the front when the key is counted or
+    added to, and keys are kept in order of their last event so idle keys are dropped from the front when other keys
+    are added to. Adding and counting are amortized O(1) and don't depend on how many other keys are tracked.
+    """
+
+    def __init__(self, max_keys: int = SLIDING_WINDOW_MAX_KEYS, max_events: int = SLIDING_WINDOW_MAX_EVENTS,
+                 clock=time.monotonic) -> None:
+        """
+        Args:
+            max_keys (int, optional): Keys tracked at once. Defaults to SLIDING_WINDOW_MAX_KEYS.
+            max_events (int, optional): Events kept per key. Defaults to SLIDING_WINDOW_MAX_EVENTS.
+            clock (optional): Function returning the current time in seconds. Defaults to time.monotonic.
+        """
+        self.max_keys = max_keys
+        self.max_events = max_events
+        self.clock = clock
+        self._events: OrderedDict[object, deque] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def _expire(self, key, now: float) -> deque | None:
+        events = self._events.get(key)
+        if events is None:
+            return None
+
+        while events and events[0] <= now:
+            events.popleft()
+
+        if not events:
+            del self._events[key]
+            return None
+
+        return events
+
+    def _expire_idle_keys(self, now: float):
+        # Keys are ordered by their last event, so the front key is the one most likely to be idle
+        while self._events:
+            key, events = next(iter(self._events.items()))
+            if events[-1] > now:
+                break
+            del self._events[key]
+
+    def add(self, key, window: float):
+        """Record an event that is counted for the next window seconds
+
+        Args:
+            key: Hashable key, for example (guild_id, user_id, action)
+            window (float): Seconds the event is counted for
+        """
+        if window < 0:
+            raise ValueError('window must be greater than 0')
+
+        now = self.clock()
+        events = self._expire(key, now)
+        if events is None:
+            self._expire_idle_keys(now)
+            if len(self._events) >= self.max_keys:
+                self._events.popitem(last=False)
+
+            events = self._events[key] = deque(maxlen=self.max_events)
+        else:
+            self._events.move_to_end(key)
+
+        events.append(now + window)
+
+    def count(self, key) -> int:
+        """Get the number of events of a key that haven't expired yet"""
+        events = self._expire(key, self.clock())
+        return len(events) if events is not None else 0
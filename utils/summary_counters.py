@@ -0,0 +1,313 @@
+import heapq
+import json
+from array import array
+from operator import itemgetter
+
+# Members listed in a chat summary
+SUMMARY_TOP_MEMBERS = 5
+
+# Members kept in the daily rollup of a channel, weekly and monthly reports rank members from these
+ROLLUP_TOP_MEMBERS = 25
+
+
+def new_hour_histogram(data: bytes | None = None) -> array:
+    """Messages per hour of the day in server time, 24 unsigned integers"""
+    hours = array('I', bytes(24 * array('I').itemsize))
+    if data is not None and len(data) == len(hours) * hours.itemsize:
+        hours = array('I', data)
+    return hours
+
+
+class SummaryCounter:
+    """Messages counted in a chat summary channel since its last summary"""
+
+    def __init__(self, guild_id: int, messages: int = 0, members: dict[int, int] | None = None,
+                 hours: array | None = None) -> None:
+        self.guild_id = guild_id
+        self.messages = messages
+        self.members: dict[int, int] = members or {}
+        self.hours = hours if hours is not None else new_hour_histogram()
+
+        # Counted but not written to the database yet
+        self.pending_messages = 0
+        self.pending_members: dict[int, int] = {}
+
+    def top_members(self, count: int = SUMMARY_TOP_MEMBERS) -> list[tuple[int, int]]:
+        """Get the (member_id, messages) of the most active members, most active first"""
+        return heapq.nlargest(count, self.members.items(), key=itemgetter(1))
+
+
+def take_counter_rows(channel_id: int, counter: SummaryCounter) -> tuple[list[tuple[int, int, int, bytes]],
+                                                                        list[tuple[int, int, int, int]]]:
+    """Take the messages a counter counted since its last flush, as rows for db_write_counts"""
+    channel_rows = [(counter.guild_id, channel_id, counter.pending_messages, counter.hours.tobytes())]
+    member_rows = [(counter.guild_id, channel_id, member_id, messages)
+                   for member_id, messages in counter.pending_members.items()]
+    counter.pending_messages = 0
+    counter.pending_members = {}
+    return channel_rows, member_rows
+
+
+class SummaryCounters:
+    """Counters of every channel with chat summary enabled, written to the database in batches"""
+
+    def __init__(self) -> None:
+        # channel_id -> counter
+        self.counters: dict[int, SummaryCounter] = {}
+
+        # Channels with messages not written to the database yet
+        self.dirty_channels: set[int] = set()
+
+    def count_message(self, channel_id: int, member_id: int, hour: int):
+        """Count a message towards the chat summary of a channel, if it's enabled there
+
+        Args:
+            channel_id (int): Channel ID
+            member_id (int): Author ID
+            hour (int): Hour of the day in server time
+        """
+        counter = self.counters.get(channel_id)
+        if counter is None:
+            return
+
+        counter.messages += 1
+        counter.members[member_id] = counter.members.get(member_id, 0) + 1
+        counter.hours[hour] += 1
+        counter.pending_messages += 1
+        counter.pending_members[member_id] = counter.pending_members.get(member_id, 0) + 1
+        self.dirty_channels.add(channel_id)
+
+    def take_pending_counts(self) -> tuple[dict[int, SummaryCounter], list[tuple[int, int, int, bytes]],
+                                           list[tuple[int, int, int, int]]]:
+        """Take the messages counted since the last call, to be written with db_write_counts
+
+        Returns:
+            tuple: channel_id -> the counter the rows were taken from, (guild_id, channel_id, messages, hours) and
+            (guild_id, channel_id, member_id, messages) rows
+        """
+        taken_from = {}
+        channel_rows = []
+        member_rows = []
+        for channel_id in self.dirty_channels:
+            counter = self.counters.get(channel_id)
+            if counter is None:
+                continue
+
+            counter_channel_rows, counter_member_rows = take_counter_rows(channel_id, counter)
+            taken_from[channel_id] = counter
+            channel_rows.extend(counter_channel_rows)
+            member_rows.extend(counter_member_rows)
+
+        self.dirty_channels.clear()
+        return taken_from, channel_rows, member_rows
+
+    def restore_pending_counts(self, taken_from: dict[int, SummaryCounter],
+                               channel_rows: list[tuple[int, int, int, bytes]],
+                               member_rows: list[tuple[int, int, int, int]]):
+        """Put counts that couldn't be written back, so the next flush writes them
+
+        Counts of a counter that was replaced by a summary in the meantime are dropped, they belong to the summarized
+        day.
+
+        Args:
+            taken_from (dict): channel_id -> the counter the rows were taken from
+            channel_rows (list): Channel rows from take_pending_counts
+            member_rows (list): Member rows from take_pending_counts
+        """
+        for _, channel_id, messages, _ in channel_rows:
+            counter = self.counters.get(channel_id)
+            if counter is not None and counter is taken_from.get(channel_id):
+                counter.pending_messages += messages
+                self.dirty_channels.add(channel_id)
+
+        for _, channel_id, member_id, messages in member_rows:
+            counter = self.counters.get(channel_id)
+            if counter is not None and counter is taken_from.get(channel_id):
+                counter.pending_members[member_id] = counter.pending_members.get(member_id, 0) + messages
+
+    def start_day(self, channel_id: int) -> SummaryCounter | None:
+        """Start counting a new day in a channel
+
+        Returns:
+            SummaryCounter | None: Counts of the finished day, None if chat summary isn't enabled in the channel
+        """
+        counter = self.counters.get(channel_id)
+        if counter is None:
+            return None
+
+        self.counters[channel_id] = SummaryCounter(counter.guild_id)
+        self.dirty_channels.discard(channel_id)
+        return counter
+
+    def remove_channel(self, channel_id: int) -> tuple[list[tuple[int, int, int, bytes]],
+                                                       list[tuple[int, int, int, int]]]:
+        """Stop counting a channel
+
+        Returns:
+            tuple: Rows for db_write_counts with the counts that weren't written yet, empty if there are none
+        """
+        counter = self.counters.pop(channel_id, None)
+        self.dirty_channels.discard(channel_id)
+        if counter is None or not counter.pending_messages:
+            return [], []
+        return take_counter_rows(channel_id, counter)
+
+
+def db_create_tables(conn):
+    """Create the chat summary tables, and merge duplicate rows of older databases so counts can be upserted"""
+    cur = conn.cursor()
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS chat_summary(guild_id INTEGER, channel_id INTEGER, enabled INTEGER, messages INTEGER)')
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS chat_summary_members(guild_id INTEGER, channel_id INTEGER, member_id INTEGER, messages INTEGER)')
+
+    # Totals of every summarized day, top_members is a JSON list of [member_id, messages] pairs
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS chat_summary_days(guild_id INTEGER, channel_id INTEGER, day TEXT, messages INTEGER, '
+        'top_members TEXT, hours BLOB)')
+    cur.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS chat_summary_days_i ON chat_summary_days(guild_id, channel_id, day)')
+
+    cur.execute('DELETE FROM chat_summary WHERE rowid NOT IN (SELECT rowid FROM (SELECT rowid, MAX(enabled) FROM '
+                'chat_summary GROUP BY guild_id, channel_id))')
+    cur.execute('DELETE FROM chat_summary_members WHERE rowid NOT IN (SELECT rowid FROM (SELECT rowid, MAX(messages) '
+                'FROM chat_summary_members GROUP BY guild_id, channel_id, member_id))')
+    cur.execute('DROP INDEX IF EXISTS chat_summary_i')
+    cur.execute('DROP INDEX IF EXISTS chat_summary_members_i')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS chat_summary_channel ON chat_summary(guild_id, channel_id)')
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS chat_summary_members_member ON '
+                'chat_summary_members(guild_id, channel_id, member_id)')
+
+    cur.execute("PRAGMA table_info(chat_summary)")
+    if 'hours' not in [column[1] for column in cur.fetchall()]:
+        cur.execute('ALTER TABLE chat_summary ADD COLUMN hours BLOB')
+    cur.close()
+    conn.commit()
+
+
+def db_load_enabled_counters(conn) -> dict[int, SummaryCounter]:
+    """Load the counts since the last summary of every enabled channel
+
+    Returns:
+        dict: channel_id -> counter
+    """
+    counters = {}
+    cur = conn.cursor()
+    cur.execute('SELECT guild_id, channel_id, messages, hours FROM chat_summary WHERE enabled = 1')
+    for guild_id, channel_id, messages, hours in cur.fetchall():
+        counters[channel_id] = SummaryCounter(guild_id, messages, hours=new_hour_histogram(hours))
+    cur.execute('SELECT m.channel_id, m.member_id, m.messages FROM chat_summary_members m '
+                'JOIN chat_summary c ON c.guild_id = m.guild_id AND c.channel_id = m.channel_id WHERE c.enabled = 1')
+    for channel_id, member_id, messages in cur.fetchall():
+        counters[channel_id].members[member_id] = messages
+    cur.close()
+    return counters
+
+
+def db_write_counts(conn, channel_rows: list[tuple[int, int, int, bytes]],
+                    member_rows: list[tuple[int, int, int, int]]):
+    """Add counted messages to the chat summary tables in one batch, the hour histograms are written whole"""
+    if not channel_rows:
+        return
+
+    conn.executemany('INSERT INTO chat_summary(guild_id, channel_id, enabled, messages, hours) VALUES (?, ?, 1, ?, ?) '
+                     'ON CONFLICT (guild_id, channel_id) DO UPDATE SET messages = messages + excluded.messages, '
+                     'hours = excluded.hours',
+                     channel_rows)
+    conn.executemany('INSERT INTO chat_summary_members(guild_id, channel_id, member_id, messages) VALUES (?, ?, ?, ?) '
+                     'ON CONFLICT (guild_id, channel_id, member_id) DO UPDATE SET messages = messages + excluded.messages',
+                     member_rows)
+    conn.commit()
+
+
+def db_load_counter(conn, guild_id: int, channel_id: int) -> SummaryCounter:
+    """Load the counts of a channel since its last summary"""
+    cur = conn.cursor()
+    cur.execute('SELECT messages, hours FROM chat_summary WHERE guild_id = ? AND channel_id = ?',
+                (guild_id, channel_id))
+    data = cur.fetchone()
+    cur.execute('SELECT member_id, messages FROM chat_summary_members WHERE guild_id = ? AND channel_id = ?',
+                (guild_id, channel_id))
+    members = dict(cur.fetchall())
+    cur.close()
+    if data is None:
+        return SummaryCounter(guild_id)
+    return SummaryCounter(guild_id, data[0], members, new_hour_histogram(data[1]))
+
+
+def db_rollup_counts(conn, guild_id: int, channel_id: int, day: str, counter: SummaryCounter):
+    """Store the counts of a finished day in chat_summary_days and start counting from zero
+
+    Args:
+        conn: Database thread connection
+        guild_id (int): Guild ID
+        channel_id (int): Channel ID
+        day (str): The finished day in server time, as YYYY-MM-DD
+        counter (SummaryCounter): Counts of the day
+    """
+    members = dict(counter.top_members(ROLLUP_TOP_MEMBERS))
+    messages = counter.messages
+    hours = array('I', counter.hours)
+
+    # A day can be summarized twice if the bot restarts around midnight, the counts of both are merged
+    cur = conn.cursor()
+    cur.execute('SELECT messages, top_members, hours FROM chat_summary_days WHERE guild_id = ? AND channel_id = ? '
+                'AND day = ?', (guild_id, channel_id, day))
+    data = cur.fetchone()
+    if data is not None:
+        messages += data[0]
+        for member_id, member_messages in json.loads(data[1]):
+            members[member_id] = members.get(member_id, 0) + member_messages
+        for hour, hour_messages in enumerate(new_hour_histogram(data[2])):
+            hours[hour] += hour_messages
+
+    top_members = heapq.nlargest(ROLLUP_TOP_MEMBERS, members.items(), key=itemgetter(1))
+    cur.execute('INSERT OR REPLACE INTO chat_summary_days(guild_id, channel_id, day, messages, top_members, hours) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (guild_id, channel_id, day, messages, json.dumps(top_members),
+                                              hours.tobytes()))
+
+    cur.execute('UPDATE chat_summary SET messages = 0, hours = NULL WHERE guild_id = ? AND channel_id = ?',
+                (guild_id, channel_id))
+    cur.execute('DELETE FROM chat_summary_members WHERE guild_id = ? AND channel_id = ?', (guild_id, channel_id))
+    cur.close()
+    conn.commit()
+
+
+def db_get_report(conn, guild_id: int, channel_id: int, since: str) -> tuple[int, int, tuple[str, int] | None,
+                                                                             list[tuple[int, int]], array]:
+    """Add up the daily rollups of a channel since a day
+
+    Members are ranked from the most active members of each day, so members who were never among the top of a day
+    aren't counted.
+
+    Args:
+        conn: Database thread connection
+        guild_id (int): Guild ID
+        channel_id (int): Channel ID
+        since (str): First day to include, as YYYY-MM-DD
+
+    Returns:
+        tuple: Days with a rollup, messages, (day, messages) of the busiest day, top (member_id, messages) and the
+        hour histogram
+    """
+    cur = conn.cursor()
+    cur.execute('SELECT day, messages, top_members, hours FROM chat_summary_days WHERE guild_id = ? AND channel_id = ? '
+                'AND day >= ?', (guild_id, channel_id, since))
+    rows = cur.fetchall()
+    cur.close()
+
+    messages = 0
+    busiest_day = None
+    members: dict[int, int] = {}
+    hours = new_hour_histogram()
+    for day, day_messages, top_members, day_hours in rows:
+        messages += day_messages
+        if busiest_day is None or day_messages > busiest_day[1]:
+            busiest_day = (day, day_messages)
+        for member_id, member_messages in json.loads(top_members):
+            members[member_id] = members.get(member_id, 0) + member_messages
+        for hour, hour_messages in enumerate(new_hour_histogram(day_hours)):
+            hours[hour] += hour_messages
+
+    return len(rows), messages, busiest_day, heapq.nlargest(SUMMARY_TOP_MEMBERS, members.items(),
+                                                            key=itemgetter(1)), hours
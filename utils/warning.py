@@ -88,7 +88,7 @@ def db_add_warning(guild_id: int, user_id: int, reason: str) -> int:
                 (guild_id, user_id, reason, get_date_time_str(guild_id)))
     warning_id = cur.lastrowid
     cur.close()
-    conn.commit()
+    conn.commit_now()
     return warning_id
 
 
@@ -104,7 +104,7 @@ def db_remove_warning(guild_id: int, warning_id: int):
     cur = conn.cursor()
     cur.execute('delete from warnings where guild_id = ? and id = ?', (guild_id, warning_id))
     cur.close()
-    conn.commit()
+    conn.commit_now()
 
 
 def db_add_warning_action(guild_id: int, action: str, warnings: int):
@@ -113,7 +113,7 @@ def db_add_warning_action(guild_id: int, action: str, warnings: int):
     cur.execute('insert into warnings_actions (guild_id, action, warnings) values (?, ?, ?)',
                 (guild_id, action, warnings))
     cur.close()
-    conn.commit()
+    conn.commit_now()
 
 
 def db_get_warning_actions(guild_id: int):
@@ -128,4 +128,4 @@ def db_remove_warning_action(id: int):
     cur = conn.cursor()
     cur.execute('delete from warnings_actions where id = ?', (id,))
     cur.close()
-    conn.commit()
+    conn.commit_now()